@@ -1,10 +1,19 @@
 import matplotlib.pyplot as plt
 from matplotlib.colors import Normalize, LogNorm, SymLogNorm, BoundaryNorm
 
+import hashlib
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+
 import numpy as np
+from scipy import fft as sfft, ndimage, signal
 
 from astropy.io import fits
 from astropy.wcs import WCS
+from astropy.wcs.utils import proj_plane_pixel_scales
 from astropy.convolution import convolve, Gaussian2DKernel
 from astropy.coordinates import Angle, SkyCoord
 from astropy import units as u
@@ -12,12 +21,321 @@ from astropy.nddata import Cutout2D
 from matplotlib.ticker import MaxNLocator
 from astropy.table import Table
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))  # scripts/ImageIO.py
+from ImageIO import open_image, read_header, image_index, primary_header, write_image
+
 import scienceplots
 plt.style.use(['science','ieee'])
 
 from regions import Region, PixelRegion, SkyRegion, TextSkyRegion, TextPixelRegion
 
 
+PYRAMID_CACHE = os.environ.get('PYRAMID_CACHE')  # default directory of the on-disk pyramid levels (None: memory only)
+
+
+def block_reduce(data, n, method='mean', rows=256):
+    """
+    Downsample an image by n x n pixel blocks (partial blocks at the upper edges), a few rows of blocks at a time,
+    so that memory-mapped images are read only once.
+
+    Parameters:
+    - data (numpy.ndarray): 2D image.
+    - n (int): Block size in pixels.
+    - method (str, optional): 'sum' (flux conserving) or 'mean' (surface brightness conserving). NaNs are ignored. Default is 'mean'.
+    - rows (int, optional): Number of output rows computed at once. Default is 256.
+
+    Returns:
+    - numpy.ndarray: Downsampled image (float64) of shape (ceil(ny / n), ceil(nx / n)).
+    """
+    if method not in ('sum', 'mean'):
+        raise ValueError("method must be 'sum' or 'mean'.")
+    ny, nx = data.shape
+    my, mx = -(-ny // n), -(-nx // n)
+    out = np.empty((my, mx))
+    for j0 in range(0, my, rows):
+        j1 = min(j0 + rows, my)
+        block = np.full(((j1 - j0) * n, mx * n), np.nan)
+        part = data[j0 * n:j1 * n]
+        block[:part.shape[0], :nx] = part
+        block = block.reshape(j1 - j0, n, mx, n)
+        total = np.nansum(block, axis=(1, 3))
+        if method == 'sum':
+            out[j0:j1] = total
+        else:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                out[j0:j1] = total / np.isfinite(block).sum(axis=(1, 3))
+    return out
+
+
+def downsample_wcs(wcs, n):
+    """
+    WCS of an image downsampled by n x n pixel blocks: crpix = (crpix - 0.5) / n + 0.5 and the pixel scale times n.
+    """
+    w = wcs.deepcopy()
+    w.wcs.crpix = (w.wcs.crpix - 0.5) / n + 0.5
+    if w.wcs.has_cd():
+        w.wcs.cd = w.wcs.cd * n
+    else:
+        w.wcs.cdelt = w.wcs.cdelt * n
+    if wcs.pixel_shape is not None:
+        w.pixel_shape = tuple(-(-s // n) for s in wcs.pixel_shape)
+    return w
+
+
+def gauss_kernel1d(sigma):
+    """
+    Normalized 1D Gaussian kernel sampled at the pixel centres, of size 8 * sigma rounded up to an odd integer
+    (truncated at ~4 sigma), as the 1D factor of astropy's Gaussian2DKernel.
+    """
+    size = int(np.ceil(8 * sigma))
+    size += 1 - size % 2
+    x = np.arange(size) - size // 2
+    kernel = np.exp(-0.5 * (x / sigma) ** 2)
+    return kernel / kernel.sum()
+
+
+def _convolve_zero(data, kernel, method):
+    """
+    Convolution of a 2D array with the separable kernel outer(kernel, kernel), zeros outside the array.
+    """
+    if method == 'fft':
+        return signal.fftconvolve(data, np.outer(kernel, kernel), mode='same')
+    out = ndimage.convolve1d(data, kernel, axis=0, mode='constant', cval=0.)
+    return ndimage.convolve1d(out, kernel, axis=1, mode='constant', cval=0.)
+
+
+def gauss_smooth(data, sigma, method='auto', tile=2048, nthreads=None):
+    """
+    Gaussian smoothing with the semantics of astropy's convolve(data, Gaussian2DKernel(sigma)): zeros outside the image,
+    kernel truncated at ~4 sigma and NaNs interpolated by normalized convolution (NaN pixels are filled).
+
+    The image is processed in tiles with a halo of the kernel radius, several tiles at once in threads, so that the
+    memory used besides the output is a few tiles and memory-mapped images are read tile by tile.
+
+    Parameters:
+    - data (numpy.ndarray): 2D image.
+    - sigma (float): Standard deviation of the Gaussian kernel in pixels.
+    - method (str, optional): 'direct' (astropy convolve, cost ~ sigma^2), 'separable' (two 1D convolutions, cost ~ sigma),
+      'fft' (FFT convolution, cost independent of sigma) or 'auto' (separable for sigma < 3, else fft). Default is 'auto'.
+    - tile (int, optional): Tile size in pixels (without halo). Default is 2048.
+    - nthreads (int, optional): Number of tiles processed at once. Default is None (number of CPUs).
+
+    Returns:
+    - numpy.ndarray: The smoothed image (float64).
+    """
+    if method not in ('direct', 'separable', 'fft', 'auto'):
+        raise ValueError("method must be 'direct', 'separable', 'fft' or 'auto'.")
+    if method == 'direct':
+        return convolve(data, Gaussian2DKernel(sigma))
+    if method == 'auto':
+        method = 'separable' if sigma < 3 else 'fft'
+
+    kernel = gauss_kernel1d(sigma)
+    r = len(kernel) // 2
+    ny, nx = data.shape
+    out = np.empty((ny, nx))
+
+    def smooth_tile(y0, x0):
+        y1, x1 = min(y0 + tile, ny), min(x0 + tile, nx)
+        ya, xa = max(y0 - r, 0), max(x0 - r, 0)
+        part = np.array(data[ya:min(y1 + r, ny), xa:min(x1 + r, nx)], dtype=np.float64)
+        nan = np.isnan(part)
+        if nan.any():
+            part[nan] = 0.
+            res = _convolve_zero(part, kernel, method)
+            # normalized convolution: weights of the valid pixels (the zeros outside the image count as valid)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                res /= 1. - _convolve_zero(nan.astype(np.float64), kernel, method)
+        else:
+            res = _convolve_zero(part, kernel, method)
+        out[y0:y1, x0:x1] = res[y0 - ya:y1 - ya, x0 - xa:x1 - xa]
+
+    with ThreadPoolExecutor(max_workers=nthreads or os.cpu_count()) as pool:
+        list(pool.map(lambda yx: smooth_tile(*yx), [(y0, x0) for y0 in range(0, ny, tile) for x0 in range(0, nx, tile)]))
+    return out
+
+
+class KernelBank:
+    """
+    FFTs of the Gaussian kernels (gauss_kernel1d) of several sigmas for one FFT shape, computed once and applied to many tiles.
+
+    Parameters:
+    - sigmas (list of float): Standard deviations of the kernels in pixels.
+    - shape (tuple): Shape of the (zero padded) tiles.
+
+    Methods:
+    - convolve(ft, i): Convolution of the tile with FFT ft by kernel i (circular, i.e., the tile must have a zero margin of the kernel radius).
+    """
+    def __init__(self, sigmas, shape):
+        self.sigmas = sorted(sigmas)
+        self.shape = tuple(shape)
+        self.kernels = []
+        for sigma in self.sigmas:
+            k1 = gauss_kernel1d(sigma)
+            r = len(k1) // 2
+            kernel = np.zeros(self.shape)
+            kernel[:2 * r + 1, :2 * r + 1] = np.outer(k1, k1)
+            self.kernels.append(sfft.rfft2(np.roll(kernel, (-r, -r), axis=(0, 1))))
+
+    @staticmethod
+    def radius(sigmas):
+        return max(len(gauss_kernel1d(sigma)) // 2 for sigma in sigmas)
+
+    def convolve(self, ft, i):
+        return sfft.irfft2(ft * self.kernels[i], s=self.shape)
+
+
+def exposure_smooth(rate, exposure, sigmas, snr=None, tile=1024, nthreads=None):
+    """
+    Exposure-weighted Gaussian smoothing of a count rate, G * (rate x exposure) / G * exposure, with a bank of FFT kernels applied tile by tile
+    (halo of the largest kernel radius, zeros outside the image, several tiles at once in threads).
+    Without snr the (single) sigma of the bank is used; with snr each pixel uses the smallest sigma at which the smoothed
+    counts within the kernel (4 pi sigma^2 effective pixels) reach the signal-to-noise snr (Poisson), or the largest sigma.
+
+    Parameters:
+    - rate (numpy.ndarray): Count-rate (or background-subtracted count-rate) image; NaN pixels get no weight.
+    - exposure (numpy.ndarray): Exposure map of the same shape.
+    - sigmas (list of float): Kernel standard deviations in pixels.
+    - snr (float, optional): Signal-to-noise of the adaptive mode. Default is None (fixed sigma).
+    - tile (int, optional): Tile size in pixels (without halo). Default is 1024.
+    - nthreads (int, optional): Number of tiles processed at once. Default is None (number of CPUs).
+
+    Returns:
+    - rate (numpy.ndarray): Smoothed count rate (NaN where the smoothed exposure is 0).
+    - scale (numpy.ndarray): Sigma used at each pixel.
+    """
+    if rate.shape != exposure.shape:
+        raise ValueError("rate and exposure must have the same shape.")
+    sigmas = sorted(sigmas)
+    if snr is None and len(sigmas) != 1:
+        raise ValueError("Give one sigma, or snr for the adaptive mode.")
+    ny, nx = rate.shape
+    r = KernelBank.radius(sigmas)
+    tile = min(tile, max(ny, nx))
+    shape = (sfft.next_fast_len(min(tile, ny) + 2 * r, real=True), sfft.next_fast_len(min(tile, nx) + 2 * r, real=True))
+    bank = KernelBank(sigmas, shape)
+    tiny = 1e-9 * np.nanmax(exposure)
+    out = np.full((ny, nx), np.nan)
+    scale = np.full((ny, nx), np.nan)
+
+    def smooth_tile(y0, x0):
+        y1, x1 = min(y0 + tile, ny), min(x0 + tile, nx)
+        ya, xa = max(y0 - r, 0), max(x0 - r, 0)
+        c = np.zeros(shape)
+        e = np.zeros(shape)
+        part_c = np.array(rate[ya:min(y1 + r, ny), xa:min(x1 + r, nx)], dtype=np.float64)
+        part_e = np.array(exposure[ya:min(y1 + r, ny), xa:min(x1 + r, nx)], dtype=np.float64)
+        bad = ~(np.isfinite(part_c) & np.isfinite(part_e))
+        part_c[bad] = 0.
+        part_e[bad] = 0.
+        # tile at offset r in the FFT array: zeros around it stand for the outside of the image
+        oy, ox = r - (y0 - ya), r - (x0 - xa)
+        c[oy:oy + part_c.shape[0], ox:ox + part_c.shape[1]] = part_c * part_e
+        e[oy:oy + part_e.shape[0], ox:ox + part_e.shape[1]] = part_e
+        fc, fe = sfft.rfft2(c), sfft.rfft2(e)
+        todo = np.ones((y1 - y0, x1 - x0), dtype=bool)
+        for i, sigma in enumerate(bank.sigmas):
+            sc = bank.convolve(fc, i)[r:r + y1 - y0, r:r + x1 - x0]
+            se = bank.convolve(fe, i)[r:r + y1 - y0, r:r + x1 - x0]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                res = np.where(se > tiny, sc / se, np.nan)
+            sel = todo if snr is None or i == len(bank.sigmas) - 1 else todo & (sc * 4 * np.pi * sigma ** 2 >= snr ** 2)
+            out[y0:y1, x0:x1][sel] = res[sel]
+            scale[y0:y1, x0:x1][sel] = sigma
+            todo &= ~sel
+            if not todo.any():
+                break
+
+    with ThreadPoolExecutor(max_workers=nthreads or os.cpu_count()) as pool:
+        list(pool.map(lambda yx: smooth_tile(*yx), [(y0, x0) for y0 in range(0, ny, tile) for x0 in range(0, nx, tile)]))
+    return out, scale
+
+
+class Stamp:
+    """
+    Lightweight cutout of a PrimCompanion (see PrimCompanion.cutouts): a view of the parent's image, without copy
+    (memory-mapped if the parent is), and its slices; the WCS is the parent's, sliced on first access.
+
+    Attributes:
+    - parent (PrimCompanion): Image the stamp was cut from.
+    - slices (tuple of slice): (y, x) slices of the stamp in the parent image.
+    - label (str): Label of the stamp.
+    - data (numpy.ndarray): View of the parent image.
+    - wcs (astropy.wcs.WCS): WCS of the stamp.
+
+    Methods:
+    - to_companion(): PrimCompanion with a copy of the data.
+    - writeto(file_path, overwrite=True, compression=None): Write the stamp to a FITS file (see ImageIO.write_image).
+    """
+    __slots__ = ('parent', 'slices', 'label', '_wcs')
+
+    def __init__(self, parent, slices, label=None):
+        self.parent = parent
+        self.slices = slices
+        self.label = label
+        self._wcs = None
+
+    @property
+    def data(self):
+        return self.parent._image()[self.slices]
+
+    @property
+    def wcs(self):
+        if self._wcs is None:
+            self._wcs = self.parent.wcs.slice(self.slices)
+        return self._wcs
+
+    @property
+    def shape(self):
+        return tuple(s.stop - s.start for s in self.slices)
+
+    def to_companion(self):
+        return PrimCompanion(data=np.array(self.data), header=self.wcs.to_header(), regions=self.parent.regions)
+
+    def writeto(self, file_path, overwrite=True, compression=None):
+        write_image(file_path, np.asarray(self.data), self.wcs.to_header(), compression=compression, overwrite=overwrite)
+
+    def __repr__(self):
+        return "Stamp({0}: y {1.start}:{1.stop}, x {2.start}:{2.stop})".format(self.label, *self.slices)
+
+
+def _write_stamp(job):
+    file_path, index, data, header, slices, out, compression = job
+    if data is None:
+        data = open_image(file_path, index)[slices]  # of a tile-compressed image, only the tiles of the stamp are decompressed
+    write_image(out, np.asarray(data), WCS(header, relax=True).slice(slices).to_header(), compression=compression)
+    return out
+
+
+def write_stamps(stamps, file_paths, nproc=1, compression=None):
+    """
+    Write stamps to FITS files, in nproc processes. Stamps of images loaded from a file are re-read from the file
+    by the workers, so that only the slices (not the data) are sent to them.
+
+    Parameters:
+    - stamps (list of Stamp): Stamps (from PrimCompanion.cutouts).
+    - file_paths (list of str or str): Output files, or a pattern formatted with the label and index of each stamp
+      (e.g., 'stamp_{label}.fits').
+    - nproc (int, optional): Number of processes. Default is 1.
+    - compression (str, optional): Tile compression of the files (see ImageIO.compression_kwargs). Default is None ($PIPELINE_COMPRESSION or none).
+
+    Returns:
+    - list of str: The written files.
+    """
+    if isinstance(file_paths, str):
+        file_paths = [file_paths.format(label=s.label, index=i) for i, s in enumerate(stamps)]
+    if len(file_paths) != len(stamps):
+        raise ValueError("One output file per stamp is needed.")
+    jobs = []
+    for s, out in zip(stamps, file_paths):
+        from_file = s.parent._file_path is not None and s.parent.data is s.parent._file_data
+        jobs.append((s.parent._file_path, s.parent._index, None if from_file else s.data, s.parent.header, s.slices, out, compression))
+    if nproc <= 1:
+        return [_write_stamp(job) for job in jobs]
+    with Pool(nproc) as pool:
+        return pool.map(_write_stamp, jobs)
+
+
 def plot_side_by_side(pc1, pc2, norm='lin', vmin=0, vmax=1, dpi=480, compress=False, grid=True, axis_label=True, cbar=True, savefig=False, axislabel_size=10, tick_label_size=9, cbar_labelsize=9, axis_ticks=True, figsize=(5, 3)):
     """
     Plot two PrimCompanion objects side by side with a shared y-axis and a common x-axis label.
@@ -28,7 +346,7 @@ def plot_side_by_side(pc1, pc2, norm='lin', vmin=0, vmax=1, dpi=480, compress=Fa
     - vmin (float): Minimum value for the color scale.
     - vmax (float): Maximum value for the color scale.
     - dpi (int, optional): Dots per inch of the figure. Default is 480.
-    - compress (bool, optional): If True, compress the image by plotting only every n-th pixel. Default is False.
+    - compress (bool or int, optional): If True, plot the level of the image pyramid (block means, see pyramid()) matching the pixel budget of the figure; an int n plots level n. Default is False.
     - grid (bool, optional): If True, display a grid on the plot. Default is True.
     - axis_label (bool, optional): If True, display axis labels. Default is True.
     - cbar (bool, optional): If True, display color bar. Default is True.
@@ -43,17 +361,8 @@ def plot_side_by_side(pc1, pc2, norm='lin', vmin=0, vmax=1, dpi=480, compress=Fa
     - fig (matplotlib.figure.Figure): The generated figure.
     - axes (list of matplotlib.axes.Axes): The axes objects.
     """
-    if compress:
-        n = 10
-        data1 = pc1.data[::n, ::n]
-        wcs1 = pc1.wcs[::n, ::n]
-        data2 = pc2.data[::n, ::n]
-        wcs2 = pc2.wcs[::n, ::n]
-    else:
-        data1 = pc1.data
-        wcs1 = pc1.wcs
-        data2 = pc2.data
-        wcs2 = pc2.wcs
+    data1, wcs1 = pc1._plot_level(compress, dpi, (figsize[0] / 2, figsize[1]))
+    data2, wcs2 = pc2._plot_level(compress, dpi, (figsize[0] / 2, figsize[1]))
 
     if norm in ['linear', 'lin']:
         norm = Normalize(vmin=vmin, vmax=vmax, clip=True)
@@ -116,7 +425,7 @@ def plot_side_by_side_with_individual_cbars(pc1, pc2, norm='lin', vmin1=0, vmax1
     - vmin1, vmax1 (float): Minimum and maximum value for the color scale of the first plot.
     - vmin2, vmax2 (float): Minimum and maximum value for the color scale of the second plot.
     - dpi (int, optional): Dots per inch of the figure. Default is 480.
-    - compress (bool, optional): If True, compress the image by plotting only every n-th pixel. Default is False.
+    - compress (bool or int, optional): If True, plot the level of the image pyramid (block means, see pyramid()) matching the pixel budget of the figure; an int n plots level n. Default is False.
     - grid (bool, optional): If True, display a grid on the plot. Default is True.
     - axis_label (bool, optional): If True, display axis labels. Default is True.
     - cbar (bool, optional): If True, display color bar. Default is True.
@@ -131,17 +440,8 @@ def plot_side_by_side_with_individual_cbars(pc1, pc2, norm='lin', vmin1=0, vmax1
     - fig (matplotlib.figure.Figure): The generated figure.
     - axes (list of matplotlib.axes.Axes): The axes objects.
     """
-    if compress:
-        n = 10
-        data1 = pc1.data[::n, ::n]
-        wcs1 = pc1.wcs[::n, ::n]
-        data2 = pc2.data[::n, ::n]
-        wcs2 = pc2.wcs[::n, ::n]
-    else:
-        data1 = pc1.data
-        wcs1 = pc1.wcs
-        data2 = pc2.data
-        wcs2 = pc2.wcs
+    data1, wcs1 = pc1._plot_level(compress, dpi, (figsize[0] / 2, figsize[1]))
+    data2, wcs2 = pc2._plot_level(compress, dpi, (figsize[0] / 2, figsize[1]))
 
     if norm in ['linear', 'lin']:
         norm1 = Normalize(vmin=vmin1, vmax=vmax1, clip=True)
@@ -223,27 +523,67 @@ class BinCompanion(fits.BinTableHDU):
         super().__init__(data=data, header=header)
         self.data = self.data
         self.header = self.header
-        self.table_data = Table(self.data)
+        self._table = None
+        self._file_path = None
+        self._index = None
+
+    @property
+    def table_data(self):
+        """
+        astropy Table of the data, built on first access.
+        """
+        if self._table is None and self.data is not None:
+            self._table = Table(self.data)
+        return self._table
 
+    @table_data.setter
+    def table_data(self, table):
+        self._table = table
 
-    def from_fits(self, file_path, index=1):
+    def from_fits(self, file_path, index=1, memmap=False, header_only=False):
         """
         Initialize the BinCompanion object from a FITS file.
 
         Parameters:
         - file_path (str): Path to the FITS file.
+        - index (int or str, optional): Index or name of the table extension. Default is 1.
+        - memmap (bool, optional): If True, the data are memory-mapped and rows are read from the file when accessed. Default is False.
+        - header_only (bool, optional): If True, only the header is read (use rows() to read rows). Default is False.
         """
         if not isinstance(file_path, str):
             raise TypeError("file_path must be a string.")
-        
-        with fits.open(file_path) as hdul:
-            hdul.verify('fix')
-            self.data = hdul[index].data
-            self.table_data = Table(self.data)
+
+        self._file_path = file_path
+        self._index = index
+        self._table = None
+        with fits.open(file_path, memmap=memmap or header_only, lazy_load_hdus=True) as hdul:
+            hdul[index].verify('fix')
+            self.data = None if header_only else hdul[index].data
             self.header = hdul[index].header
 
         return self
 
+    def rows(self, start=0, stop=None, columns=None):
+        """
+        Read a range of rows (and optionally only some columns) as an astropy Table.
+        If the object was loaded from a file, only these rows are read from it.
+
+        Parameters:
+        - start (int, optional): First row. Default is 0.
+        - stop (int, optional): Row after the last one. Default is None (last row).
+        - columns (list of str, optional): Columns to read. Default is None (all columns).
+
+        Returns:
+        - Table: The rows.
+        """
+        if self._file_path is None:
+            data = self.data[start:stop]
+        else:
+            with fits.open(self._file_path, memmap=True, lazy_load_hdus=True) as hdul:
+                data = hdul[self._index].data[start:stop].copy()
+        table = Table(data)
+        return table[columns] if columns is not None else table
+
     def hist(self, data_column, bins='auto', fill=True, dpi=300, **kwargs):
         counts, bins = np.histogram(data_column, bins=bins, **kwargs)
 
@@ -269,8 +609,14 @@ class PrimCompanion(fits.PrimaryHDU):
     - wcs (astropy.wcs.WCS): World Coordinate System object.
 
     Methods:
-    - fgauss(sigma, inplace=False): Apply a Gaussian filter to the data.
+    - fgauss(sigma, inplace=False, method='auto'): Apply a Gaussian filter to the data.
+    - from_fits(file_path, index=None, memmap=False, header_only=False): Load data and header from a FITS file (also tile-compressed).
+    - write(file_path, compression=None, dtype=None): Write the image, tile-compressed or not, in a given data type.
+    - section(y, x): Read a part of the image (only that part is read from the file).
+    - pyramid(n, method='mean', cache_dir=None): Image downsampled by n x n pixel blocks (cached).
+    - smooth_rate(exposure, sigma=None, snr=None): Exposure-weighted (adaptive) smoothing of a count-rate map.
     - cutout(position, size, inplace=False): Create a cutout of the data.
+    - cutouts(positions, sizes, labels=None): Many cutouts at once, as views sharing the WCS (Stamp).
     - plot(norm='lin', vmin=0, vmax=1, dpi=800, compress=False, grid=True, label=True, cbar=True): Create a plot of the data.
 
     """
@@ -287,6 +633,10 @@ class PrimCompanion(fits.PrimaryHDU):
         self.header = self.header
         self._wcs = WCS(self.header, relax=True)
         self._regions = kwargs.get('regions', {})
+        self._file_path = None
+        self._index = 0
+        self._file_data = None
+        self._pyramid = {}
 
         if not isinstance(self._regions, dict):
             raise TypeError("regions must be a dictionary with labels as keys and regions as values.")
@@ -317,12 +667,16 @@ class PrimCompanion(fits.PrimaryHDU):
         """
         self._wcs = WCS(self.header, relax=True)
 
-    def from_fits(self, file_path):
+    def from_fits(self, file_path, index=None, memmap=False, header_only=False):
         """
         Load data and header from a FITS file.
 
         Parameters:
         - file_path (str): The path to the FITS file.
+        - index (int or str, optional): Index or name of the image HDU. Default is None (the primary HDU, or the
+          tile-compressed image following an empty primary HDU; for those, section() only decompresses the tiles it needs).
+        - memmap (bool, optional): If True, the data are memory-mapped, i.e., only the parts of the image that are used are read. Default is False.
+        - header_only (bool, optional): If True, only the header (and WCS) is read; use section() to read parts of the image. Default is False.
 
         Returns:
         None
@@ -334,21 +688,125 @@ class PrimCompanion(fits.PrimaryHDU):
         if not isinstance(file_path, str):
             raise TypeError("file_path must be a string.")
         
-        with fits.open(file_path) as hdul:
-            hdul.verify('fix')
-            self.data = hdul[0].data
-            self.header = hdul[0].header
+        self._file_path = file_path
+        with fits.open(file_path, memmap=memmap or header_only, lazy_load_hdus=True) as hdul:
+            index = self._index = image_index(hdul, index)
+            hdul[index].verify('fix')
+            header = hdul[index].header
+            if isinstance(hdul[index], fits.CompImageHDU):
+                header = primary_header(header)
+            self.data = None if header_only else hdul[index].data
+            self.header = header.copy() if header_only else header
+            if header_only:
+                # the header setter resets NAXIS to the (missing) data: keep the image axes of the file
+                self._header = header
+            self._file_data = self.data
             self._update_wcs()
 
         return self
 
-    def fgauss(self, sigma, inplace=False):
+    def write(self, file_path, compression=None, dtype=None, overwrite=True):
+        """
+        Write the image to a FITS file, tile-compressed or not (see ImageIO.write_image).
+
+        Parameters:
+        - file_path (str): The path to the FITS file.
+        - compression (str, optional): 'none', 'auto' (RICE for integer, lossless GZIP for float images), 'rice', 'gzip'
+          or 'gzip:<level>' (quantized floats). Default is None ($PIPELINE_COMPRESSION or none).
+        - dtype (numpy.dtype, optional): Data type written, e.g., numpy.float32 for a float64 map. Default is None (that of the data).
+        - overwrite (bool, optional): Overwrite an existing file. Default is True.
+        """
+        write_image(file_path, self._image(), self.header, compression=compression, dtype=dtype, overwrite=overwrite)
+
+    def section(self, y, x):
         """
-        Apply a Gaussian filter to the data.
+        Read a part of the image. If the object was loaded from a file (also with header_only=True),
+        only the requested rows/tiles are read from it.
+
+        Parameters:
+        - y, x (slice): Pixel slices along y (rows) and x (columns), e.g., section(slice(1000, 2000), slice(500, 1500)).
+
+        Returns:
+        - numpy.ndarray: The part of the image (use wcs[y, x] for its WCS).
+        """
+        if self._file_path is None or self.data is not None:
+            return self.data[y, x]
+        with fits.open(self._file_path, memmap=True, lazy_load_hdus=True) as hdul:
+            return np.array(hdul[self._index].section[y, x])
+
+    def _image(self):
+        """
+        The image, memory-mapped from the file if only the header was loaded.
+        """
+        if self.data is None and self._file_path is not None:
+            return fits.getdata(self._file_path, self._index, memmap=True)
+        return self.data
+
+    def pyramid(self, n, method='mean', cache_dir=None):
+        """
+        Level n of the image pyramid: the image downsampled by n x n pixel blocks (block_reduce) with its WCS.
+        Levels are cached on the object and, if cache_dir is set and the (unmodified) image was loaded from a file,
+        on disk as FITS files keyed by the file, its modification time, n and method.
+
+        Parameters:
+        - n (int): Block size in pixels (n <= 1 returns self).
+        - method (str, optional): 'sum' (flux conserving) or 'mean' (surface brightness conserving). Default is 'mean'.
+        - cache_dir (str, optional): Directory of the on-disk cache. Default is None ($PYRAMID_CACHE if set).
+
+        Returns:
+        - PrimCompanion: The downsampled image.
+        """
+        n = int(n)
+        if n <= 1:
+            return self
+        entry = self._pyramid.get((n, method))
+        if entry is not None and entry[0] is self.data:
+            return entry[1]
+
+        cache_dir = cache_dir or PYRAMID_CACHE
+        cache_file = None
+        if cache_dir and self._file_path is not None and self.data is self._file_data:
+            stat = os.stat(self._file_path)
+            key = '{0}|{1}|{2}|{3}|{4}|{5}'.format(os.path.abspath(self._file_path), stat.st_size, stat.st_mtime_ns, self._index, n, method)
+            cache_file = os.path.join(cache_dir, 'pyramid_{0}.fits'.format(hashlib.sha1(key.encode()).hexdigest()))
+
+        if cache_file is not None and os.path.exists(cache_file):
+            level = PrimCompanion().from_fits(cache_file)
+        else:
+            level = PrimCompanion(data=block_reduce(self._image(), n, method), header=downsample_wcs(self._wcs, n).to_header())
+            if cache_file is not None:
+                os.makedirs(cache_dir, exist_ok=True)
+                level.writeto(cache_file + '.tmp.fits', overwrite=True)
+                os.replace(cache_file + '.tmp.fits', cache_file)
+        level._regions = self._regions
+        self._pyramid[(n, method)] = (self.data, level)
+        return level
+
+    def _plot_level(self, compress, dpi, figsize=None):
+        """
+        Image and WCS to plot: the full image (compress=False), pyramid level n (compress=n), or the pyramid level
+        matching the pixel budget figsize x dpi of the figure (compress=True).
+        """
+        if compress is True:
+            figsize = figsize or plt.rcParams['figure.figsize']
+            ny, nx = self._image().shape
+            n = max(1, int(np.ceil(max(nx / (figsize[0] * dpi), ny / (figsize[1] * dpi)))))
+        else:
+            n = int(compress) if compress else 1
+        level = self.pyramid(n)
+        return level._image(), level.wcs
+
+    def fgauss(self, sigma, inplace=False, method='auto', tile=2048, nthreads=None):
+        """
+        Apply a Gaussian filter to the data (gauss_smooth: same result as astropy's convolve with a Gaussian2DKernel,
+        NaNs interpolated).
 
         Parameters:
         - sigma (float): Standard deviation of the Gaussian kernel.
         - inplace (bool, optional): If True, apply the filter in place. Default is False.
+        - method (str, optional): 'direct', 'separable', 'fft' or 'auto' (see gauss_smooth). Default is 'auto'.
+        - tile (int, optional): Tile size in pixels. Default is 2048.
+        - nthreads (int, optional): Number of tiles smoothed at once. Default is None (number of CPUs).
 
         Returns:
         - PrimCompanion: A new PrimCompanion object with the filtered data if inplace is False, self otherwise.
@@ -358,14 +816,54 @@ class PrimCompanion(fits.PrimaryHDU):
         if not isinstance(inplace, bool):
             raise TypeError("inplace must be a boolean.")
 
-        gaussian_kernel = Gaussian2DKernel(sigma)
-        convolved_data = convolve(self.data, gaussian_kernel)
+        convolved_data = gauss_smooth(self._image(), sigma, method=method, tile=tile, nthreads=nthreads)
         if inplace:
             self.data = convolved_data
             return self
         else:
             return PrimCompanion(data=convolved_data, header=self.header, regions=self._regions)
-        
+
+    def smooth_rate(self, exposure, sigma=None, snr=None, sigmas=(1, 1.5, 2, 3, 4, 6, 8, 12, 16, 24, 32), counts=False, tile=1024, nthreads=None, inplace=False):
+        """
+        Exposure-weighted smoothing of a count-rate map (e.g., CLCRBGSUB*_corr.fits): counts (rate x exposure) and exposure
+        are smoothed with the same Gaussian and divided (exposure_smooth), with a fixed sigma or adaptively (snr).
+
+        Parameters:
+        - exposure (PrimCompanion, numpy.ndarray or str): Exposure map (or its FITS file) on the same pixel grid.
+        - sigma (float, optional): Fixed kernel standard deviation in pixels. Default is None.
+        - snr (float, optional): Adaptive mode: smallest sigma of sigmas reaching this signal-to-noise. Default is None.
+        - sigmas (tuple, optional): Kernel bank of the adaptive mode in pixels. Default is (1, 1.5, ..., 24, 32).
+        - counts (bool, optional): If True, the data are counts instead of count rates. Default is False.
+        - tile (int, optional): Tile size in pixels. Default is 1024.
+        - nthreads (int, optional): Number of tiles smoothed at once. Default is None (number of CPUs).
+        - inplace (bool, optional): If True, replace the data by the smoothed rate. Default is False.
+
+        Returns:
+        - PrimCompanion: The smoothed count rate, with the sigma used per pixel in its scales attribute.
+        """
+        if (sigma is None) == (snr is None):
+            raise ValueError("Give either sigma or snr.")
+        if isinstance(exposure, str):
+            exposure = open_image(exposure)[:]
+        elif isinstance(exposure, PrimCompanion):
+            exposure = exposure._image()
+        data = self._image()
+        if exposure.shape != data.shape:
+            raise ValueError("exposure must have the same shape as the data.")
+
+        if counts:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                data = np.where(exposure > 0, data / exposure, np.nan)
+        rate, scales = exposure_smooth(data, exposure, [sigma] if snr is None else sigmas, snr=snr, tile=tile, nthreads=nthreads)
+        if inplace:
+            self.data = rate
+            self.scales = scales
+            return self
+        else:
+            smoothed = PrimCompanion(data=rate, header=self.header, regions=self._regions)
+            smoothed.scales = scales
+            return smoothed
+
     def cutout(self, position, size, inplace=False):
         """
         Create a cutout of the data.
@@ -390,6 +888,44 @@ class PrimCompanion(fits.PrimaryHDU):
         else:
             return PrimCompanion(data=cut_array.data, header=cut_header, regions=self._regions)
 
+    def cutouts(self, positions, sizes, labels=None):
+        """
+        Cutouts at many positions at once: the positions are converted to pixels with one WCS call and each stamp is a
+        view of the image sharing the WCS of this object (Stamp), e.g., to write them with write_stamps.
+        Stamps cover the same pixels as Cutout2D (first pixel ceil(x - nx/2)) and are clipped at the image edges.
+
+        Parameters:
+        - positions (SkyCoord or array): Sky positions, or (N, 2) array of (x, y) pixel positions (0-based).
+        - sizes (int, Quantity, tuple or array): Size(s) of the stamps, in pixels or as angles; one value, a (ny, nx)
+          tuple (one shape for all stamps, as for Cutout2D), a list or array of one value per stamp, or (N, 2) array
+          of (ny, nx).
+        - labels (list of str, optional): Labels of the stamps. Default is None (index of the stamp).
+
+        Returns:
+        - list of Stamp: The stamps.
+        """
+        if isinstance(positions, SkyCoord):
+            x, y = self._wcs.celestial.world_to_pixel(positions.reshape(-1) if not positions.isscalar else positions.reshape((1,)))
+        else:
+            x, y = np.asarray(positions, dtype=float).reshape(-1, 2).T
+        if isinstance(sizes, tuple) and len(sizes) == 2:
+            sizes = (u.Quantity(sizes) if isinstance(sizes[0], u.Quantity) else np.asarray(sizes)).reshape(1, 2)
+        if isinstance(sizes, u.Quantity):
+            scale = proj_plane_pixel_scales(self._wcs.celestial).mean() * u.deg
+            sizes = np.ceil((sizes / scale).decompose().value)
+        sizes = np.broadcast_to(np.asarray(sizes, dtype=int).reshape((-1, 2) if np.ndim(sizes) == 2 else (-1, 1)), (len(x), 2))
+        if labels is None:
+            labels = [str(i) for i in range(len(x))]
+
+        ny, nx = self._image().shape
+        x0 = np.ceil(np.asarray(x) - sizes[:, 1] / 2).astype(int)
+        y0 = np.ceil(np.asarray(y) - sizes[:, 0] / 2).astype(int)
+        x1, y1 = np.clip(x0 + sizes[:, 1], 0, nx), np.clip(y0 + sizes[:, 0], 0, ny)
+        x0, y0 = np.clip(x0, 0, nx), np.clip(y0, 0, ny)
+        outside = np.flatnonzero((x1 <= x0) | (y1 <= y0))
+        if len(outside):
+            raise ValueError("Cutouts {0} do not overlap with the image.".format(', '.join(labels[i] for i in outside)))
+        return [Stamp(self, (slice(int(b), int(t)), slice(int(l), int(r))), label) for b, t, l, r, label in zip(y0, y1, x0, x1, labels)]
 
     def add_region(self, region, label):
         """
@@ -494,7 +1030,7 @@ class PrimCompanion(fits.PrimaryHDU):
         - vmin (float): Minimum value for the color scale.
         - vmax (float): Maximum value for the color scale.
         - dpi (int, optional): Dots per inch of the figure. Default is 300.
-        - compress (bool, optional): If True, compress the image by plotting only every n-th pixel. Default is False.
+        - compress (bool or int, optional): If True, plot the level of the image pyramid (block means, see pyramid()) matching the pixel budget of the figure; an int n plots level n. Default is False.
         - grid (bool, optional): If True, display a grid on the plot. Default is True.
         - label (bool, optional): If True, display axis labels. Default is True.
         - cbar (bool, optional): If True, display color bar. Default is True.
@@ -503,13 +1039,7 @@ class PrimCompanion(fits.PrimaryHDU):
         - fig (matplotlib.figure.Figure): The generated figure.
         - ax (matplotlib.axes.Axes): The axes object.
         """
-        if compress:
-            n = 10
-            image_data = self.data[::n, ::n]
-            wcs = self._wcs[::n, ::n]
-        else:
-            image_data = self.data
-            wcs = self._wcs
+        image_data, wcs = self._plot_level(compress, dpi, figsize)
 
         if norm in ['linear', 'lin']:
             norm = Normalize(vmin=vmin, vmax=vmax, clip=True)
@@ -567,7 +1097,7 @@ class PrimCompanion(fits.PrimaryHDU):
                 if isinstance(region, PixelRegion):
                     pixel_region = region
                 elif isinstance(region, SkyRegion):
-                    pixel_region = region.to_pixel(self._wcs)
+                    pixel_region = region.to_pixel(wcs)
 
                 if hasattr(pixel_region, 'text'):
                     pixel_region.plot(ax=ax, color='white')
@@ -591,7 +1121,7 @@ class PrimCompanion(fits.PrimaryHDU):
         - vmin (float, optional): Minimum value for the color scale.
         - vmax (float, optional): Maximum value for the color scale.
         - dpi (int, optional): Dots per inch of the figure. Default is 480.
-        - compress (bool, optional): If True, compress the image by plotting only every n-th pixel. Default is False.
+        - compress (bool or int, optional): If True, plot the level of the image pyramid (block means, see pyramid()) matching the pixel budget of the figure; an int n plots level n. Default is False.
         - grid (bool, optional): If True, display a grid on the plot. Default is True.
         - axis_label (bool, optional): If True, display axis labels. Default is True.
         - cbar (bool, optional): If True, display color bar. Default is True.
@@ -607,13 +1137,7 @@ class PrimCompanion(fits.PrimaryHDU):
         - fig (matplotlib.figure.Figure): The generated figure.
         - ax (matplotlib.axes.Axes): The axes object.
         """
-        if compress:
-            n = 10
-            image_data = self.data[::n, ::n]
-            wcs = self._wcs[::n, ::n]
-        else:
-            image_data = self.data
-            wcs = self._wcs
+        image_data, wcs = self._plot_level(compress, dpi, figsize)
 
         # Determine vmin and vmax if not provided
         if vmin is None:
@@ -695,7 +1219,7 @@ class PrimCompanion(fits.PrimaryHDU):
                 if isinstance(region, PixelRegion):
                     pixel_region = region
                 elif isinstance(region, SkyRegion):
-                    pixel_region = region.to_pixel(self._wcs)
+                    pixel_region = region.to_pixel(wcs)
 
                 if hasattr(pixel_region, 'text'):
                     pixel_region.plot(ax=ax, color='white')
@@ -719,7 +1243,7 @@ class PrimCompanion(fits.PrimaryHDU):
         - vmin (float, optional): Minimum value for the color scale.
         - vmax (float, optional): Maximum value for the color scale.
         - dpi (int, optional): Dots per inch of the figure. Default is 480.
-        - compress (bool, optional): If True, compress the image by plotting only every n-th pixel. Default is False.
+        - compress (bool or int, optional): If True, plot the level of the image pyramid (block means, see pyramid()) matching the pixel budget of the figure; an int n plots level n. Default is False.
         - grid (bool, optional): If True, display a grid on the plot. Default is True.
         - axis_label (bool, optional): If True, display axis labels. Default is True.
         - cbar (bool, optional): If True, display color bar. Default is True.
@@ -735,13 +1259,7 @@ class PrimCompanion(fits.PrimaryHDU):
         - fig (matplotlib.figure.Figure): The generated figure.
         - ax (matplotlib.axes.Axes): The axes object.
         """
-        if compress:
-            n = 10
-            image_data = self.data[::n, ::n]
-            wcs = self._wcs[::n, ::n]
-        else:
-            image_data = self.data
-            wcs = self._wcs
+        image_data, wcs = self._plot_level(compress, dpi, figsize)
 
         # Convert to galactic coordinates
         wcs_galactic = wcs.deepcopy()
@@ -827,7 +1345,7 @@ class PrimCompanion(fits.PrimaryHDU):
                 if isinstance(region, PixelRegion):
                     pixel_region = region
                 elif isinstance(region, SkyRegion):
-                    pixel_region = region.to_pixel(self._wcs)
+                    pixel_region = region.to_pixel(wcs)
 
                 if hasattr(pixel_region, 'text'):
                     pixel_region.plot(ax=ax, color='white')
@@ -838,3 +1356,164 @@ class PrimCompanion(fits.PrimaryHDU):
             fig.savefig(savefig, dpi=dpi, figsize=figsize)
 
         return fig, ax
+
+
+class PrimStack:
+    """
+    Stack of the per-TM and per-band images of a cluster on one pixel grid, e.g.,
+    ${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lo}-${hi}keV${suff}.fits, seen as a lazily loaded
+    (TM, band, y, x) cube: the files are memory-mapped (tile-compressed files are decompressed tile by tile), only the
+    rows used are read, and reductions over TMs and bands are computed in one pass over the rows.
+
+    Parameters:
+    - files (dict): {(tm, band): file path}, band being the label in the file name (e.g., '0.2-2.3keV_uni'),
+      e.g., from PrimStack.discover. Files whose band label is not <lo>-<hi>keV[...] are skipped.
+
+    Attributes:
+    - tms (list of int): TMs of the stack.
+    - bands (list of str): Bands of the stack.
+    - shape (tuple): (number of TMs, number of bands, ny, nx).
+    - header (astropy.io.fits.Header): Header of the first file.
+    - wcs (astropy.wcs.WCS): Shared WCS.
+
+    Methods:
+    - discover(directory, procver, obs, cluster, product='CLevlist', tms=TMS, bands=None): Stack of the files of a product.
+    - companion(tm, band): PrimCompanion of one file (memory-mapped).
+    - weighted_sum(weights, rows=1024): Sum of the images weighted by a (TM, band) array.
+    - sum(tms=None, bands=None, rows=1024): Sum over TMs and bands.
+    - ratio(num, den, rows=1024): Ratio of two weighted sums (e.g., hardness ratio maps), in one pass.
+    Missing (TM, band) files are NaN in the cube and ignored in the reductions.
+    """
+    TMS = (1, 2, 3, 4, 5, 6, 7)
+    BAND = re.compile(r'^(\d+(?:\.\d+)?)-(\d+(?:\.\d+)?)keV')
+
+    def __init__(self, files):
+        self.files = {(tm, band): path for (tm, band), path in dict(files).items() if self.BAND.match(band)}
+        if not self.files:
+            raise ValueError("No files in the stack.")
+        self.tms = sorted({tm for tm, _ in self.files})
+        self.bands = sorted({band for _, band in self.files}, key=lambda b: [float(e) for e in self.BAND.match(b).groups()] + [b])
+        self._data = {}
+
+        headers = {key: read_header(path) for key, path in self.files.items()}
+        self.header = headers[min(headers)]
+        self._wcs = WCS(self.header, relax=True).celestial
+        ny, nx = self.header['NAXIS2'], self.header['NAXIS1']
+        for key, header in headers.items():
+            w = WCS(header, relax=True).celestial
+            if (header['NAXIS2'], header['NAXIS1']) != (ny, nx) or not (np.allclose(w.wcs.crpix, self._wcs.wcs.crpix) and
+                                                                       np.allclose(w.wcs.crval, self._wcs.wcs.crval) and
+                                                                       np.allclose(w.pixel_scale_matrix, self._wcs.pixel_scale_matrix)):
+                raise ValueError("{0} is not on the pixel grid of {1}.".format(self.files[key], self.files[min(headers)]))
+        self.shape = (len(self.tms), len(self.bands), ny, nx)
+
+    @classmethod
+    def discover(cls, directory, procver, obs, cluster, product='CLevlist', tms=TMS, bands=None):
+        """
+        Stack of the files <procver>_<obs>_<cluster>_combined_tiles_<TM>_<product>_<lo>-<hi>keV[_uni].fits of a directory.
+
+        Parameters:
+        - directory (str): Directory of the files.
+        - procver, obs, cluster (str): Processing version, survey and cluster names of the file names.
+        - product (str, optional): Product of the file names (e.g., CLevlist, CLexpmap, CLBGmap). Default is 'CLevlist'.
+        - tms (list of int, optional): TMs to keep. Default is TMS (1 to 7): the combined TMs (0, 8, 9, 12, 123, 1234, ...)
+          would be counted twice in the sums and must be asked for explicitly. None keeps all TMs.
+        - bands (list of str, optional): Bands to keep (e.g., ['6.7-9.0keV']). Default is None (all).
+        """
+        prefix = '{0}_{1}_{2}_combined_tiles_'.format(procver, obs, cluster)
+        pattern = re.compile(r'^{0}(\d+)_{1}_(\d+(?:\.\d+)?-\d+(?:\.\d+)?keV(?:_uni)?)\.fits$'.format(re.escape(prefix),
+                                                                                                    re.escape(product)))
+        files = {}
+        for name in sorted(os.listdir(directory)):
+            match = pattern.match(name)
+            if match:
+                tm, band = int(match.group(1)), match.group(2)
+                if (tms is None or tm in tms) and (bands is None or band in bands):
+                    files[(tm, band)] = os.path.join(directory, name)
+        if not files:
+            raise ValueError("No {0}*_{1}_*keV*.fits file in {2}.".format(prefix, product, directory))
+        return cls(files)
+
+    @property
+    def wcs(self):
+        return self._wcs
+
+    def _plane(self, tm, band):
+        if (tm, band) not in self._data:
+            self._data[(tm, band)] = open_image(self.files[(tm, band)]) if (tm, band) in self.files else None
+        return self._data[(tm, band)]
+
+    def companion(self, tm, band):
+        """
+        PrimCompanion of the image of a TM and band (memory-mapped).
+        """
+        return PrimCompanion().from_fits(self.files[(tm, band)], memmap=True)
+
+    def __getitem__(self, key):
+        """
+        cube[tm index, band index, y, x] with integers or slices, e.g., stack[:, 0, 100:200, 100:200].
+        """
+        key = (key if isinstance(key, tuple) else (key,)) + (slice(None),) * 4
+        it, ib = np.arange(len(self.tms))[key[0]], np.arange(len(self.bands))[key[1]]
+        shape = tuple(len(range(n)[s]) for n, s in zip(self.shape[2:], key[2:4]) if isinstance(s, slice))
+        planes = []
+        for i in np.atleast_1d(it):
+            for j in np.atleast_1d(ib):
+                plane = self._plane(self.tms[i], self.bands[j])
+                planes.append(np.full(shape, np.nan) if plane is None else np.asarray(plane[key[2], key[3]], dtype=np.float64))
+        cube = np.array(planes).reshape((np.size(it), np.size(ib)) + shape)
+        return cube[(0 if np.ndim(it) == 0 else slice(None), 0 if np.ndim(ib) == 0 else slice(None))]
+
+    def _weights(self, weights):
+        if isinstance(weights, dict):
+            w = np.zeros(self.shape[:2])
+            w[np.ix_([self.tms.index(tm) for tm in weights.get('tms', self.tms)],
+                     [self.bands.index(band) for band in weights.get('bands', self.bands)])] = 1.
+            return w
+        w = np.asarray(weights, dtype=float)
+        if w.shape != self.shape[:2]:
+            raise ValueError("weights must have the shape (number of TMs, number of bands) = {0}.".format(self.shape[:2]))
+        return w
+
+    def _reduce(self, weights, rows=1024):
+        """
+        Weighted sums of the images for several weight arrays, in one pass over blocks of rows.
+        """
+        weights = [self._weights(w) for w in weights]
+        ny, nx = self.shape[2:]
+        out = [np.zeros((ny, nx)) for _ in weights]
+        used = [(i, j) for i in range(len(self.tms)) for j in range(len(self.bands))
+                if any(w[i, j] != 0 for w in weights) and (self.tms[i], self.bands[j]) in self.files]
+        for y0 in range(0, ny, rows):
+            y1 = min(y0 + rows, ny)
+            for i, j in used:
+                block = np.asarray(self._plane(self.tms[i], self.bands[j])[y0:y1], dtype=np.float64)
+                for w, o in zip(weights, out):
+                    if w[i, j] != 0:
+                        o[y0:y1] += w[i, j] * block
+        return out
+
+    def _companion(self, data):
+        return PrimCompanion(data=data, header=self._wcs.to_header())
+
+    def weighted_sum(self, weights, rows=1024):
+        """
+        Sum of the images weighted by weights (array of shape (number of TMs, number of bands), or dict with 'tms'
+        and/or 'bands' lists for unit weights), e.g., TM-combined count maps. Returns a PrimCompanion.
+        """
+        return self._companion(self._reduce([weights], rows)[0])
+
+    def sum(self, tms=None, bands=None, rows=1024):
+        """
+        Sum over the TMs tms and bands bands (default all). Returns a PrimCompanion.
+        """
+        return self.weighted_sum({'tms': tms or self.tms, 'bands': bands or self.bands}, rows)
+
+    def ratio(self, num, den, rows=1024):
+        """
+        Ratio of two weighted sums (weights as in weighted_sum), e.g., hardness ratio of two bands over all TMs,
+        computed in one pass (NaN where the denominator is 0). Returns a PrimCompanion.
+        """
+        n, d = self._reduce([num, den], rows)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self._companion(np.where(d != 0, n / d, np.nan))
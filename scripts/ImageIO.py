@@ -0,0 +1,206 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+from astropy.io import fits
+from astropy.io.fits.hdu.base import DTYPE2BITPIX
+
+# compression of the images written by create_image and write_image (see compression_kwargs), e.g., PIPELINE_COMPRESSION=auto
+COMPRESSION = os.environ.get('PIPELINE_COMPRESSION', 'none')
+TILE_SHAPE = (256, 256)  # (y, x) compression tiles: rows, blocks of rows and cutouts only decompress the tiles they cover
+STRUCTURAL = ('SIMPLE', 'XTENSION', 'BITPIX', 'NAXIS', 'NAXIS1', 'NAXIS2', 'NAXIS3', 'EXTEND', 'PCOUNT', 'GCOUNT',
+              'BSCALE', 'BZERO', 'BLANK', 'CHECKSUM', 'DATASUM')
+
+
+def image_index(hdul, index=None):
+    """
+    Index of the image HDU of a file: index if given, else 0, or 1 if the primary HDU is empty and followed by a
+    tile-compressed image (as written by write_image).
+    """
+    if index is not None:
+        return index
+    if hdul[0].header.get('NAXIS', 0) == 0 and len(hdul) > 1 and isinstance(hdul[1], fits.CompImageHDU):
+        return 1
+    return 0
+
+
+def open_image(file_path, index=None):
+    """
+    Open the data of an image HDU for reading parts of it.
+
+    Parameters:
+    - file_path (str): Path to the FITS file.
+    - index (int, optional): HDU index. Default is None (see image_index).
+
+    Returns:
+    - numpy.ndarray: Memory-mapped data (pages are only read when the data are accessed), or for a tile-compressed
+      image its section (shape, dtype and indexing as an array; only the tiles covered by the indexed rows and columns
+      are decompressed).
+    """
+    hdul = fits.open(file_path, memmap=True)
+    index = image_index(hdul, index)
+    if isinstance(hdul[index], fits.CompImageHDU):
+        return hdul[index].section
+    data = hdul[index].data
+    hdul.close()  # the memory map stays valid
+    return data
+
+
+def read_header(file_path, index=None):
+    """
+    Header of the image HDU of a file (the image header of a tile-compressed image, see image_index).
+    """
+    with fits.open(file_path) as hdul:
+        return hdul[image_index(hdul, index)].header.copy()
+
+
+def out_dtype(*arrays):
+    """
+    Data type of the sum of arrays, with unsigned integers promoted to signed ones (FITS has no native unsigned type).
+    """
+    dtype = np.result_type(*[a.dtype for a in arrays])
+    if dtype.kind == 'u':
+        dtype = np.promote_types(dtype, np.int8)
+    return dtype
+
+
+def compression_kwargs(compression, dtype):
+    """
+    Keyword arguments of astropy.io.fits.CompImageHDU for a compression of an image of type dtype.
+
+    Compressions:
+    - 'none': no compression (returns None).
+    - 'auto': RICE_1 for integer images (counts), lossless GZIP_2 for floating-point images.
+    - 'rice': RICE_1 (floating-point images are quantized with level 16).
+    - 'gzip': lossless GZIP_2.
+    - 'gzip:<q>': GZIP_2, floating-point images quantized with level q (noise / q steps, subtractive dithering that
+      keeps zeros exact), e.g., 'gzip:16'. Integer images are compressed losslessly.
+
+    Returns:
+    - dict or None: The keyword arguments, or None for an uncompressed image.
+    """
+    dtype = np.dtype(dtype)
+    name, _, level = (compression or 'none').lower().partition(':')
+    if name == 'none':
+        return None
+    if name == 'auto':
+        name = 'rice' if dtype.kind in 'iub' and dtype.itemsize <= 4 else 'gzip'
+    if name == 'rice':
+        return {'compression_type': 'RICE_1'}
+    if name == 'gzip':
+        if level and dtype.kind == 'f':
+            return {'compression_type': 'GZIP_2', 'quantize_level': float(level), 'quantize_method': 2}
+        return {'compression_type': 'GZIP_2', 'quantize_level': 0.}
+    raise ValueError("Unknown compression {0} (none, auto, rice, gzip or gzip:<level>).".format(compression))
+
+
+def primary_header(header, shape=None, dtype=None):
+    """
+    Primary-HDU header of an image of the given shape and type (default: those of header), with the other keywords
+    of header (which may be the header of an extension or of a tile-compressed image).
+    """
+    if shape is None:
+        shape = [header['NAXIS{0}'.format(i)] for i in range(header['NAXIS'], 0, -1)]
+    bitpix = header['BITPIX'] if dtype is None else DTYPE2BITPIX[np.dtype(dtype).name]
+    hdr = fits.Header([('SIMPLE', True, 'conforms to FITS standard'), ('BITPIX', bitpix), ('NAXIS', len(shape))] +
+                      [('NAXIS{0}'.format(i + 1), n) for i, n in enumerate(shape[::-1])])
+    hdr.extend([card for card in (header or fits.Header()).cards if card.keyword not in STRUCTURAL])
+    return hdr
+
+
+def create_fits(file_path, header, shape, dtype=np.float32):
+    """
+    Create a primary-HDU FITS file of the given shape without holding the data in memory.
+
+    The header is written first and the file is extended to its final size, so that the data can
+    afterwards be opened as a memory map (fits.open(..., mode='update', memmap=True)).
+
+    Parameters:
+    - file_path (str): Path to the FITS file (overwritten).
+    - header (astropy.io.fits.Header): Header to copy (e.g., of the first input, as farith does).
+    - shape (tuple): (ny, nx) shape of the image.
+    - dtype (numpy.dtype, optional): Data type. Default is numpy.float32.
+    """
+    hdr = primary_header(header, shape, dtype)
+    hdr.tofile(file_path, overwrite=True)
+    nbytes = shape[0] * shape[1] * np.dtype(dtype).itemsize
+    with open(file_path, 'rb+') as f:
+        f.seek(len(hdr.tostring()) + ((nbytes + 2879) // 2880) * 2880 - 1)
+        f.write(b'\0')
+
+
+@contextmanager
+def create_image(file_path, header, shape, dtype=np.float32, compression=None):
+    """
+    Create a FITS image and yield its data as a writable memory map, flushed to disk on exit.
+
+    A compressed image (see compression_kwargs) is filled in a temporary memory-mapped file next to the output and
+    compressed tile by tile into the output on exit.
+
+    Example:
+    with create_image('out.fits', header, shape) as out:
+        for rows in row_blocks(shape[0]):
+            out[rows] = ...
+
+    Parameters:
+    - compression (str, optional): Compression. Default is None (COMPRESSION, i.e., $PIPELINE_COMPRESSION or none).
+    """
+    compression = COMPRESSION if compression is None else compression
+    if compression_kwargs(compression, dtype) is None:
+        create_fits(file_path, header, shape, dtype=dtype)
+        with fits.open(file_path, mode='update', memmap=True) as hdul:
+            yield hdul[0].data
+            hdul.flush()
+        return
+
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(file_path)), suffix='.tmp') as tmp:
+        # big-endian, as in the FITS file, so that the tiles are compressed without a byte-swapped copy of the image
+        data = np.memmap(tmp, dtype=np.dtype(dtype).newbyteorder('>'), mode='w+', shape=tuple(shape))
+        yield data
+        write_image(file_path, data, header, compression=compression)
+        del data
+
+
+def write_image(file_path, data, header=None, compression=None, dtype=None, tile_shape=TILE_SHAPE, extensions=(), overwrite=True):
+    """
+    Write an image, tile-compressed or not.
+
+    A compressed image is written in the first extension, after an empty primary HDU (open_image, read_header and
+    the FITS companions find it there; CFITSIO tools read it as <file>[1]).
+
+    Parameters:
+    - file_path (str): Path to the FITS file.
+    - data (numpy.ndarray): Image.
+    - header (astropy.io.fits.Header, optional): Header whose non-structural keywords (WCS, ...) are copied. Default is None.
+    - compression (str, optional): Compression (see compression_kwargs). Default is None (COMPRESSION).
+    - dtype (numpy.dtype, optional): Data type written, e.g., numpy.float32 for float64 maps. Default is None (that of data).
+    - tile_shape (tuple, optional): (y, x) shape of the compression tiles. Default is TILE_SHAPE.
+    - extensions (list of HDU, optional): HDUs written after the image (e.g., GTI tables). Default is ().
+    - overwrite (bool, optional): Overwrite an existing file. Default is True.
+    """
+    compression = COMPRESSION if compression is None else compression
+    if dtype is not None and np.dtype(dtype) != data.dtype:
+        data = np.asarray(data, dtype=dtype)
+    kwargs = compression_kwargs(compression, data.dtype)
+    hdr = fits.Header([card for card in (header or fits.Header()).cards if card.keyword not in STRUCTURAL])
+    if kwargs is None:
+        hdus = [fits.PrimaryHDU(data, header=hdr)]
+    else:
+        tile = tuple(min(t, n) for t, n in zip(tile_shape, data.shape))
+        hdus = [fits.PrimaryHDU(), fits.CompImageHDU(data, header=hdr, tile_shape=tile, **kwargs)]
+    fits.HDUList(hdus + list(extensions)).writeto(file_path, overwrite=overwrite)
+
+
+def row_blocks(ny, rows=1024):
+    """
+    Slices of at most rows image rows covering ny rows.
+    """
+    return [slice(y0, min(y0 + rows, ny)) for y0 in range(0, ny, rows)]
+
+
+def image_sum(data, rows=1024):
+    """
+    Sum of an image (NaNs ignored, as ftstat does), accumulated in float64 block by block.
+    """
+    return float(sum(np.nansum(data[block], dtype=np.float64) for block in row_blocks(np.shape(data)[0], rows)))
@@ -0,0 +1,496 @@
+import os
+import json
+import random
+import sqlite3
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Pool
+
+import numpy as np
+
+SWIFT_URL = "https://www.swift.ac.uk/analysis/nhtot/donhtot.php"
+
+# Willingale et al. (2013) molecular hydrogen relation
+NH2_MAX = 7.2e20    # cm^-2
+NH2_NC = 3.0e20     # cm^-2
+NH2_ALPHA = 1.1
+
+
+def extract_nh2_weighted_value(html_content):
+    """
+    Parse the HTML reply of the Swift nhtot page and return the NH2 weighted value.
+
+    Parameters:
+    - html_content (str): Content of the page.
+
+    Returns:
+    - float: NH2 weighted value in cm^-2, None if it is not found on the page.
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html_content, "html.parser")
+    nh2_weighted_element = soup.find("td", headers="h2w")
+    if nh2_weighted_element:
+        nh2_weighted_value = nh2_weighted_element.text.strip()
+        # Replace '×' with 'e+'
+        nh2_weighted_value = nh2_weighted_value.replace(' ×10', 'e+')
+        try:
+            return float(nh2_weighted_value)
+        except ValueError:
+            print("Cannot convert NH2 weighted value '{0}'.".format(nh2_weighted_value))
+            return None
+    else:
+        print("NH2 weighted value not found on the page.")
+        return None
+
+
+def willingale_nh2(nhi, ebv):
+    """
+    2*NH2 from the Willingale et al. (2013) relation, i.e., the value added to NHI to get NHtot.
+
+    Parameters:
+    - nhi (float or numpy.ndarray): Atomic hydrogen column density in cm^-2.
+    - ebv (float or numpy.ndarray): Colour excess E(B-V) in mag.
+
+    Returns:
+    - float or numpy.ndarray: 2*NH2 in cm^-2.
+    """
+    nhi = np.asarray(nhi, dtype=float)
+    ebv = np.clip(np.asarray(ebv, dtype=float), 0., None)
+    return 2 * NH2_MAX * (1 - np.exp(-nhi * ebv / NH2_NC))**NH2_ALPHA
+
+
+class NH2Provider:
+    """
+    Base class of the NH2 weighted column density providers.
+
+    Subclasses implement query(ra, dec); query_many can be overridden when the backend
+    handles many positions at once more efficiently, and close when it holds resources.
+    """
+    def query(self, ra, dec):
+        """
+        Return the NH2 weighted value (cm^-2) at (ra, dec) in degrees, None if it cannot be retrieved.
+        """
+        raise NotImplementedError
+
+    def query_many(self, ra, dec):
+        """
+        Return the NH2 weighted values (cm^-2) at many positions, None for failed positions.
+        """
+        return [self.query(r, d) for r, d in zip(ra, dec)]
+
+    def close(self):
+        """
+        Release the resources of the provider (processes, files).
+        """
+        pass
+
+
+def _swift_query(args):
+    url, timeout, ra, dec = args
+    return SwiftNH2Provider(url, timeout).query(ra, dec)
+
+
+class SwiftNH2Provider(NH2Provider):
+    """
+    Query the Swift nhtot page (https://www.swift.ac.uk/analysis/nhtot/), one HTTP POST per position.
+
+    Parameters:
+    - url (str, optional): URL of the nhtot page. Default is SWIFT_URL.
+    - timeout (float, optional): Timeout of a request in s. Default is 60.
+    - nproc (int, optional): Number of processes used by query_many. The process pool is started by the first
+      query_many call and reused by the next ones until close. Default is 1.
+    """
+    def __init__(self, url=SWIFT_URL, timeout=60, nproc=1):
+        self.url = url
+        self.timeout = timeout
+        self.nproc = nproc
+        self._pool = None
+
+    def query(self, ra, dec):
+        import requests
+
+        payload = {
+            "Coords": f"{ra}, {dec}",
+            "equinox": "2000",
+            "submit": "Calculate NH"
+        }
+        try:
+            response = requests.post(self.url, data=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            print(f"Failed to retrieve NH2 weighted value: {e}")
+            return None
+        if response.ok:
+            # Extract NH2 weighted value from response content
+            return extract_nh2_weighted_value(response.text)
+        else:
+            print("Failed to retrieve NH2 weighted value.")
+            return None
+
+    def query_many(self, ra, dec):
+        args = [(self.url, self.timeout, r, d) for r, d in zip(ra, dec)]
+        if self.nproc <= 1 or len(args) <= 1:
+            return [_swift_query(a) for a in args]
+        if self._pool is None:
+            self._pool = Pool(processes=self.nproc)
+        return list(self._pool.imap(_swift_query, args))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+class AsyncSwiftNH2Provider(NH2Provider):
+    """
+    Query the Swift nhtot page with asyncio over a pooled connection.
+
+    Requests run with bounded concurrency and an optional global rate limit. Failed requests are
+    retried with exponential backoff. Results can be checkpointed to a JSON-lines file as soon as
+    they arrive, so an interrupted run only fetches the remaining positions.
+
+    Parameters:
+    - url (str, optional): URL of the nhtot page (or of a local stand-in server). Default is SWIFT_URL.
+    - concurrency (int, optional): Maximum number of requests in flight. Default is 8.
+    - rate (float, optional): Maximum number of requests started per second, None for no limit. Default is None.
+    - retries (int, optional): Number of retries of a failed request. Default is 4.
+    - backoff (float, optional): Delay before the first retry in s, doubled at every retry. Default is 1.
+    - timeout (float, optional): Timeout of a request in s. Default is 60.
+    - checkpoint (str, optional): JSON-lines file of the positions already fetched (read once, by the first query). Default is None.
+
+    Attributes:
+    - missing (list of tuple): (ra, dec) of the positions that could not be fetched by the last query_many call.
+    """
+    def __init__(self, url=SWIFT_URL, concurrency=8, rate=None, retries=4, backoff=1., timeout=60, checkpoint=None):
+        self.url = url
+        self.concurrency = concurrency
+        self.rate = rate
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.checkpoint = checkpoint
+        self.missing = []
+        self._done = None  # {(ra, dec): value} of the checkpoint and of the queries of this object
+
+    def _load_checkpoint(self):
+        done = {}
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            with open(self.checkpoint) as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                    except ValueError:
+                        continue  # line cut by an interruption
+                    done[(item['ra'], item['dec'])] = item['value']
+        return done
+
+    async def _fetch(self, session, semaphore, limiter, ra, dec):
+        import aiohttp
+
+        payload = {"Coords": f"{ra}, {dec}", "equinox": "2000", "submit": "Calculate NH"}
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff * 2**(attempt - 1) * (1 + 0.1 * random.random()))
+            async with semaphore:
+                await limiter()
+                try:
+                    async with session.post(self.url, data=payload) as response:
+                        if response.status == 200:
+                            value = extract_nh2_weighted_value(await response.text())
+                            if value is not None:
+                                return value
+                        elif 400 <= response.status < 500 and response.status != 429:
+                            return None  # not worth retrying
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    pass
+        return None
+
+    async def _query_all(self, positions, done, out):
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        lock = asyncio.Lock()
+        next_start = [loop.time()]
+
+        async def limiter():
+            if not self.rate:
+                return
+            async with lock:
+                wait = next_start[0] - loop.time()
+                next_start[0] = max(next_start[0], loop.time()) + 1. / self.rate
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            async def one(ra, dec):
+                value = await self._fetch(session, semaphore, limiter, ra, dec)
+                done[(ra, dec)] = value
+                if out and value is not None:
+                    out.write(json.dumps({'ra': ra, 'dec': dec, 'value': value}) + '\n')
+                    out.flush()
+
+            await asyncio.gather(*(one(ra, dec) for ra, dec in positions))
+
+    def query(self, ra, dec):
+        return self.query_many([ra], [dec])[0]
+
+    def query_many(self, ra, dec):
+        positions = [(float(r), float(d)) for r, d in zip(ra, dec)]
+        if self._done is None:
+            self._done = self._load_checkpoint()
+        done = self._done
+        todo = [p for p in dict.fromkeys(positions) if done.get(p) is None]
+
+        out = open(self.checkpoint, 'a') if self.checkpoint else None
+        try:
+            if todo:
+                asyncio.run(self._query_all(todo, done, out))
+        finally:
+            if out:
+                out.close()
+
+        values = [done.get(p) for p in positions]
+        self.missing = [p for p, v in zip(positions, values) if v is None]
+        return values
+
+
+class MockNH2Provider(NH2Provider):
+    """
+    Offline stand-in of the Swift page for tests.
+
+    Every query renders an HTML reply in the format of the Swift page and parses it with
+    extract_nh2_weighted_value, so the parsing path is exercised without network.
+
+    Parameters:
+    - func (callable, optional): func(ra, dec) -> NH2 weighted value in cm^-2, or None to simulate a failure.
+      Default is a smooth function of the position.
+
+    Attributes:
+    - ncalls (int): Number of positions queried so far.
+    """
+    def __init__(self, func=None):
+        self.func = func or (lambda ra, dec: 1e20 * (1 + 0.5 * np.sin(np.radians(ra)) * np.cos(np.radians(dec))))
+        self.ncalls = 0
+
+    @staticmethod
+    def html(value):
+        """
+        Render a minimal reply of the Swift page with the NH2 weighted value.
+        """
+        mantissa, exponent = '{0:.2e}'.format(value).split('e')
+        return '<table><tr><td headers="h2w">{0} ×10{1}</td></tr></table>'.format(mantissa, int(exponent))
+
+    def query(self, ra, dec):
+        self.ncalls += 1
+        value = self.func(ra, dec)
+        if value is None:
+            return None
+        return extract_nh2_weighted_value(self.html(value))
+
+
+class MockNH2Server:
+    """
+    Local stand-in of the Swift nhtot page for tests of the HTTP clients.
+
+    Answers POST requests with the replies of MockNH2Provider. Use as a context manager;
+    the url attribute is the address to pass to the clients.
+
+    Parameters:
+    - func (callable, optional): func(ra, dec) -> value, as for MockNH2Provider.
+    - fail_rate (float, optional): Fraction of requests answered with HTTP 503. Default is 0.
+    - port (int, optional): Port to listen on, 0 for any free port. Default is 0.
+    """
+    def __init__(self, func=None, fail_rate=0., port=0):
+        mock = MockNH2Provider(func)
+        self.mock = mock
+        self.nrequests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                from urllib.parse import parse_qs
+
+                server.nrequests += 1
+                length = int(self.headers.get('Content-Length', 0))
+                form = parse_qs(self.rfile.read(length).decode())
+                if random.random() < fail_rate:
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                ra, dec = (float(x) for x in form['Coords'][0].split(','))
+                value = mock.func(ra, dec)
+                body = (mock.html(value) if value is not None else '<html></html>').encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.url = 'http://127.0.0.1:{0}/donhtot.php'.format(self._httpd.server_address[1])
+
+    def __enter__(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class WillingaleNH2Provider(NH2Provider):
+    """
+    Compute the NH2 weighted value locally from an HI and a dust map with the Willingale et al. (2013) relation.
+
+    Both maps are FITS images with a celestial WCS (any frame), e.g., the HI4PI NHI map and the
+    Schlegel et al. (1998) E(B-V) map reprojected on an image grid. Maps are sampled with bilinear interpolation.
+
+    Parameters:
+    - hi_map (str): Path to the NHI map (cm^-2).
+    - ebv_map (str): Path to the E(B-V) map (mag).
+    """
+    def __init__(self, hi_map, ebv_map):
+        self._maps = [self._load(hi_map), self._load(ebv_map)]
+
+    @staticmethod
+    def _load(file_path):
+        from astropy.io import fits
+        from astropy.wcs import WCS
+
+        with fits.open(file_path, memmap=True) as hdul:
+            hdu = next(h for h in hdul if h.data is not None)
+            return np.asarray(hdu.data, dtype=float).squeeze(), WCS(hdu.header).celestial
+
+    @staticmethod
+    def _sample(data, w, ra, dec):
+        from astropy.coordinates import SkyCoord
+        from astropy.wcs.utils import skycoord_to_pixel
+        from scipy.ndimage import map_coordinates
+
+        x, y = skycoord_to_pixel(SkyCoord(ra, dec, unit='deg', frame='icrs'), w)
+        return map_coordinates(data, [np.atleast_1d(y), np.atleast_1d(x)], order=1, mode='nearest')
+
+    def query(self, ra, dec):
+        return float(self.query_many([ra], [dec])[0])
+
+    def query_many(self, ra, dec):
+        (hi, w_hi), (ebv, w_ebv) = self._maps
+        nhi = self._sample(hi, w_hi, np.asarray(ra, dtype=float), np.asarray(dec, dtype=float))
+        e = self._sample(ebv, w_ebv, np.asarray(ra, dtype=float), np.asarray(dec, dtype=float))
+        return list(willingale_nh2(nhi, e))
+
+
+class NH2Cache:
+    """
+    Persistent on-disk cache of NH2 weighted values keyed by (RA, Dec) rounded to a number of decimals.
+
+    Parameters:
+    - file_path (str): Path to the SQLite cache file. Created if it does not exist.
+    - decimals (int, optional): Rounding of the coordinates in degrees. Default is 2 (36 arcsec).
+    - source (str, optional): Name of the provider the values come from; values of different sources are kept apart. Default is 'swift'.
+    """
+    def __init__(self, file_path, decimals=2, source='swift'):
+        self.file_path = file_path
+        self.decimals = decimals
+        self.source = source
+        folder = os.path.dirname(os.path.abspath(file_path))
+        os.makedirs(folder, exist_ok=True)
+        self._db = sqlite3.connect(file_path)
+        self._db.execute('CREATE TABLE IF NOT EXISTS nh2 (source TEXT, decimals INTEGER, ra INTEGER, dec INTEGER, value REAL, '
+                         'PRIMARY KEY (source, decimals, ra, dec))')
+        self._db.commit()
+
+    def key(self, ra, dec):
+        """
+        Return the integer cache key of a position.
+        """
+        scale = 10**self.decimals
+        return int(round(ra * scale)) % (360 * scale), int(round(dec * scale))
+
+    def position(self, key):
+        """
+        Return the (ra, dec) in degrees a key stands for.
+        """
+        scale = 10**self.decimals
+        return key[0] / scale, key[1] / scale
+
+    def get_many(self, keys):
+        """
+        Return {key: value} for the keys present in the cache.
+        """
+        found = {}
+        keys = list(keys)
+        for i in range(0, len(keys), 400):
+            chunk = keys[i:i + 400]
+            query = ' OR '.join(['(ra=? AND dec=?)'] * len(chunk))
+            params = [k for key in chunk for k in key]
+            for ra, dec, value in self._db.execute(
+                    'SELECT ra, dec, value FROM nh2 WHERE source=? AND decimals=? AND ({0})'.format(query),
+                    [self.source, self.decimals] + params):
+                found[(ra, dec)] = value
+        return found
+
+    def put_many(self, items):
+        """
+        Store {key: value} items. None values are not stored.
+        """
+        rows = [(self.source, self.decimals, k[0], k[1], v) for k, v in items.items() if v is not None]
+        self._db.executemany('INSERT OR REPLACE INTO nh2 VALUES (?, ?, ?, ?, ?)', rows)
+        self._db.commit()
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM nh2 WHERE source=? AND decimals=?',
+                                (self.source, self.decimals)).fetchone()[0]
+
+    def close(self):
+        self._db.close()
+
+
+class CachedNH2Provider(NH2Provider):
+    """
+    Wrap a provider with an NH2Cache. Positions are snapped to the cache grid, and only the
+    grid points missing from the cache are queried from the backend.
+
+    Parameters:
+    - backend (NH2Provider): Provider used for cache misses.
+    - cache (NH2Cache): Persistent cache.
+
+    Attributes:
+    - hits, misses (int): Number of cached and queried grid points so far.
+    """
+    def __init__(self, backend, cache):
+        self.backend = backend
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+
+    def query(self, ra, dec):
+        return self.query_many([ra], [dec])[0]
+
+    def query_many(self, ra, dec):
+        keys = [self.cache.key(r, d) for r, d in zip(ra, dec)]
+        found = self.cache.get_many(set(keys))
+        missing = [k for k in dict.fromkeys(keys) if k not in found]
+        self.hits += len(set(keys)) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            positions = [self.cache.position(k) for k in missing]
+            values = self.backend.query_many([p[0] for p in positions], [p[1] for p in positions])
+            new = {k: (None if v is None else float(v)) for k, v in zip(missing, values)}
+            self.cache.put_many(new)
+            found.update(new)
+
+        return [found.get(k) for k in keys]
+
+    def close(self):
+        self.backend.close()
+        self.cache.close()
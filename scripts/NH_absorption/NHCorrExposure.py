@@ -0,0 +1,140 @@
+from contextlib import ExitStack
+
+import numpy as np
+
+from ImageIO import open_image, read_header, create_image, row_blocks, image_sum
+
+EXPOSURES = {'CLexpmap': 'CLCRBGSUB', 'CLexpmap-single': 'CLCRBGSUB-single'}  # exposure map -> count-rate map
+
+
+class NHCorrExposure:
+    """
+    NH correction of the TM8/TM9 exposure maps and NH-corrected TM0 count-rate maps of the combined-tile images.
+
+    Same final products as SH_PIBSUB-NHcorr.sh (0BG0_CLCRBGSUB and 0BG0_CLCRBGSUB-single ..._NHcorr_corr.fits), but the
+    exposure maps are divided by the NH correction maps on the fly, block by block: a first pass sums the corrected
+    TM8/TM9 exposures and the TM8/TM9 PIB-subtracted counts for the TM9 correction factors, a second pass writes the
+    count-rate maps. The intermediate _NHcorr and _NHcorr_corr exposure maps are not written (unless exposures=True).
+
+    Parameters:
+    - procver (str): Processing version, e.g., c020.
+    - obs (str): Observation name, e.g., em01.
+    - cluster (str): Cluster name, e.g., A3391.
+    - lowe, lowe9 (list of str): Lower energy limits of TM8 and TM9, e.g., ['0.2'] or ['0.2', '1.5'].
+    - hie (list of str): Upper energy limits, e.g., ['2.3'] or ['1.3', '2.3'].
+    - nhcorr8, nhcorr9 (str): NH correction maps of TM8 (TM1 response) and TM9 (TM5 response), e.g.,
+      AIT_-600_600_cuttoA3391_repr_TM1_0.2-2.3keV_CORR_map.fits.
+    - rows (int, optional): Number of image rows per block. Default is 1024.
+    - compression (str, optional): Compression of the products (see ImageIO.compression_kwargs). Default is None ($PIPELINE_COMPRESSION or none).
+
+    Methods:
+    - name(tm, product, ...): File name of a product, following the SH_PIBSUB-NHcorr.sh naming scheme.
+    - exposure(tm, product, rows): NH-corrected exposure of a block of rows.
+    - run(exposures, verbose): Create the count-rate maps and return the TM9 correction factors.
+    """
+    def __init__(self, procver, obs, cluster, lowe, lowe9, hie, nhcorr8, nhcorr9, rows=1024, compression=None):
+        self.prefix = '{0}_{1}_{2}_combined_tiles'.format(procver, obs, cluster)
+        self.lowe = list(lowe)
+        self.lowe9 = list(lowe9)
+        self.hie = list(hie)
+        self.suff = '' if len(self.lowe) == 1 else '_uni'
+        self.nhcorr = {8: nhcorr8, 9: nhcorr9}
+        self.rows = rows
+        self.compression = compression
+        self._img = {}
+
+    def band(self, tm):
+        """
+        Band label of a TM in the file names, e.g., 0.2-2.3 (TM0: 0.20.8-2.3).
+        """
+        if tm == 0:
+            return '{0}{1}-{2}'.format(self.lowe[0], self.lowe9[0], self.hie[-1])
+        return '{0}-{1}'.format((self.lowe9 if tm == 9 else self.lowe)[0], self.hie[-1])
+
+    def name(self, tm, product, band=None, tail=''):
+        """
+        File name of a product, e.g., name(8, 'CLexpmap') or name('0BG0', 'CLCRBGSUB', band=self.band(8), tail='_NHcorr_corr').
+        """
+        band = self.band(tm) if band is None else band
+        return '{0}_{1}_{2}_{3}keV{4}{5}.fits'.format(self.prefix, tm, product, band, self.suff, tail)
+
+    def image(self, file_path):
+        """
+        Memory-mapped data of an input image (opened once).
+        """
+        if file_path not in self._img:
+            self._img[file_path] = open_image(file_path)
+        return self._img[file_path]
+
+    def exposure(self, tm, product, rows):
+        """
+        NH-corrected exposure (exposure / NH correction factor, 0 where the factor is 0 as farith DIV blank=0) of TM8 or
+        TM9 in a block of rows.
+        """
+        exp = self.image(self.name(tm, product))[rows]
+        corr = self.image(self.nhcorr[tm])[rows]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(corr != 0, exp / corr, 0)
+
+    def run(self, exposures=False, verbose=True):
+        """
+        Create the NH-corrected TM0 count-rate maps 0BG0_CLCRBGSUB(-single)_..._NHcorr_corr.fits.
+
+        Parameters:
+        - exposures (bool, optional): If True, also write the corrected TM0 exposure maps 0BG0_CLexpmap(-single)_..._NHcorr_corr.fits. Default is False.
+        - verbose (bool, optional): If True, print the intermediate values as SH_PIBSUB-NHcorr.sh does. Default is True.
+
+        Returns:
+        - dict: TM9 correction factors ('corr' of CLexpmap, 'corrs' of CLexpmap-single) and the totals used to compute them.
+        """
+        log = print if verbose else (lambda *a, **k: None)
+        bgsub0 = self.image(self.name(0, 'CLevlistBGSUB'))
+        shape = bgsub0.shape
+        inputs = [self.name(tm, p) for tm in (8, 9) for p in EXPOSURES] + list(self.nhcorr.values())
+        for file_path in inputs:
+            if self.image(file_path).shape != shape:
+                raise ValueError("{0} has shape {1}, expected {2} as {3}.".format(file_path, self.image(file_path).shape, shape, self.name(0, 'CLevlistBGSUB')))
+
+        # Pass 1: totals of the PIB-subtracted counts and of the NH-corrected exposures of TM8 and TM9
+        tot = {'BGSUB8': image_sum(self.image(self.name(8, 'CLevlistBGSUB')), self.rows),
+               'BGSUB9': image_sum(self.image(self.name(9, 'CLevlistBGSUB')), self.rows)}
+        for key in ('exp8', 'exp9', 'exps8', 'exps9'):
+            tot[key] = 0.
+        for rows in row_blocks(shape[0], self.rows):
+            for tm in (8, 9):
+                tot['exp{0}'.format(tm)] += np.nansum(self.exposure(tm, 'CLexpmap', rows), dtype=np.float64)
+                tot['exps{0}'.format(tm)] += np.nansum(self.exposure(tm, 'CLexpmap-single', rows), dtype=np.float64)
+
+        result = {'totals': tot}
+        factors = {}
+        for exp, key, tkey in (('CLexpmap', 'corr', 'exp'), ('CLexpmap-single', 'corrs', 'exps')):
+            factors[exp] = result[key] = (tot['BGSUB9'] / tot['BGSUB8']) * (tot[tkey + '8'] / tot[tkey + '9'])
+            log("\nCalculating correction factor for {0}_NHcorr TM9...".format(exp))
+            log("total counts in CLevlistBGSUB_8: {0:.5f}".format(tot['BGSUB8']))
+            log("total counts in CLevlistBGSUB_9: {0:.5f}".format(tot['BGSUB9']))
+            log("total exposure in CLexp_8_NHcorr: {0:.5f}".format(tot[tkey + '8']))
+            log("total exposure in CLexp_9_NHcorr: {0:.5f}".format(tot[tkey + '9']))
+            log("correction factor (count-rate_9/count-rate_8): {0:.7f}".format(result[key]))
+
+        # Pass 2: corrected TM0 exposures and count-rate maps
+        band0 = self.band(8)
+        with ExitStack() as stack:
+            rate, exp0 = {}, {}
+            for exp, cr in EXPOSURES.items():
+                rate[exp] = stack.enter_context(create_image(self.name('0BG0', cr, band=band0, tail='_NHcorr_corr'),
+                                                             read_header(self.name(0, 'CLevlistBGSUB')), shape, compression=self.compression))
+                if exposures:
+                    exp0[exp] = stack.enter_context(create_image(self.name('0BG0', exp, band=band0, tail='_NHcorr_corr'),
+                                                                 read_header(self.name(8, exp)), shape, compression=self.compression))
+            for rows in row_blocks(shape[0], self.rows):
+                counts = bgsub0[rows]
+                for exp in EXPOSURES:
+                    e0 = self.exposure(8, exp, rows) + self.exposure(9, exp, rows) * factors[exp]
+                    if exposures:
+                        exp0[exp][rows] = e0
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        rate[exp][rows] = np.where(e0 != 0, counts / e0, 0)  # farith DIV blank=0
+
+        for cr in EXPOSURES.values():
+            log("===> {0} is created!".format(self.name('0BG0', cr, band=band0, tail='_NHcorr_corr')))
+        return result
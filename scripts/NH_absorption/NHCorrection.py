@@ -0,0 +1,96 @@
+import numpy as np
+
+
+def corr_table(nh, rate, nh_ref=None, decimals=4):
+    """
+    Build the sorted NH -> rate_corr lookup table from the XSPEC simulation results.
+
+    Parameters:
+    - nh (numpy.ndarray): Simulated NH values in units of 1e22 atoms/cm^2.
+    - rate (numpy.ndarray): Simulated count-rates for each NH value.
+    - nh_ref (float, optional): Reference NH value (in 1e22) the map is normalised to. Default is the median of nh.
+    - decimals (int, optional): Rounding applied to the NH grid, same as the one applied to the NH map. Default is 4.
+
+    Returns:
+    - nh_table (numpy.ndarray): Sorted, unique NH values.
+    - corr (numpy.ndarray): Correction factor rate(nh_ref) / rate(nh) for each entry of nh_table.
+    - rate_ref (float): Count-rate at the reference NH value.
+    """
+    nh = np.round(np.asarray(nh, dtype=float), decimals)
+    rate = np.asarray(rate, dtype=float)
+    if nh.shape != rate.shape:
+        raise ValueError("nh and rate must have the same length.")
+
+    good = np.isfinite(nh) & np.isfinite(rate)
+    nh_table, first = np.unique(nh[good], return_index=True)
+    rate_table = rate[good][first]
+    if len(nh_table) == 0:
+        raise ValueError("The simulation table does not contain any valid NH value.")
+
+    if nh_ref is None:
+        nh_ref = np.median(nh[good])
+    nh_ref = np.round(nh_ref, decimals)
+    rate_ref = float(np.interp(nh_ref, nh_table, rate_table))
+
+    return nh_table, rate_ref / rate_table, rate_ref
+
+
+def lookup(values, nh_table, corr):
+    """
+    Map NH values onto the correction table in one vectorized pass.
+
+    Values found in the table get their tabulated factor, values in between two
+    grid nodes are linearly interpolated and values outside of the grid take the
+    factor of the closest node. NaNs are propagated.
+
+    Parameters:
+    - values (numpy.ndarray): NH values (in 1e22), any shape.
+    - nh_table (numpy.ndarray): Sorted NH grid as returned by corr_table.
+    - corr (numpy.ndarray): Correction factors on nh_table.
+
+    Returns:
+    - numpy.ndarray: Correction factors with the shape of values.
+    """
+    values = np.asarray(values, dtype=float)
+    out = np.full(values.shape, np.nan)
+    good = np.isfinite(values)
+    v = values[good]
+
+    if len(nh_table) == 1:
+        out[good] = corr[0]
+        return out
+
+    # index of the right-hand node, clipped so that both neighbours exist
+    idx = np.clip(np.searchsorted(nh_table, v), 1, len(nh_table) - 1)
+    x0 = np.take(nh_table, idx - 1)
+    x1 = np.take(nh_table, idx)
+    y0 = np.take(corr, idx - 1)
+    y1 = np.take(corr, idx)
+    w = np.clip((v - x0) / (x1 - x0), 0., 1.)
+    out[good] = y0 + w * (y1 - y0)
+
+    return out
+
+
+def corr_map(nh_map_ine22, nh_table, corr, rows=1024):
+    """
+    Create the NH correction map from an NH map (in 1e22) and a correction table.
+
+    The input map is left untouched, works for non-square images and is processed
+    in blocks of rows to keep the temporary arrays small.
+
+    Parameters:
+    - nh_map_ine22 (numpy.ndarray): 2D NH map in units of 1e22 atoms/cm^2, already rounded like the table.
+    - nh_table (numpy.ndarray): Sorted NH grid as returned by corr_table.
+    - corr (numpy.ndarray): Correction factors on nh_table.
+    - rows (int, optional): Number of image rows per block. Default is 1024.
+
+    Returns:
+    - numpy.ndarray: Correction map with the same shape as the input (float64).
+    """
+    nh_map_ine22 = np.asarray(nh_map_ine22)
+    img_corr = np.empty(nh_map_ine22.shape, dtype=float)
+    for y0 in range(0, nh_map_ine22.shape[0], rows):
+        img_corr[y0:y0 + rows] = lookup(nh_map_ine22[y0:y0 + rows], nh_table, corr)
+
+    return img_corr
@@ -0,0 +1,98 @@
+import math
+
+import numpy as np
+
+
+def box_grid(w, shape, box_size):
+    """
+    Centres of the sampling boxes covering an image, computed with a single WCS call.
+
+    Boxes of box_size x box_size pixels start at pixel (0, 0). When the image size is not a
+    multiple of box_size, the last row/column of boxes is cut at the image edge and its centre
+    is the centre of the part inside the image, so the whole image is covered.
+
+    Parameters:
+    - w (astropy.wcs.WCS): Celestial WCS of the image.
+    - shape (tuple): (ny, nx) shape of the image.
+    - box_size (int): Box size in pixels.
+
+    Returns:
+    - ra, dec (numpy.ndarray): (nby, nbx) world coordinates of the box centres in degrees.
+    - xc, yc (numpy.ndarray): 1D pixel coordinates (0-based) of the box centres along x (nbx) and y (nby).
+    """
+    ny, nx = shape
+    xc = _centres(nx, box_size)
+    yc = _centres(ny, box_size)
+    x, y = np.meshgrid(xc, yc)
+    ra, dec = w.pixel_to_world_values(x, y)
+
+    return np.asarray(ra), np.asarray(dec), xc, yc
+
+
+def _centres(n, box_size):
+    start = np.arange(0, n, box_size)
+    stop = np.minimum(start + box_size, n)
+    return 0.5 * (start + stop - 1)
+
+
+def n_boxes(n, box_size):
+    """
+    Number of boxes (including a last partial one) along an axis of n pixels.
+    """
+    return math.ceil(n / box_size)
+
+
+def block_fill(values, shape, box_size):
+    """
+    Fill an image with one constant value per box.
+
+    Parameters:
+    - values (numpy.ndarray): (nby, nbx) box values, as sampled on box_grid.
+    - shape (tuple): (ny, nx) shape of the output image.
+    - box_size (int): Box size in pixels.
+
+    Returns:
+    - numpy.ndarray: (ny, nx) image.
+    """
+    ny, nx = shape
+    values = np.asarray(values)
+    if values.shape != (n_boxes(ny, box_size), n_boxes(nx, box_size)):
+        raise ValueError("values must have one entry per box, i.e., shape {0}.".format((n_boxes(ny, box_size), n_boxes(nx, box_size))))
+
+    return np.repeat(np.repeat(values, box_size, axis=0)[:ny], box_size, axis=1)[:, :nx]
+
+
+def _interp_weights(coords, centres):
+    idx = np.clip(np.searchsorted(centres, coords), 1, len(centres) - 1)
+    c0, c1 = centres[idx - 1], centres[idx]
+    return idx - 1, idx, np.clip((coords - c0) / (c1 - c0), 0., 1.)
+
+
+def interp_fill(values, xc, yc, shape):
+    """
+    Fill an image by bilinear interpolation between the box centres (constant beyond the outermost centres).
+
+    The interpolation is separable: along x for every row of boxes, then along y for every image row.
+
+    Parameters:
+    - values (numpy.ndarray): (nby, nbx) box values.
+    - xc, yc (numpy.ndarray): Pixel coordinates of the box centres, as returned by box_grid.
+    - shape (tuple): (ny, nx) shape of the output image.
+
+    Returns:
+    - numpy.ndarray: (ny, nx) image.
+    """
+    ny, nx = shape
+    values = np.asarray(values, dtype=float)
+
+    if len(xc) > 1:
+        i0, i1, wx = _interp_weights(np.arange(nx), xc)
+        rows = values[:, i0] * (1 - wx) + values[:, i1] * wx
+    else:
+        rows = np.repeat(values, nx, axis=1)
+
+    if len(yc) > 1:
+        j0, j1, wy = _interp_weights(np.arange(ny), yc)
+        return rows[j0] * (1 - wy)[:, None] + rows[j1] * wy[:, None]
+    else:
+        return np.repeat(rows, ny, axis=0)
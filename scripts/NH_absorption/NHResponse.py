@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+from scipy.interpolate import PchipInterpolator
+
+
+class NHResponseModel:
+    """
+    Smooth, monotonic NH -> count-rate model interpolated over a small grid of simulated NH nodes.
+
+    The rate curve is interpolated with a PCHIP interpolant in log(rate), which keeps the
+    monotonicity of the simulated nodes. Values outside of the grid take the rate of the closest node.
+
+    Parameters:
+    - nh (numpy.ndarray): Simulated NH values (nodes) in 1e22 atoms/cm^2.
+    - rate (numpy.ndarray): Simulated count-rates at the nodes.
+    - flux (numpy.ndarray, optional): Simulated fluxes at the nodes. Default is None.
+    - expos (numpy.ndarray, optional): Exposure of the fake spectra. Default is None.
+
+    Methods:
+    - from_simulation(simulate, nh_min, nh_max, ...): Build the model on an adaptive grid of NH nodes.
+    - from_table(file_path): Load the nodes from a simulation results file (columns nh rate flux exp).
+    - to_table(file_path): Write the nodes in the same format.
+    - corr_map(nh_map_ine22, nh_ref): Correction map rate(nh_ref) / rate(NH) of an NH map.
+    """
+    def __init__(self, nh, rate, flux=None, expos=None):
+        nh = np.asarray(nh, dtype=float)
+        order = np.argsort(nh)
+        self.nh, first = np.unique(nh[order], return_index=True)
+        self.rate = np.asarray(rate, dtype=float)[order][first]
+        self.flux = None if flux is None else np.asarray(flux, dtype=float)[order][first]
+        self.expos = None if expos is None else np.asarray(expos, dtype=float)[order][first]
+
+        if len(self.nh) < 2:
+            raise ValueError("At least two NH nodes are needed.")
+        self._log = bool(np.all(self.rate > 0))
+        y = np.log(self.rate) if self._log else self.rate
+        self._interp = PchipInterpolator(self.nh, y, extrapolate=False)
+
+    def __call__(self, nh):
+        """
+        Return the count-rate for any NH value (in 1e22). NaNs are propagated.
+        """
+        nh = np.clip(np.asarray(nh, dtype=float), self.nh[0], self.nh[-1])
+        y = self._interp(nh)
+        return np.exp(y) if self._log else y
+
+    def __len__(self):
+        return len(self.nh)
+
+    @classmethod
+    def from_simulation(cls, simulate, nh_min, nh_max, n_init=5, rtol=1e-3, max_nodes=64, decimals=4, verbose=True):
+        """
+        Build the model by simulating an adaptive grid of NH nodes.
+
+        Starting from n_init equally spaced nodes, the midpoint of every interval is simulated and
+        compared to the current interpolant. Intervals where the relative difference exceeds rtol
+        are split again in the next round; the others are left alone. All midpoints of one round are
+        simulated in a single call, so that simulate can batch (or parallelise) them.
+
+        Parameters:
+        - simulate (callable): simulate(list of nh) -> list of (nh, rate, flux, expos), e.g., XspecSim.simulate with the TM and band fixed.
+        - nh_min, nh_max (float): NH range to cover (in 1e22).
+        - n_init (int, optional): Number of initial nodes. Default is 5.
+        - rtol (float, optional): Relative tolerance on the rate at the interval midpoints. Default is 1e-3.
+        - max_nodes (int, optional): Maximum number of simulated nodes. Default is 64.
+        - decimals (int, optional): Rounding of the NH nodes, same as the NH map. Default is 4.
+        - verbose (bool, optional): If True, print the progress of the refinement. Default is True.
+
+        Returns:
+        - NHResponseModel: The interpolated model.
+        """
+        if not nh_max > nh_min:
+            raise ValueError("nh_max must be larger than nh_min.")
+        step = 10.**-decimals
+        nodes = np.unique(np.round(np.linspace(nh_min, nh_max, max(n_init, 2)), decimals))
+        rows = list(simulate(list(nodes)))
+        model = cls(*zip(*rows))
+        todo = list(zip(model.nh[:-1], model.nh[1:]))
+
+        while todo and len(rows) < max_nodes:
+            mids = []
+            for a, b in todo:
+                mid = np.round(0.5 * (a + b), decimals)
+                if mid - a >= step and b - mid >= step:
+                    mids.append((a, mid, b))
+            mids = mids[:max_nodes - len(rows)]
+            if not mids:
+                break
+
+            new = list(simulate([m for _, m, _ in mids]))
+            predicted = model([m for _, m, _ in mids])
+            todo = []
+            for (a, m, b), row, pred in zip(mids, new, predicted):
+                if abs(pred - row[1]) > rtol * abs(row[1]):
+                    todo += [(a, m), (m, b)]
+            rows += new
+            model = cls(*zip(*rows))
+            if verbose:
+                print("{0} NH nodes simulated, {1} intervals left to refine".format(len(rows), len(todo)))
+
+        return model
+
+    @classmethod
+    def from_table(cls, file_path):
+        """
+        Load the nodes from a simulation results file, e.g., RESULTS_SIM_TM1_0.2-2.3keV_NH_A3391.txt.
+        """
+        table = pd.read_csv(file_path, sep=r'\s+')
+        flux = table['flux'].to_numpy() if 'flux' in table else None
+        expos = table['exp'].to_numpy() if 'exp' in table else None
+        return cls(table['nh'].to_numpy(), table['rate'].to_numpy(), flux, expos)
+
+    def to_table(self, file_path):
+        """
+        Write the nodes with the header "nh rate flux exp" used by the simulation results files.
+        """
+        nan = np.full(len(self.nh), np.nan)
+        flux = nan if self.flux is None else self.flux
+        expos = nan if self.expos is None else self.expos
+        with open(file_path, 'w') as f:
+            f.write('nh rate flux exp\n')
+            for row in zip(self.nh, self.rate, flux, expos):
+                f.write('{0} {1} {2} {3}\n'.format(*row))
+
+    def corr_map(self, nh_map_ine22, nh_ref, rows=1024):
+        """
+        Create the correction map rate(nh_ref) / rate(NH) of an NH map.
+
+        Parameters:
+        - nh_map_ine22 (numpy.ndarray): 2D NH map in units of 1e22 atoms/cm^2.
+        - nh_ref (float): Reference NH value (in 1e22) the map is normalised to.
+        - rows (int, optional): Number of image rows per block. Default is 1024.
+
+        Returns:
+        - numpy.ndarray: Correction map with the same shape as the input (float64).
+        """
+        rate_ref = self(nh_ref)
+        img_corr = np.empty(np.shape(nh_map_ine22), dtype=float)
+        for y0 in range(0, img_corr.shape[0], rows):
+            img_corr[y0:y0 + rows] = rate_ref / self(nh_map_ine22[y0:y0 + rows])
+
+        return img_corr
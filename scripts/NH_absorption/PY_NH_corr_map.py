@@ -1,11 +1,13 @@
 #!/usr/bin/env python3
 
 import argparse
-from astropy.io import fits
 import numpy as np
 import pandas as pd
 import os, subprocess, shutil
-from numba import njit
+from NHCorrection import corr_table, corr_map
+from NHResponse import NHResponseModel
+from ImageIO import open_image, read_header, write_image, COMPRESSION
+import RunTrace
 
 script_version = 0.0
 script_descr="""Create NH correction map.
@@ -23,6 +25,10 @@ parser.add_argument('sim_results',help='NH simulation result, e.g., RESULTS_SIM_
 parser.add_argument('tm',help='which TM?, e.g., TM1')
 parser.add_argument('--low', nargs='+', type=float, help='low E value, e.g., 0.2 or 0.2 1.6')
 parser.add_argument('--hie', nargs='+', type=float, help='high E value, e.g., 2.3 or 1.35 2.3')
+# Optional
+parser.add_argument('--dtype',default=None,help='data type of the correction map (default: float64)')
+parser.add_argument('--compression',default=COMPRESSION,help='tile compression of the correction map: none, auto, gzip or gzip:<level> (quantized) (env PIPELINE_COMPRESSION)')
+parser.add_argument('--interp', default='linear', choices=['linear', 'pchip'], help='interpolation between simulated NH values: linear lookup table or smooth monotonic response model (for adaptive NH grids)')
 
 args = parser.parse_args()
 path = '{}'.format(args.path)  # path to the file
@@ -38,40 +44,29 @@ else:
     suff = "_uni"
 
 ###############
-nh_map = fits.open('{0}/{1}'.format(path, cut_nh_map))
-img = nh_map[0].data    # numpy array
-nh_ar = np.concatenate(img) # get all nH values in one array
+with RunTrace.stage('nh_corr_map', 'PY_NH_corr_map', {'tm': args.tm}):
+    header = read_header('{0}/{1}'.format(path, cut_nh_map))
+    img = open_image('{0}/{1}'.format(path, cut_nh_map))[:]    # numpy array
 
-nh_ar_e22 = nh_ar / 1e22
-nh_ar_e22 = np.unique(np.round(nh_ar_e22, 4))
+    inFile1 = '{0}/{1}'.format(path, sim_results)  # output file from simulation
+    Data1 = pd.read_csv(inFile1, skiprows=[], sep='\s+')
+    nh = Data1['nh'].to_numpy()
+    rate = Data1['rate'].to_numpy()
+    nh_median = np.round(np.median(nh), 4)
+    nh, rate_corr, rate_ref = corr_table(nh, rate, nh_ref=nh_median)  # NEED TO BE MEDIAN NH CR
+    print("median_nh =", nh_median,"e22 atoms/cm^-2.\nCount-rates =", rate_ref, "cts/s\n")
+    img_e22 = img / 1e22
+    img_e22 = np.round(img_e22, 4)
+    print("Relative diff to max rate=", (np.max(rate) - rate_ref) * 100 / rate_ref, "%")
+    print("Relative diff to min rate=", (np.min(rate) - rate_ref) * 100 / rate_ref, "%")
 
-inFile1 = '{0}/{1}'.format(path, sim_results)  # output file from simulation
-Data1 = pd.read_csv(inFile1, skiprows=[], sep='\s+')
-nh = Data1['nh'].to_numpy()
-nh = np.array(np.round(nh, 4))
-rate = Data1['rate'].to_numpy()
-index_nh_median = np.where(nh == np.round(np.median(nh), 4))
-print("median_nh =", nh[index_nh_median][0],"e22 atoms/cm^-2.\nCount-rates =", rate[index_nh_median][0], "cts/s\n")
-rate_corr = rate[index_nh_median]/rate    # NEED TO BE MEDIAN NH CR
-rate_corr = np.array(rate_corr)
-img_e22 = img / 1e22
-img_e22 = np.round(img_e22, 4)
-print("Relative diff to max rate=", (np.max(rate) - rate[index_nh_median]) * 100 / rate[index_nh_median], "%")
-print("Relative diff to min rate=", (np.min(rate) - rate[index_nh_median]) * 100 / rate[index_nh_median], "%")
-
-print("CORRECTING...")
-@njit
-def corr_map(nh_map_ine22):
-    img_corr = nh_map_ine22
-    for z in range(len(nh)):
-        for x in range(len(nh_map_ine22)):
-            for y in range(len(nh_map_ine22)):
-                if nh_map_ine22[x][y] == nh[z]:
-                    img_corr[x][y] = rate_corr[z]
-    return img_corr
-
-nh_corr_map = '{0}_{1}_{2}-{3}keV{4}_CORR_map.fits'.format(args.cut_nh_map, args.tm, args.low[0], args.hie[-1], suff)  # source file name.fits
-print("Putting into fits...")
-nh_map[0].data = corr_map(img_e22)
-nh_map.writeto('{0}/{1}'.format(path, nh_corr_map))
+    print("CORRECTING...")
+    nh_corr_map = '{0}_{1}_{2}-{3}keV{4}_CORR_map.fits'.format(args.cut_nh_map, args.tm, args.low[0], args.hie[-1], suff)  # source file name.fits
+    print("Putting into fits...")
+    if args.interp == 'pchip':
+        # same reference as the lookup table: the median simulated NH printed above
+        img_corr = NHResponseModel.from_table(inFile1).corr_map(img_e22, nh_median)
+    else:
+        img_corr = corr_map(img_e22, nh, rate_corr)
+    write_image('{0}/{1}'.format(path, nh_corr_map), img_corr, header, compression=args.compression, dtype=args.dtype, overwrite=False)
 print("{0} DONE!".format(nh_corr_map))
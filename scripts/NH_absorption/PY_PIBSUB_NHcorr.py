@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+from NHCorrExposure import NHCorrExposure
+from ImageIO import COMPRESSION
+import RunTrace
+
+script_version = 0.0
+script_descr="""
+NH-corrected, PIB-subtracted TM0 count-rate maps (same arguments and final products as SH_PIBSUB-NHcorr.sh).
+The TM8/TM9 CLexpmap and CLexpmap-single images are divided by the NH correction maps on the fly, block by block; the TM9
+correction factors are computed from the sums in a first pass and only the 0BG0_CLCRBGSUB and 0BG0_CLCRBGSUB-single
+..._NHcorr_corr.fits count-rate maps are written in a second pass (no _NHcorr or _NHcorr_corr exposure maps, unless
+--exposures).
+Must be run from the cluster folder (containing filtered/ and log/), after PY_PIBSUB.py or SH_PIBSUB.sh."""
+
+# Open argument parser
+parser = argparse.ArgumentParser(description=script_descr)
+parser.add_argument('--version',action='version',version='%(prog)s v{}'.format(script_version))
+
+# Mandatory (same as SH_PIBSUB-NHcorr.sh)
+parser.add_argument('obs',help='observation name (e.g., sm03, em01)')
+parser.add_argument('cluster',help='cluster name (e.g., A3391)')
+parser.add_argument('proc',help='processing version (e.g., c946, c010, c020)')
+parser.add_argument('lowe8',help='lower energy limit used for TM8, e.g., "0.2" or "0.2 1.5"')
+parser.add_argument('lowe9',help='lower energy limit used for TM9, e.g., "0.8" or "0.8 1.5"')
+parser.add_argument('hie',help='high energy limit of both TM types, e.g., "2.3" or "1.3 2.3"')
+parser.add_argument('nhcormap1',help='NH correction factor map using on-chip filter response files (TM1), without .fits (e.g., AIT_-600_600_cuttoA3391_repr_TM1_0.2-2.3keV_CORR_map)')
+parser.add_argument('nhcormap5',help='NH correction factor map using no on-chip filter response files (TM5), without .fits (e.g., AIT_-600_600_cuttoA3391_repr_TM5_0.8-2.3keV_CORR_map)')
+# Optional
+parser.add_argument('--rows',default=1024,type=int,help='number of image rows per block')
+parser.add_argument('--exposures',action='store_true',help='also write the corrected TM0 exposure maps (0BG0_CLexpmap*_NHcorr_corr.fits)')
+parser.add_argument('--compression',default=COMPRESSION,help='tile compression of the products: none, auto (RICE for integer, lossless GZIP for float images), rice, gzip or gzip:<level> (quantized floats) (env PIPELINE_COMPRESSION)')
+parser.add_argument('--no-log',action='store_true',help='print to the terminal instead of the log/ file')
+
+args = parser.parse_args()
+lowe = args.lowe8.split()
+lowe9 = args.lowe9.split()
+hie = args.hie.split()
+suff = "" if len(lowe) == 1 else "_uni"
+
+cwd = os.getcwd()
+if not args.no_log:
+    if not os.path.isdir('log'):
+        print("Creating log directory... All log files will be here.")
+        os.mkdir('log')
+    else:
+        print("log file will be at log/ dir.")
+    log = open('log/LOG_{0}_{1}_{2}_{3}-{4}keV{5}_PIBSUB_expoNHcorr.log'.format(args.proc, args.obs, args.cluster, lowe[0], hie[-1], suff), 'w')
+    sys.stdout = sys.stderr = log
+
+os.chdir('{0}/filtered/PIBsub_{1}-{2}{3}_combinedtiles'.format(cwd, lowe[0], hie[-1], suff))
+nhcorr = NHCorrExposure(args.proc, args.obs, args.cluster, lowe, lowe9, hie, args.nhcormap1 + '.fits', args.nhcormap5 + '.fits', rows=args.rows, compression=args.compression)
+with RunTrace.stage('nhcorr', 'NHCorrExposure', {'cluster': args.cluster, 'obs': args.obs, 'proc': args.proc}):
+    nhcorr.run(exposures=args.exposures)
+print("Done!")
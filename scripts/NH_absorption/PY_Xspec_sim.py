@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+import argparse
+import os
+from multiprocessing import cpu_count
+from XspecSim import XspecPool, TIMEOUT
+import RunTrace
+
+script_version = 0.0
+script_descr="""
+Simulate a list of NH values into the CXB model (apec + TBabs*(apec + pow)) for TM1 and TM5, replacing Xspec_sim.sh.
+A pool of persistent XSPEC sessions is fed with batches of NH values and the results go straight into
+RESULTS_SIM_TM*_NH_<cluster>.txt. Rerunning after an interruption only simulates the missing NH values."""
+
+# Open argument parser
+parser = argparse.ArgumentParser(description=script_descr)
+parser.add_argument('--version',action='version',version='%(prog)s v{}'.format(script_version))
+
+# Mandatory (same as Xspec_sim.sh)
+parser.add_argument('nh_list',help='list of NH values (in e22), e.g., AIT_-600_600_cuttoA222_repr_LIST.txt')
+parser.add_argument('cluster',help='cluster name, e.g., A222')
+parser.add_argument('low8',help='low E value TM8, e.g., "0.2" or "0.2 1.6"')
+parser.add_argument('low9',help='low E value TM9, e.g., "0.8" or "0.8 1.6"')
+parser.add_argument('hie',help='high E value, e.g., "2.3" or "1.35 2.3"')
+# Optional
+parser.add_argument('--nproc',default=max(1, cpu_count() // 4),type=int,help='number of XSPEC sessions')
+parser.add_argument('--batch',default=16,type=int,help='number of NH values sent to a session at once')
+parser.add_argument('--backend',default='cli',choices=['cli', 'pyxspec'],help='xspec executable or PyXspec')
+parser.add_argument('--timeout',default=TIMEOUT,type=float,help='seconds allowed per NH value before a hung XSPEC session is killed')
+parser.add_argument('--responses',default='.',help='directory of the RMF/ARF files')
+
+args = parser.parse_args()
+low8 = args.low8.split()
+low9 = args.low9.split()
+hie = args.hie.split()
+tms = (1, 5)
+band = (low8, low9)
+
+if len(hie) == 1:
+    suff = ""
+else:
+    suff = "_uni"
+
+with open(args.nh_list) as f:
+    nh_values = [float(line) for line in f if line.strip()]
+
+print("model apec + TBabs*(apec + pow)")
+print("Abundance table: Asplund")
+outdir = 'filtered/PIBsub_{0}-{1}{2}_combinedtiles'.format(low8[0], hie[-1], suff)
+for tm, low in zip(tms, band):
+    results = 'RESULTS_SIM_TM{0}_{1}-{2}keV{3}_NH_{4}.txt'.format(tm, low[0], hie[-1], suff, args.cluster)
+    partial = '{0}.part'.format(results)
+    print("Simulating {0} NH values for TM{1} with {2} XSPEC sessions...".format(len(nh_values), tm, args.nproc))
+    with RunTrace.stage('xspec_sim', 'XspecPool', {'cluster': args.cluster, 'tm': tm}):
+        with XspecPool(tm, [float(x) for x in low], [float(x) for x in hie], nproc=args.nproc, batch=args.batch,
+                       backend=args.backend, response_dir=args.responses, timeout=args.timeout) as pool:
+            rows = pool.run(nh_values, table=partial, verbose=True)
+
+    print("Compiling simulation results {0}".format(results))
+    with open('{0}/{1}'.format(outdir, results), 'w') as f:
+        f.write('nh rate flux exp\n')
+        for row in sorted(rows):
+            f.write('{0} {1} {2} {3}\n'.format(*row))
+    os.remove(partial)
+print("DONE!")
@@ -1,13 +1,15 @@
 #!/usr/bin/env python3
 import argparse
-from astropy.io import fits
-from astropy.nddata import Cutout2D
-from astropy.wcs import WCS, FITSFixedWarning
-from reproject import reproject_interp
+import os
+from multiprocessing import cpu_count
+from TiledReproject import reproject_tiled
+from ImageIO import read_header, COMPRESSION
 
 script_version = 'Feb2323'
 script_descr="""
-cut and reproject all-sky NH map (i.e., AIT_-600_600.fits from HI4PI paper https://ui.adsabs.harvard.edu/abs/2016A%26A...594A.116H/abstract) into the observation. Output example: AIT_-600_600_cuttoA548_repr.fits."""
+cut and reproject all-sky NH map (i.e., AIT_-600_600.fits from HI4PI paper https://ui.adsabs.harvard.edu/abs/2016A%26A...594A.116H/abstract) into the observation. Output example: AIT_-600_600_cuttoA548_repr.fits.
+The NH map is first cut to the footprint of the observation (plus a margin), then reprojected in tiles by a pool of processes
+into a memory-mapped output file. With a cache directory, maps already reprojected onto the same WCS are copied from the cache."""
 
 # Open argument parser
 parser = argparse.ArgumentParser(description=script_descr)
@@ -19,17 +21,24 @@ parser.add_argument('path',help='path to file')
 # parser.add_argument('nh_map',help='The name of the all-sky NH map, e.g., AIT_-600_600')
 parser.add_argument('obs_name',help='The name of an observation image, e.g., c001_allobs_es201009_0BG0_CLCRBGSUB-single_0308-2keV')
 parser.add_argument('cluster',help="Cluster's name")
+# Optional
+parser.add_argument('--nh-map',default='/vol/erosita1/data1/averonica/SHARE/Script/AIT_-600_600.fits',help='all-sky NH map')
+parser.add_argument('--tile',default=1024,type=int,help='size of the reprojected tiles in pixels')
+parser.add_argument('--nproc',default=max(1, cpu_count() // 4),type=int,help='number of processes')
+parser.add_argument('--margin',default=8,type=int,help='margin (NH map pixels) kept around the footprint')
+parser.add_argument('--dtype',default='float64',help='data type of the reprojected map (e.g., float32)')
+parser.add_argument('--compression',default=COMPRESSION,help='tile compression of the reprojected map: none, auto, gzip or gzip:<level> (quantized) (env PIPELINE_COMPRESSION)')
+parser.add_argument('--cache-dir',default=os.environ.get('REPROJECT_CACHE'),help='cache of reprojected maps keyed by the target WCS (env REPROJECT_CACHE)')
 
 args = parser.parse_args()
 path = '{}'.format(args.path)  # path to the file
 cluster = '{}'.format(args.cluster)
 eROSITA_image = '{}.fits'.format(args.obs_name)  # source file name.fits
-nH_map = 'AIT_-600_600.fits' # allsky NH map from HI4PI # .format(args.nh_map)
+nH_map = args.nh_map  # allsky NH map from HI4PI
 cut_repr_nh_map = 'AIT_-600_600_cutto{0}_repr.fits'.format(args.cluster)  # cut/cropped file name.fits
 
-hdu = fits.open('/vol/erosita1/data1/averonica/SHARE/Script/{0}'.format(nH_map))[0]
-hdu_eRO = fits.open('{0}/{1}'.format(path, eROSITA_image))[0]
-array, footprint = reproject_interp(hdu, hdu_eRO.header)
-fits.writeto('{0}/{1}'.format(path, cut_repr_nh_map ), array, hdu_eRO.header, overwrite=True)
+header_eRO = read_header('{0}/{1}'.format(path, eROSITA_image))
+reproject_tiled(nH_map, header_eRO, '{0}/{1}'.format(path, cut_repr_nh_map), tile=args.tile, nproc=args.nproc,
+                margin=args.margin, cache_dir=args.cache_dir, dtype=args.dtype, compression=args.compression)
 
 print("DONE!")
@@ -1,17 +1,21 @@
 #!/usr/bin/env python3
 import argparse
-import requests
-from bs4 import BeautifulSoup
+import os
 from astropy import wcs
 from astropy.io import fits
 import numpy as np
-from multiprocessing import Pool, cpu_count
+from multiprocessing import cpu_count
 from tqdm import tqdm
 import math
+from NHGrid import box_grid, block_fill, interp_fill
+from NH2Provider import SwiftNH2Provider, AsyncSwiftNH2Provider, WillingaleNH2Provider, NH2Cache, CachedNH2Provider
 
 script_version = 'Apr2624'
 script_descr="""
 Script to query 2NH2 weighted values from https://www.swift.ac.uk/analysis/nhtot/donhtot.php and add it with NHI map to create a NHtot map.
+Values are kept in a persistent cache keyed by rounded (RA, Dec), so reruns over overlapping fields do not query the page again.
+With --provider willingale the values are computed locally from HI and E(B-V) maps.
+The whole map is covered, including the partial boxes at the right and top edges.
 A. Veronica
 """
 # Open argument parser
@@ -22,107 +26,94 @@ parser.add_argument('--version',action='version',version='%(prog)s v{}'.format(s
 parser.add_argument('path',help='path to file')
 parser.add_argument('nh_map',help='The name of the cut and reprojected NHI map, e.g., AIT_-600_600')
 parser.add_argument('cluster',help="Cluster's name")
+# Optional
+parser.add_argument('--provider',default='swift',choices=['swift', 'swift-async', 'willingale'],help='source of the NH2 weighted values')
+parser.add_argument('--cache',default=os.environ.get('NH2W_CACHE', os.path.expanduser('~/.cache/NH2w_cache.sqlite')),help='persistent NH2 cache file (env NH2W_CACHE)')
+parser.add_argument('--cache-decimals',default=2,type=int,help='rounding of RA/Dec (deg) in the cache')
+parser.add_argument('--no-cache',action='store_true',help='do not use the NH2 cache')
+parser.add_argument('--hi-map',help='NHI map (cm^-2) for --provider willingale')
+parser.add_argument('--ebv-map',help='E(B-V) map (mag) for --provider willingale')
+parser.add_argument('--nproc',default=max(1, int(cpu_count() / 4)),type=int,help='number of processes querying the Swift page')
+parser.add_argument('--url',default=None,help='URL of the nhtot page (e.g., a local stand-in server)')
+parser.add_argument('--concurrency',default=8,type=int,help='requests in flight for --provider swift-async')
+parser.add_argument('--rate',default=None,type=float,help='maximum requests per second for --provider swift-async')
+parser.add_argument('--retries',default=4,type=int,help='retries of a failed request for --provider swift-async')
+parser.add_argument('--fill',default='block',choices=['block', 'interp'],help='constant NH2 per box, or bilinear interpolation between box centres')
+parser.add_argument('--allow-missing',action='store_true',help='write the NHtot map even if some boxes could not be fetched (left as NaN)')
 
 args = parser.parse_args()
 path = f'{args.path}'
 fits_file = f'{path}/{args.nh_map}'
 cluster = f'{args.cluster}'
 
-x_start = 0
-y_start = 0
 box_size_d = 3.5 / 60  # resolution of the sampled grid in degree
 
 # Load the FITS file
 hdul = fits.open(fits_file)
 hdu = hdul[0].data
 prihdr = hdul[0].header
-w = wcs.WCS(prihdr, relax=False)
-im_size = prihdr['NAXIS1']
+w = wcs.WCS(prihdr, relax=False).celestial
 pixsize = prihdr['CDELT2']  # in degree
 box_size = math.floor(box_size_d / pixsize)
 
-n = math.floor(im_size/box_size)
 #nh2_out = f'NH2_Willingale_{box_size}x{box_size}box'
 file_out= f'NHtot_{cluster}_{box_size}x{box_size}box'
 
-def query_nh2_weighted_value(ra_deg, dec_deg):
-    url = "https://www.swift.ac.uk/analysis/nhtot/donhtot.php"
-    payload = {
-        "Coords": f"{ra_deg}, {dec_deg}",
-        "equinox": "2000",
-        "submit": "Calculate NH"
-    }
-    response = requests.post(url, data=payload)
-    if response.ok:
-        # Extract NH2 weighted value from response content
-        nh2_weighted_value = extract_nh2_weighted_value(response.text)
-        return nh2_weighted_value
-    else:
-        print("Failed to retrieve NH2 weighted value.")
-        return None
-
-
-def extract_nh2_weighted_value(html_content):
-    # Parse the HTML content to extract NH2 weighted value
-    soup = BeautifulSoup(html_content, "html.parser")
-    nh2_weighted_element = soup.find("td", headers="h2w")
-    if nh2_weighted_element:
-        nh2_weighted_value = nh2_weighted_element.text.strip()
-        # Replace '×' with 'e+'
-        nh2_weighted_value = nh2_weighted_value.replace(' ×10', 'e+')
-        return nh2_weighted_value
-    else:
-        print("NH2 weighted value not found on the page.")
-        return None
-
-
-ra_cen = []
-dec_cen = []
-x_cen = []
-y_cen = []
-for i in range(n):
-    for j in range(n):
-        pixim_ra_i, pixim_dec_i = x_start + (i+0.5)*box_size, y_start + (j+0.5)*box_size
-        radec_i = w.pixel_to_world_values(pixim_ra_i, pixim_dec_i)
-        #ra_i, dec_i = radec_i[0], radec_i[1]
-        ra_cen.append(radec_i[0])
-        dec_cen.append(radec_i[1])
-        x_cen.append(pixim_ra_i)
-        y_cen.append(pixim_dec_i)
-
-print(len(x_cen))
-
-
-# Define the process_pixel function
-def process_pixel(coords):
-    ra, dec = coords
-    nh_pix = query_nh2_weighted_value(ra, dec)
-    #print(ra, dec, nh_pix)
-    return nh_pix
-
-
-print("Getting NH2_weighted from Swift webpage...")
-# Define the number of processes to be equal to the number of available CPU cores
-num_processes = int(cpu_count() / 4)
-print(num_processes)
-# Parallelize processing of pixel coordinates
-with Pool(processes=num_processes) as pool:
-    # Use tqdm to create a progress bar
-    with tqdm(total=len(ra_cen)) as pbar:
-        nh2_ar = []
-        for nh_pix in pool.imap(process_pixel, zip(ra_cen, dec_cen)):
-            nh2_ar.append(nh_pix)
-            pbar.update(1)
+# Box centres (edge boxes included) in one WCS call
+ra_grid, dec_grid, xc, yc = box_grid(w, hdu.shape, box_size)
+ra_cen, dec_cen = list(ra_grid.ravel()), list(dec_grid.ravel())
+x_grid, y_grid = np.meshgrid(xc, yc)
+x_cen, y_cen = x_grid.ravel(), y_grid.ravel()
+
+print(f"{len(x_cen)} boxes ({len(yc)} x {len(xc)})")
+
+
+url = {'url': args.url} if args.url else {}
+if args.provider == 'swift':
+    provider = SwiftNH2Provider(nproc=args.nproc, **url)
+elif args.provider == 'swift-async':
+    provider = AsyncSwiftNH2Provider(concurrency=args.concurrency, rate=args.rate, retries=args.retries,
+                                     checkpoint=f'{path}/{file_out}_checkpoint.jsonl', **url)
+else:
+    if not (args.hi_map and args.ebv_map):
+        parser.error('--provider willingale needs --hi-map and --ebv-map')
+    provider = WillingaleNH2Provider(args.hi_map, args.ebv_map)
+if not args.no_cache:
+    provider = CachedNH2Provider(provider, NH2Cache(args.cache, decimals=args.cache_decimals, source='swift' if args.provider.startswith('swift') else args.provider))
+
+print(f"Getting NH2_weighted ({args.provider})...")
+chunk = 256
+with tqdm(total=len(ra_cen)) as pbar:
+    nh2_ar = []
+    for k in range(0, len(ra_cen), chunk):
+        nh2_ar += provider.query_many(ra_cen[k:k + chunk], dec_cen[k:k + chunk])
+        pbar.update(len(ra_cen[k:k + chunk]))
+if not args.no_cache:
+    print(f"{provider.hits} values from cache {args.cache}, {provider.misses} queried")
+provider.close()
 
 print("Done!")
 
-hdu0 = np.copy(hdu) * 0
+nh2_ar = np.array([np.nan if v is None else v for v in nh2_ar], dtype=float)
+missing = np.flatnonzero(np.isnan(nh2_ar))
+missing_out = f'{path}/{file_out}_missing.txt'
+if len(missing):
+    with open(missing_out, 'w') as f:
+        f.write('x_cen y_cen ra dec\n')
+        for k in missing:
+            f.write(f'{x_cen[k]} {y_cen[k]} {ra_cen[k]} {dec_cen[k]}\n')
+    print(f"{len(missing)} of {len(nh2_ar)} boxes could not be fetched ===> {missing_out}")
+    if not args.allow_missing:
+        raise SystemExit("Rerun to fetch the missing boxes (the fetched ones are cached), or use --allow-missing to leave them as NaN.")
+elif os.path.exists(missing_out):
+    os.remove(missing_out)
+
 print("Fill the map...")
-for i in range(len(x_cen)):
-    x_i_min, x_i_max = x_cen[i] - box_size / 2, x_cen[i] + box_size / 2
-    y_i_min, y_i_max = y_cen[i] - box_size / 2, y_cen[i] + box_size / 2
-    # Fill the square region in hdu0 with the corresponding erobub_rate_soft value
-    hdu0[int(y_i_min):int(y_i_max), int(x_i_min):int(x_i_max)] = nh2_ar[i]
+nh2_grid = nh2_ar.reshape(len(yc), len(xc))
+if args.fill == 'interp':
+    hdu0 = interp_fill(nh2_grid, xc, yc, hdu.shape).astype(hdu.dtype)
+else:
+    hdu0 = block_fill(nh2_grid, hdu.shape, box_size).astype(hdu.dtype)
 
 # Save NH2 values to FITS file
 print("Saving NH2 to map...")
@@ -5,11 +5,16 @@ from astropy.io import fits
 import numpy as np
 import pandas as pd
 import os, subprocess, shutil
+from multiprocessing import cpu_count
+from NHResponse import NHResponseModel
+from XspecSim import XspecPool
 # from numba import njit
 
 script_version = 0.0
 script_descr="""
-List NH values of a given NH map and simulate them into CXB model in XSPEC via Xspec_sim.sh script."""
+List NH values of a given NH map and simulate them into CXB model in XSPEC via PY_Xspec_sim.py script.
+With --adaptive, only a small adaptive grid of NH nodes covering the range of the map is simulated and
+written as the simulation results (interpolate them with PY_NH_corr_map.py --interp pchip)."""
 
 # Open argument parser
 parser = argparse.ArgumentParser(description=script_descr)
@@ -23,6 +28,12 @@ parser.add_argument('cluster',help='cluster name, e.g., A222')
 parser.add_argument('--lo8', nargs='+', type=float, help='low E value TM8, e.g., 0.2 or 0.2 1.6')
 parser.add_argument('--lo9', nargs='+', type=float, help='low E value TM9, e.g., 0.8 or 0.8 1.6')
 parser.add_argument('--hi', nargs='+', type=float, help='high E value, e.g., 2.3 or 1.35 2.3')
+# Optional
+parser.add_argument('--nproc', default=max(1, cpu_count() // 4), type=int, help='number of parallel XSPEC sessions')
+parser.add_argument('--adaptive', action='store_true', help='simulate an adaptive grid of NH nodes instead of every NH value')
+parser.add_argument('--rtol', default=1e-3, type=float, help='relative tolerance of the interpolated rate (adaptive mode)')
+parser.add_argument('--max-nodes', default=64, type=int, help='maximum number of simulated NH nodes per TM (adaptive mode)')
+parser.add_argument('--responses', default='.', help='directory of the RMF/ARF files (adaptive mode)')
 
 args = parser.parse_args()
 path = '{}'.format(args.path)  # path to the file
@@ -41,13 +52,30 @@ nh_ar_e22 = nh_ar / 1e22
 nh_ar_e22 = np.unique(np.round(nh_ar_e22, 4))
 nh_ar_e22 = nh_ar_e22[~np.isnan(nh_ar_e22)]
 
-with open('{0}'.format(list_nh_map), 'w') as f:  # print the NHe22 in text file
-    for item in nh_ar_e22:
-        f.write("%s\n" % item)
+if args.adaptive:
+    if len(hie) == 1:
+        suff = ""
+    else:
+        suff = "_uni"
+    outdir = 'filtered/PIBsub_{0}-{1}{2}_combinedtiles'.format(low8[0], hie[-1], suff)
+    nh_min, nh_max = nh_ar_e22[0], max(nh_ar_e22[-1], nh_ar_e22[0] + 1e-4)
+    print("Simulating an adaptive NH grid between {0} and {1} e22...".format(nh_min, nh_max))
+    for tm_i, low in ((1, low8), (5, low9)):
+        print("TM{0}, energy band {1}-{2} keV".format(tm_i, " ".join("{}".format(x) for x in low), " ".join("{}".format(x) for x in hie)))
+        with XspecPool(tm_i, low, hie, nproc=args.nproc, batch=1, response_dir=args.responses) as pool:
+            model = NHResponseModel.from_simulation(pool, nh_min, nh_max, rtol=args.rtol, max_nodes=args.max_nodes)
+        results = 'RESULTS_SIM_TM{0}_{1}-{2}keV{3}_NH_{4}.txt'.format(tm_i, low[0], hie[-1], suff, cluster)
+        model.to_table('{0}/{1}'.format(outdir, results))
+        print("{0} NH nodes ===> {1}/{2}".format(len(model), outdir, results))
+    print("DONE!")
+else:
+    with open('{0}'.format(list_nh_map), 'w') as f:  # print the NHe22 in text file
+        for item in nh_ar_e22:
+            f.write("%s\n" % item)
 
-print("{0} is created!\n".format(list_nh_map))
+    print("{0} is created!\n".format(list_nh_map))
 
-print("Running simulation for {0} NH values...".format(len(nh_ar_e22)))
-print("Energy band {0}({1})-{2} keV".format(" ".join("{}".format(x) for x in low8), " ".join("{}".format(x) for x in low9), " ".join("{}".format(x) for x in hie)))
+    print("Running simulation for {0} NH values...".format(len(nh_ar_e22)))
+    print("Energy band {0}({1})-{2} keV".format(" ".join("{}".format(x) for x in low8), " ".join("{}".format(x) for x in low9), " ".join("{}".format(x) for x in hie)))
 
-p1 = subprocess.call('./Xspec_sim.sh {0} {1} "{2}" "{3}" "{4}"'.format(list_nh_map, cluster, " ".join("{}".format(x) for x in low8), " ".join("{}".format(x) for x in low9), " ".join("{}".format(x) for x in hie)), shell=True)
+    p1 = subprocess.call('./PY_Xspec_sim.py {0} {1} "{2}" "{3}" "{4}" --nproc {5}'.format(list_nh_map, cluster, " ".join("{}".format(x) for x in low8), " ".join("{}".format(x) for x in low9), " ".join("{}".format(x) for x in hie), args.nproc), shell=True)
@@ -50,23 +50,48 @@ exec 3>&1 4>&2
 trap 'exec 2>&4 1>&3' 0 1 2 3
 exec 1>log/LOG_${procver}_${obs}_${cluster}_${lowe[0]}-${hie[-1]}keV${suff}_PIBSUB_expoNHcorr.log 2>&1
 
+# PIPELINE_TRACE=<file.jsonl>: record wall/CPU time, peak memory and I/O of each tool run ($ ./PY_trace.py report <file>)
+# PY_trace.py is beside this script (copies in the working folder), else in $PIPELINE_SCRIPTS/filtering_and_pib_sub
+# (default: filtering_and_pib_sub/ of the repository of this script)
+here=$(dirname "$(realpath "$0")")
+pytrace=$here/PY_trace.py
+[ -f "$pytrace" ] || pytrace=${PIPELINE_SCRIPTS:-$here/..}/filtering_and_pib_sub/PY_trace.py
+trace=""
+if [ -n "${PIPELINE_TRACE}" ]
+then
+    export PIPELINE_TRACE=$(realpath -m ${PIPELINE_TRACE})
+    export PIPELINE_TRACE_TAGS="cluster=${cluster} obs=${obs} proc=${procver}"
+    trace="$pytrace run --stage nhcorr --"
+fi
+
+# image HDU of an input: <file>[1] for the images tile-compressed by the Python stages (PIPELINE_COMPRESSION, empty primary
+# HDU followed by the compressed image), else <file>
+img() {
+    if head -c 5760 "$1" 2>/dev/null | grep -aq 'ZIMAGE  = *T'
+    then
+        echo "$1[1]"
+    else
+        echo "$1"
+    fi
+}
+
 cd $cwd/filtered/PIBsub_${lowe[0]}-${hie[-1]}${suff}_combinedtiles
 
 echo -e "\nCreating NHcorr exposure map: TM8"
-farith ${procver}_${obs}_${cluster}_combined_tiles_8_CLexpmap_${lowe[0]}-${hie[-1]}keV${suff}.fits ${nhcorrmaptm1}.fits ${procver}_${obs}_${cluster}_combined_tiles_8_CLexpmap_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr.fits DIV blank=0 clobber=yes
+$trace farith "$(img ${procver}_${obs}_${cluster}_combined_tiles_8_CLexpmap_${lowe[0]}-${hie[-1]}keV${suff}.fits)" "$(img ${nhcorrmaptm1}.fits)" ${procver}_${obs}_${cluster}_combined_tiles_8_CLexpmap_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr.fits DIV blank=0 clobber=yes
 
-farith ${procver}_${obs}_${cluster}_combined_tiles_8_CLexpmap-single_${lowe[0]}-${hie[-1]}keV${suff}.fits ${nhcorrmaptm1}.fits ${procver}_${obs}_${cluster}_combined_tiles_8_CLexpmap-single_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr.fits DIV blank=0 clobber=yes
+$trace farith "$(img ${procver}_${obs}_${cluster}_combined_tiles_8_CLexpmap-single_${lowe[0]}-${hie[-1]}keV${suff}.fits)" "$(img ${nhcorrmaptm1}.fits)" ${procver}_${obs}_${cluster}_combined_tiles_8_CLexpmap-single_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr.fits DIV blank=0 clobber=yes
 
 echo -e "\nCreating NHcorr exposure map: TM9"
-farith ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap_${lowe9[0]}-${hie[-1]}keV${suff}.fits ${nhcorrmaptm5}.fits ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap_${lowe9[0]}-${hie[-1]}keV${suff}_NHcorr.fits DIV blank=0 clobber=yes
+$trace farith "$(img ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap_${lowe9[0]}-${hie[-1]}keV${suff}.fits)" "$(img ${nhcorrmaptm5}.fits)" ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap_${lowe9[0]}-${hie[-1]}keV${suff}_NHcorr.fits DIV blank=0 clobber=yes
 
-farith ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap-single_${lowe9[0]}-${hie[-1]}keV${suff}.fits ${nhcorrmaptm5}.fits ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap-single_${lowe9[0]}-${hie[-1]}keV${suff}_NHcorr.fits DIV blank=0 clobber=yes
+$trace farith "$(img ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap-single_${lowe9[0]}-${hie[-1]}keV${suff}.fits)" "$(img ${nhcorrmaptm5}.fits)" ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap-single_${lowe9[0]}-${hie[-1]}keV${suff}_NHcorr.fits DIV blank=0 clobber=yes
 
 echo -e "\nCalculating correction factor for exposuremap-NHcorr TM9..."
-totevBGSUB8=$(ftstat ${procver}_${obs}_${cluster}_combined_tiles_8_CLevlistBGSUB_${lowe[0]}-${hie[-1]}keV${suff}.fits > /dev/null && pget ftstat sum | awk '{printf "%.5f\n", $1}')
-totevBGSUB9=$(ftstat ${procver}_${obs}_${cluster}_combined_tiles_9_CLevlistBGSUB_${lowe9[0]}-${hie[-1]}keV${suff}.fits > /dev/null && pget ftstat sum | awk '{printf "%.5f\n", $1}')
-totexp8=$(ftstat ${procver}_${obs}_${cluster}_combined_tiles_8_CLexpmap_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr.fits > /dev/null && pget ftstat sum | awk '{printf "%.5f\n", $1}')
-totexp9=$(ftstat ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap_${lowe9[0]}-${hie[-1]}keV${suff}_NHcorr.fits > /dev/null && pget ftstat sum | awk '{printf "%.5f\n", $1}')
+totevBGSUB8=$($trace ftstat "$(img ${procver}_${obs}_${cluster}_combined_tiles_8_CLevlistBGSUB_${lowe[0]}-${hie[-1]}keV${suff}.fits)" > /dev/null && pget ftstat sum | awk '{printf "%.5f\n", $1}')
+totevBGSUB9=$($trace ftstat "$(img ${procver}_${obs}_${cluster}_combined_tiles_9_CLevlistBGSUB_${lowe9[0]}-${hie[-1]}keV${suff}.fits)" > /dev/null && pget ftstat sum | awk '{printf "%.5f\n", $1}')
+totexp8=$($trace ftstat "$(img ${procver}_${obs}_${cluster}_combined_tiles_8_CLexpmap_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr.fits)" > /dev/null && pget ftstat sum | awk '{printf "%.5f\n", $1}')
+totexp9=$($trace ftstat "$(img ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap_${lowe9[0]}-${hie[-1]}keV${suff}_NHcorr.fits)" > /dev/null && pget ftstat sum | awk '{printf "%.5f\n", $1}')
 corr=$(awk "BEGIN {printf \"%.7f\n\", ($totevBGSUB9 / $totevBGSUB8) * ($totexp8 / $totexp9)}")
 echo "total counts in CLevlistBGSUB_8: ${totevBGSUB8}"
 echo "total counts in CLevlistBGSUB_9: ${totevBGSUB9}"
@@ -75,21 +100,21 @@ echo "total exposure in CLexp_9_NHcorr: ${totexp9}"
 echo "correction factor (count-rate_9/count-rate_8): ${corr}"
 
 echo "Correcting ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap_${lowe9[0]}-${hie[-1]}keV${suff}.fits..."
-fcarith ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap_${lowe9[0]}-${hie[-1]}keV${suff}_NHcorr.fits ${corr} ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap_${lowe9[0]}-${hie[-1]}keV${suff}_NHcorr_corr.fits MUL clobber=yes
+$trace fcarith "$(img ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap_${lowe9[0]}-${hie[-1]}keV${suff}_NHcorr.fits)" ${corr} ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap_${lowe9[0]}-${hie[-1]}keV${suff}_NHcorr_corr.fits MUL clobber=yes
 echo "===> ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap_${lowe9[0]}-${hie[-1]}keV${suff}_NHcorr_corr.fits is created!"
 
-farith ${procver}_${obs}_${cluster}_combined_tiles_8_CLexpmap_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr.fits ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap_${lowe9[0]}-${hie[-1]}keV${suff}_NHcorr_corr.fits ${procver}_${obs}_${cluster}_combined_tiles_0BG0_CLexpmap_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr_corr.fits ADD clobber=yes
+$trace farith "$(img ${procver}_${obs}_${cluster}_combined_tiles_8_CLexpmap_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr.fits)" "$(img ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap_${lowe9[0]}-${hie[-1]}keV${suff}_NHcorr_corr.fits)" ${procver}_${obs}_${cluster}_combined_tiles_0BG0_CLexpmap_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr_corr.fits ADD clobber=yes
 echo "===> corrected TM0 expoosure mape ${procver}_${obs}_${cluster}_combined_tiles_0BG0_CLexpmap_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr_corr.fits is created!"
 
 echo "PIB-subtracted, exposure corrected, all TMs combined in ${lowe[0]}-${hie[-1]}${suff} keV with seven on-chip TM's effective area:"
-farith ${procver}_${obs}_${cluster}_combined_tiles_0_CLevlistBGSUB_${lowe}${lowe9[0]}-${hie[-1]}keV${suff}.fits ${procver}_${obs}_${cluster}_combined_tiles_0BG0_CLexpmap_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr_corr.fits ${procver}_${obs}_${cluster}_combined_tiles_0BG0_CLCRBGSUB_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr_corr.fits DIV clobber=yes blank=0
+$trace farith "$(img ${procver}_${obs}_${cluster}_combined_tiles_0_CLevlistBGSUB_${lowe}${lowe9[0]}-${hie[-1]}keV${suff}.fits)" "$(img ${procver}_${obs}_${cluster}_combined_tiles_0BG0_CLexpmap_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr_corr.fits)" ${procver}_${obs}_${cluster}_combined_tiles_0BG0_CLCRBGSUB_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr_corr.fits DIV clobber=yes blank=0
 echo "===> ${procver}_${obs}_${cluster}_combined_tiles_0BG0_CLCRBGSUB_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr_corr.fits is created!"
 
 echo -e "\nCalculating correction factor for exposuremap-single_NHcorr TM9..."
-totevBGSUB8=$(ftstat ${procver}_${obs}_${cluster}_combined_tiles_8_CLevlistBGSUB_${lowe[0]}-${hie[-1]}keV${suff}.fits > /dev/null && pget ftstat sum | awk '{printf "%.5f\n", $1}')
-totevBGSUB9=$(ftstat ${procver}_${obs}_${cluster}_combined_tiles_9_CLevlistBGSUB_${lowe9[0]}-${hie[-1]}keV${suff}.fits > /dev/null && pget ftstat sum | awk '{printf "%.5f\n", $1}')
-totexps8=$(ftstat ${procver}_${obs}_${cluster}_combined_tiles_8_CLexpmap-single_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr.fits > /dev/null && pget ftstat sum | awk '{printf "%.5f\n", $1}')
-totexps9=$(ftstat ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap-single_${lowe9[0]}-${hie[-1]}keV${suff}_NHcorr.fits > /dev/null && pget ftstat sum | awk '{printf "%.5f\n", $1}')
+totevBGSUB8=$($trace ftstat "$(img ${procver}_${obs}_${cluster}_combined_tiles_8_CLevlistBGSUB_${lowe[0]}-${hie[-1]}keV${suff}.fits)" > /dev/null && pget ftstat sum | awk '{printf "%.5f\n", $1}')
+totevBGSUB9=$($trace ftstat "$(img ${procver}_${obs}_${cluster}_combined_tiles_9_CLevlistBGSUB_${lowe9[0]}-${hie[-1]}keV${suff}.fits)" > /dev/null && pget ftstat sum | awk '{printf "%.5f\n", $1}')
+totexps8=$($trace ftstat "$(img ${procver}_${obs}_${cluster}_combined_tiles_8_CLexpmap-single_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr.fits)" > /dev/null && pget ftstat sum | awk '{printf "%.5f\n", $1}')
+totexps9=$($trace ftstat "$(img ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap-single_${lowe9[0]}-${hie[-1]}keV${suff}_NHcorr.fits)" > /dev/null && pget ftstat sum | awk '{printf "%.5f\n", $1}')
 corrs=$(awk "BEGIN {printf \"%.7f\n\", ($totevBGSUB9 / $totevBGSUB8) * ($totexps8 / $totexps9)}")
 echo "total counts in CLevlistBGSUB_8: ${totevBGSUB8}"
 echo "total counts in CLevlistBGSUB_9: ${totevBGSUB9}"
@@ -98,14 +123,14 @@ echo "total exposure in CLexp_9_NHcorr: ${totexps9}"
 echo "correction factor (count-rate_9/count-rate_8): ${corrs}"
 
 echo "Correcting ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap-single_${lowe9[0]}-${hie[-1]}keV${suff}_NHcorr.fits..."
-fcarith ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap-single_${lowe9[0]}-${hie[-1]}keV${suff}_NHcorr.fits ${corrs} ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap-single_${lowe9[0]}-${hie[-1]}keV${suff}_NHcorr_corr.fits MUL clobber=yes
+$trace fcarith "$(img ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap-single_${lowe9[0]}-${hie[-1]}keV${suff}_NHcorr.fits)" ${corrs} ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap-single_${lowe9[0]}-${hie[-1]}keV${suff}_NHcorr_corr.fits MUL clobber=yes
 echo "===> ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap-single_${lowe9[0]}-${hie[-1]}keV${suff}_NHcorr_corr.fits is created!"
 
-farith ${procver}_${obs}_${cluster}_combined_tiles_8_CLexpmap-single_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr.fits ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap-single_${lowe9[0]}-${hie[-1]}keV${suff}_NHcorr_corr.fits ${procver}_${obs}_${cluster}_combined_tiles_0BG0_CLexpmap-single_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr_corr.fits ADD clobber=yes
+$trace farith "$(img ${procver}_${obs}_${cluster}_combined_tiles_8_CLexpmap-single_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr.fits)" "$(img ${procver}_${obs}_${cluster}_combined_tiles_9_CLexpmap-single_${lowe9[0]}-${hie[-1]}keV${suff}_NHcorr_corr.fits)" ${procver}_${obs}_${cluster}_combined_tiles_0BG0_CLexpmap-single_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr_corr.fits ADD clobber=yes
 echo "===> corrected TM0 expoosure mape ${procver}_${obs}_${cluster}_combined_tiles_0BG0_CLexpmap-single_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr_corr.fits is created!"
 
 echo "PIB-subtracted, exposure corrected, all TMs combined in ${lowe[0]}-${hie[-1]}${suff} keV with one single on-chip TM's effective area:"
-farith ${procver}_${obs}_${cluster}_combined_tiles_0_CLevlistBGSUB_${lowe}${lowe9[0]}-${hie[-1]}keV${suff}.fits ${procver}_${obs}_${cluster}_combined_tiles_0BG0_CLexpmap-single_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr_corr.fits ${procver}_${obs}_${cluster}_combined_tiles_0BG0_CLCRBGSUB-single_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr_corr.fits DIV clobber=yes blank=0
+$trace farith "$(img ${procver}_${obs}_${cluster}_combined_tiles_0_CLevlistBGSUB_${lowe}${lowe9[0]}-${hie[-1]}keV${suff}.fits)" "$(img ${procver}_${obs}_${cluster}_combined_tiles_0BG0_CLexpmap-single_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr_corr.fits)" ${procver}_${obs}_${cluster}_combined_tiles_0BG0_CLCRBGSUB-single_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr_corr.fits DIV clobber=yes blank=0
 echo "===> ${procver}_${obs}_${cluster}_combined_tiles_0BG0_CLCRBGSUB-single_${lowe[0]}-${hie[-1]}keV${suff}_NHcorr_corr.fits is created!"
 
 echo "Done!"
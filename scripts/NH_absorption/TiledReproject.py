@@ -0,0 +1,162 @@
+import hashlib
+import os
+import shutil
+from multiprocessing import Pool
+
+import numpy as np
+from astropy.io import fits
+from astropy.wcs import WCS
+
+from ImageIO import create_image, compression_kwargs, COMPRESSION
+
+
+def target_key(header, input_file, order='bilinear'):
+    """
+    Hash identifying a reprojection: target WCS and shape, input map (path, size, mtime) and interpolation order.
+
+    Parameters:
+    - header (astropy.io.fits.Header): Header of the target image.
+    - input_file (str): Path to the input map.
+    - order (str, optional): Interpolation order of reproject_interp. Default is 'bilinear'.
+
+    Returns:
+    - str: Hex digest used as the cache file name.
+    """
+    w = WCS(header).celestial
+    stat = os.stat(input_file)
+    items = [w.to_header_string(relax=True),
+             str((header['NAXIS2'], header['NAXIS1'])),
+             os.path.abspath(input_file), str(stat.st_size), str(stat.st_mtime_ns), str(order)]
+    return hashlib.sha1('\n'.join(items).encode()).hexdigest()
+
+
+def footprint_slices(input_wcs, input_shape, target_wcs, target_shape, margin=8, nsample=33):
+    """
+    Bounding box of the target image in the pixel grid of the input map.
+
+    The target is sampled on an nsample x nsample grid (edges included) and transformed to the
+    input pixel grid (frame conversions, e.g., ICRS -> Galactic, are handled by astropy).
+
+    Parameters:
+    - input_wcs, target_wcs (astropy.wcs.WCS): Celestial WCS of the input map and the target image.
+    - input_shape, target_shape (tuple): (ny, nx) shapes.
+    - margin (int, optional): Number of input pixels added around the footprint. Default is 8.
+    - nsample (int, optional): Number of sampled points per axis. Default is 33.
+
+    Returns:
+    - tuple: (slice along y, slice along x) of the input map.
+    """
+    ny, nx = target_shape
+    x, y = np.meshgrid(np.linspace(-0.5, nx - 0.5, nsample), np.linspace(-0.5, ny - 0.5, nsample))
+    xi, yi = input_wcs.world_to_pixel(target_wcs.pixel_to_world(x, y))
+    good = np.isfinite(xi) & np.isfinite(yi)
+    if not np.any(good):
+        raise ValueError("The target image does not overlap with the input map.")
+
+    x0 = max(int(np.floor(xi[good].min())) - margin, 0)
+    x1 = min(int(np.ceil(xi[good].max())) + margin + 1, input_shape[1])
+    y0 = max(int(np.floor(yi[good].min())) - margin, 0)
+    y1 = min(int(np.ceil(yi[good].max())) + margin + 1, input_shape[0])
+    if x1 <= x0 or y1 <= y0:
+        raise ValueError("The target image does not overlap with the input map.")
+
+    return slice(y0, y1), slice(x0, x1)
+
+
+def tiles(shape, tile):
+    """
+    List of (y0, y1, x0, x1) output tiles of at most tile x tile pixels covering shape.
+    """
+    ny, nx = shape
+    return [(y0, min(y0 + tile, ny), x0, min(x0 + tile, nx))
+            for y0 in range(0, ny, tile) for x0 in range(0, nx, tile)]
+
+
+_input = {}
+
+
+def _init(data, header):
+    _input['data'] = data
+    _input['wcs'] = WCS(header)
+
+
+def _reproject_tile(job):
+    from reproject import reproject_interp
+
+    (y0, y1, x0, x1), target_header, order = job
+    target = WCS(target_header).celestial[y0:y1, x0:x1]
+    array, _ = reproject_interp((_input['data'], _input['wcs']), target, shape_out=(y1 - y0, x1 - x0), order=order)
+    return (y0, y1, x0, x1), array
+
+
+def reproject_tiled(input_file, target_header, output_file, tile=1024, nproc=4, margin=8, order='bilinear',
+                    cache_dir=None, dtype=np.float64, compression=None, verbose=True):
+    """
+    Reproject (a cut of) a map onto a target image, tile by tile, into a memory-mapped output FITS.
+
+    The input map is first cut to the footprint of the target plus margin pixels. The output is
+    divided in tiles of tile x tile pixels which are reprojected in a pool of nproc processes and
+    written into the output file as they come in. With cache_dir, the result is stored under a key
+    of the target WCS and the input map (see target_key) and reused by later calls.
+
+    Parameters:
+    - input_file (str): Input map, e.g., AIT_-600_600.fits.
+    - target_header (astropy.io.fits.Header): Header of the target image (e.g., the eROSITA image).
+    - output_file (str): Output FITS file.
+    - tile (int, optional): Output tile size in pixels. Default is 1024.
+    - nproc (int, optional): Number of processes. Default is 4.
+    - margin (int, optional): Margin (input pixels) around the footprint cut. Default is 8.
+    - order (str, optional): Interpolation order of reproject_interp. Default is 'bilinear'.
+    - cache_dir (str, optional): Directory of the reprojection cache. Default is None (no cache).
+    - dtype (numpy.dtype, optional): Output data type. Default is numpy.float64.
+    - compression (str, optional): Tile compression of the output (see ImageIO.compression_kwargs). Default is None ($PIPELINE_COMPRESSION or none).
+    - verbose (bool, optional): If True, print progress. Default is True.
+
+    Returns:
+    - bool: True if the output was taken from the cache.
+    """
+    compression = COMPRESSION if compression is None else compression
+    if cache_dir is not None:
+        # maps of other types or compressions are kept next to the float64 uncompressed ones
+        variant = '{0}_{1}'.format(np.dtype(dtype).name, compression.replace(':', '') if compression_kwargs(compression, dtype) else 'none')
+        cached = os.path.join(cache_dir, '{0}{1}.fits'.format(target_key(target_header, input_file, order), '' if variant == 'float64_none' else '_' + variant))
+        if os.path.exists(cached):
+            if verbose:
+                print("Reprojection found in cache ===> {0}".format(cached))
+            shutil.copyfile(cached, output_file)
+            return True
+
+    target_wcs = WCS(target_header).celestial
+    shape = (target_header['NAXIS2'], target_header['NAXIS1'])
+    with fits.open(input_file, memmap=True) as hdul:
+        input_wcs = WCS(hdul[0].header).celestial
+        sy, sx = footprint_slices(input_wcs, hdul[0].data.shape, target_wcs, shape, margin=margin)
+        data = np.array(hdul[0].data[sy, sx], dtype=float)
+        cut_header = input_wcs[sy, sx].to_header(relax=True)
+    if verbose:
+        print("Input cut to {0} x {1} pixels".format(data.shape[-1], data.shape[-2]))
+
+    jobs = [(t, target_header, order) for t in tiles(shape, tile)]
+    with create_image(output_file, target_header, shape, dtype=dtype, compression=compression) as out:
+        if nproc > 1 and len(jobs) > 1:
+            with Pool(nproc, initializer=_init, initargs=(data, cut_header)) as pool:
+                for n, ((y0, y1, x0, x1), array) in enumerate(pool.imap_unordered(_reproject_tile, jobs), 1):
+                    out[y0:y1, x0:x1] = array
+                    if verbose:
+                        print("{0}/{1} tiles".format(n, len(jobs)), end='\r')
+        else:
+            _init(data, cut_header)
+            for n, job in enumerate(jobs, 1):
+                (y0, y1, x0, x1), array = _reproject_tile(job)
+                out[y0:y1, x0:x1] = array
+                if verbose:
+                    print("{0}/{1} tiles".format(n, len(jobs)), end='\r')
+    if verbose:
+        print()
+
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        shutil.copyfile(output_file, cached + '.tmp')
+        os.replace(cached + '.tmp', cached)
+
+    return False
@@ -0,0 +1,497 @@
+import os
+import queue
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+import multiprocessing as mp
+from multiprocessing import connection as mp_connection
+
+# model apec + TBabs*(apec + pow), parameter 5 is the absorbing column (in 1e22)
+MODEL = 'apec + TBabs*(apec + pow) & 0.099 & 1.0 & 0.0 & 0.0019 & {nh} & 0.225 & 1.0 & 0.0 & 0.0041 & 1.4 & 0.0036'
+RESPONSE = 'c001_300016_es201009_f_BGNONE_TM{tm}_an3-A3391_{tm}20_{kind}_00001.fits'
+FAKE_EXPOSURE = 2500
+RESULT_TAG = 'NHSIM'
+TIMEOUT = 300  # s allowed for the simulation of one NH value
+
+
+def _band(values):
+    """
+    Return an energy limit argument as a list of floats.
+    """
+    if isinstance(values, (int, float)):
+        return [float(values)]
+    return [float(v) for v in values]
+
+
+def header_commands():
+    """
+    XSPEC main settings, same as Xspec_sim.sh (statistics chi2, no counting statistic, no fitting).
+
+    Returns:
+    - list of str: XSPEC commands.
+    """
+    return ['query yes',
+            'xsect bcmc',
+            'abund aspl',
+            'statistic chi2',
+            'cosmo 70 0 0.70',
+            'xset delta 0.01',
+            'systematic 0',
+            'mo {0}'.format(MODEL.format(nh=0.01))]
+
+
+def nh_commands(nh, tm, low, hie, fakfile, response_dir='.'):
+    """
+    XSPEC commands simulating one NH value and printing the result on a single tagged line.
+
+    Parameters:
+    - nh (float): NH value in 1e22 atoms/cm^2.
+    - tm (int): TM whose responses are used (1: on-chip filter, 5: no on-chip filter).
+    - low (float or list of float): Low energy limit(s), e.g., 0.2 or [0.2, 1.6].
+    - hie (float or list of float): High energy limit(s), e.g., 2.3 or [1.35, 2.3].
+    - fakfile (str): Name of the temporary fake spectrum.
+    - response_dir (str, optional): Directory of the RMF/ARF files. Default is '.'.
+
+    Returns:
+    - list of str: XSPEC commands. The result line is "NHSIM nh rate flux expos".
+    """
+    low = _band(low)
+    hie = _band(hie)
+    rmf = os.path.join(response_dir, RESPONSE.format(tm=tm, kind='RMF'))
+    arf = os.path.join(response_dir, RESPONSE.format(tm=tm, kind='ARF'))
+
+    cmds = ['newpar 5 {0}'.format(nh),
+            'fakeit none & {0} & {1} & n & & {2} & {3}'.format(rmf, arf, fakfile, FAKE_EXPOSURE)]
+    if len(hie) == 1:
+        cmds.append('ign *:**-{0} {1}-**'.format(low[0], hie[-1]))
+    else:
+        cmds.append('ign *:**-{0} {1}-**'.format(low[0], hie[0]))
+        cmds.append('notice {0}-{1}'.format(low[1], hie[1]))
+    cmds += ['tclout param 5',
+             'set nh [lindex $xspec_tclout 0]',
+             'tclout rate 1',
+             'set rate [lindex $xspec_tclout 0]',
+             'flux {0} 2'.format(' '.join('{}'.format(x) for x in low)),
+             'tclout flux',
+             'set flux [lindex $xspec_tclout 0]',
+             'tclout expos',
+             'set expos [lindex $xspec_tclout 0]',
+             'puts "{0} $nh $rate $flux $expos"'.format(RESULT_TAG),
+             'flush stdout',
+             'exec /bin/rm -f {0}'.format(fakfile)]
+
+    return cmds
+
+
+def parse_result(line):
+    """
+    Parse a tagged result line printed by the commands of nh_commands. The tag may be preceded on the line by
+    other output (e.g., the XSPEC12> prompt).
+
+    Returns:
+    - tuple of float: (nh, rate, flux, expos), or None if the line is not a result line.
+    """
+    start = line.find(RESULT_TAG)
+    if start < 0:
+        return None
+    items = line[start:].split()
+    if len(items) != 5 or items[0] != RESULT_TAG:
+        return None
+    try:
+        return tuple(float(x) for x in items[1:])
+    except ValueError:
+        return None
+
+
+def simulate(nh_values, tm, low, hie, response_dir='.', workdir=None):
+    """
+    Simulate a list of NH values in a single XSPEC run.
+
+    Parameters:
+    - nh_values (list of float): NH values in 1e22 atoms/cm^2.
+    - tm (int): TM whose responses are used (1 or 5).
+    - low (float or list of float): Low energy limit(s).
+    - hie (float or list of float): High energy limit(s).
+    - response_dir (str, optional): Directory of the RMF/ARF files. Default is '.'.
+    - workdir (str, optional): Directory for the temporary .xcm and .fak files. Default is a new temporary directory.
+
+    Returns:
+    - list of tuple: (nh, rate, flux, expos) for each simulated NH value.
+    """
+    response_dir = os.path.abspath(response_dir)
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        cmds = header_commands()
+        for i, nh in enumerate(nh_values):
+            cmds += nh_commands(nh, tm, low, hie, 'XSPEC_SIM_TM{0}_{1}_v1.fak'.format(tm, i), response_dir)
+        cmds.append('exit')
+
+        xcm = os.path.join(tmp, 'XSPEC_SIM_TM{0}_v1.xcm'.format(tm))
+        with open(xcm, 'w') as f:
+            f.write('\n'.join(cmds) + '\n')
+        p = subprocess.run(['xspec', '-', xcm], cwd=tmp, stdin=subprocess.DEVNULL,
+                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+    results = [r for r in (parse_result(line) for line in p.stdout.splitlines()) if r is not None]
+    if len(results) != len(nh_values):
+        raise RuntimeError("XSPEC returned {0} results for {1} NH values:\n{2}".format(len(results), len(nh_values), p.stdout[-2000:]))
+
+    return results
+
+
+class XspecSession:
+    """
+    Long-lived XSPEC process fed through its standard input.
+
+    The model is defined once; every NH value then only costs a newpar, a fakeit and the
+    tclout queries, instead of a full XSPEC start-up. The output is read by a thread, so that an XSPEC
+    waiting at a prompt is killed after timeout seconds instead of blocking the caller.
+
+    Parameters:
+    - tm (int): TM whose responses are used (1 or 5).
+    - low (float or list of float): Low energy limit(s).
+    - hie (float or list of float): High energy limit(s).
+    - response_dir (str, optional): Directory of the RMF/ARF files. Default is '.'.
+    - workdir (str, optional): Working directory of XSPEC (fake spectra are written there). Default is the current directory.
+    - timeout (float, optional): Seconds allowed for the result of one NH value. Default is TIMEOUT (300).
+    """
+    def __init__(self, tm, low, hie, response_dir='.', workdir=None, timeout=TIMEOUT):
+        self.tm, self.low, self.hie = tm, low, hie
+        self.response_dir = os.path.abspath(response_dir)
+        self.timeout = timeout
+        self._proc = subprocess.Popen(['xspec'], cwd=workdir, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                      stderr=subprocess.STDOUT, text=True, bufsize=1)
+        self._lines = queue.Queue()
+        threading.Thread(target=self._read, daemon=True).start()
+        self._send(header_commands())
+        self._count = 0
+
+    def _read(self):
+        for line in self._proc.stdout:
+            self._lines.put(line)
+        self._lines.put(None)  # end of the session
+
+    def _send(self, cmds):
+        self._proc.stdin.write('\n'.join(cmds) + '\n')
+        self._proc.stdin.flush()
+
+    def run(self, nh_values):
+        """
+        Simulate NH values in this session.
+
+        Raises a TimeoutError (after killing XSPEC, the session is then unusable) if the result of a value
+        does not arrive within timeout seconds.
+
+        Returns:
+        - list of tuple: (nh, rate, flux, expos) for each NH value.
+        """
+        results = []
+        for nh in nh_values:
+            fakfile = 'XSPEC_SIM_TM{0}_{1}_{2}_v1.fak'.format(self.tm, os.getpid(), self._count)
+            self._count += 1
+            self._send(nh_commands(nh, self.tm, self.low, self.hie, fakfile, self.response_dir))
+            tail = []
+            deadline = time.time() + self.timeout
+            while True:
+                try:
+                    line = self._lines.get(timeout=max(deadline - time.time(), 0))
+                except queue.Empty:
+                    self._proc.kill()
+                    raise TimeoutError("XSPEC gave no result within {0} s for nh={1}:\n{2}".format(self.timeout, nh, ''.join(tail[-20:])))
+                if not line:
+                    raise RuntimeError("XSPEC session ended while simulating nh={0}:\n{1}".format(nh, ''.join(tail[-20:])))
+                result = parse_result(line)
+                if result is not None:
+                    results.append(result)
+                    break
+                tail.append(line)
+
+        return results
+
+    def close(self):
+        """
+        Exit XSPEC.
+        """
+        if self._proc.poll() is None:
+            try:
+                self._send(['exit'])
+                self._proc.wait(timeout=30)
+            except (BrokenPipeError, subprocess.TimeoutExpired):
+                self._proc.kill()
+
+
+class PyXspecSession:
+    """
+    Same as XspecSession using PyXspec in the current process (timeout is not enforced here, only by the
+    deadlines of XspecPool).
+    """
+    def __init__(self, tm, low, hie, response_dir='.', workdir=None, timeout=TIMEOUT):
+        import xspec
+        self._xs = xspec
+        self.tm, self.low, self.hie = tm, _band(low), _band(hie)
+        self.response_dir = os.path.abspath(response_dir)
+        self.workdir = workdir or os.getcwd()
+        self._count = 0
+
+        xspec.Xset.chatter = 0
+        xspec.Xset.xsect = 'bcmc'
+        xspec.Xset.abund = 'aspl'
+        xspec.Xset.cosmo = '70 0 0.70'
+        xspec.Fit.statMethod = 'chi'
+        xspec.Fit.delta = 0.01
+        pars = MODEL.split(' & ')
+        self._model = xspec.Model(pars[0])
+        self._model.setPars(*[float(p) for p in pars[1:]])
+
+    def run(self, nh_values):
+        xspec = self._xs
+        rmf = os.path.join(self.response_dir, RESPONSE.format(tm=self.tm, kind='RMF'))
+        arf = os.path.join(self.response_dir, RESPONSE.format(tm=self.tm, kind='ARF'))
+        results = []
+        for nh in nh_values:
+            fakfile = os.path.join(self.workdir, 'XSPEC_SIM_TM{0}_{1}_{2}_v1.fak'.format(self.tm, os.getpid(), self._count))
+            self._count += 1
+            self._model.setPars({5: nh})
+            xspec.AllData.clear()
+            xspec.AllData.fakeit(1, xspec.FakeitSettings(response=rmf, arf=arf, exposure=FAKE_EXPOSURE, fileName=fakfile), applyStats=False)
+            if len(self.hie) == 1:
+                xspec.AllData.ignore('*:**-{0} {1}-**'.format(self.low[0], self.hie[-1]))
+            else:
+                xspec.AllData.ignore('*:**-{0} {1}-**'.format(self.low[0], self.hie[0]))
+                xspec.AllData.notice('{0}-{1}'.format(self.low[1], self.hie[1]))
+            spectrum = xspec.AllData(1)
+            xspec.AllModels.calcFlux('{0} 2'.format(' '.join('{}'.format(x) for x in self.low)))
+            results.append((self._model(5).values[0], spectrum.rate[0], spectrum.flux[0], spectrum.exposure))
+            if os.path.exists(fakfile):
+                os.remove(fakfile)
+
+        return results
+
+    def close(self):
+        self._xs.AllData.clear()
+
+
+SESSIONS = {'cli': XspecSession, 'pyxspec': PyXspecSession}
+
+
+def _worker(backend, tm, low, hie, response_dir, timeout, workdir, conn):
+    """
+    Worker process: one persistent session serving the batches of NH values received on its pipe.
+    The worker leads its own process group, so that the pool can kill it together with its XSPEC process.
+    """
+    os.setpgrp()
+    session = SESSIONS[backend](tm, low, hie, response_dir, workdir=workdir, timeout=timeout)
+    try:
+        while True:
+            batch = conn.recv()
+            if batch is None:
+                break
+            try:
+                conn.send(('ok', session.run(batch)))
+            except Exception as e:
+                conn.send(('error', str(e)))
+                session.close()
+                session = SESSIONS[backend](tm, low, hie, response_dir, workdir=workdir, timeout=timeout)
+    finally:
+        session.close()
+
+
+def read_table(file_path, decimals=4):
+    """
+    Read a simulation results table (header "nh rate flux exp").
+
+    Returns:
+    - dict: {round(nh, decimals): (nh, rate, flux, expos)}. Empty if the file does not exist.
+    """
+    rows = {}
+    if not os.path.exists(file_path):
+        return rows
+    with open(file_path) as f:
+        for line in f:
+            items = line.split()
+            if len(items) != 4 or items[0] == 'nh':
+                continue
+            try:
+                row = tuple(float(x) for x in items)
+            except ValueError:
+                continue
+            rows[round(row[0], decimals)] = row
+
+    return rows
+
+
+class XspecPool:
+    """
+    Pool of long-lived XSPEC sessions fed with batches of NH values.
+
+    Every worker has its own pipe and working directory, and leads its own process group: a hung worker is killed
+    with its XSPEC process, its directory is removed and a new worker with a new pipe replaces it, without touching
+    the channels of the other workers.
+
+    Parameters:
+    - tm (int): TM whose responses are used (1 or 5).
+    - low (float or list of float): Low energy limit(s).
+    - hie (float or list of float): High energy limit(s).
+    - nproc (int, optional): Number of worker sessions. Default is 4.
+    - batch (int, optional): Number of NH values sent to a worker at once. Default is 16.
+    - backend (str, optional): 'cli' for the xspec executable or 'pyxspec'. Default is 'cli'.
+    - response_dir (str, optional): Directory of the RMF/ARF files. Default is '.'.
+    - timeout (float, optional): Seconds allowed per NH value. A batch still running after timeout seconds per
+      value (plus one minute of start-up) fails and its worker is replaced. Default is TIMEOUT (300).
+
+    Use as a context manager. Calling the pool with a list of NH values returns the results,
+    so that it can be passed as the simulate callable of NHResponseModel.from_simulation.
+    """
+    def __init__(self, tm, low, hie, nproc=4, batch=16, backend='cli', response_dir='.', timeout=TIMEOUT):
+        if backend not in SESSIONS:
+            raise ValueError("backend must be one of {0}.".format(list(SESSIONS)))
+        if nproc < 1:
+            raise ValueError("nproc must be at least 1.")
+        self.batch = batch
+        self.timeout = timeout
+        self._args = (backend, tm, low, hie, response_dir, timeout)
+        self._workers = [self._start() for _ in range(nproc)]  # (process, pipe end, working directory)
+
+    def _start(self):
+        """
+        Start a worker with a new pipe and working directory.
+        """
+        conn, child_conn = mp.Pipe()
+        workdir = tempfile.mkdtemp(prefix='xspec_pool_')
+        w = mp.Process(target=_worker, daemon=True, args=self._args + (workdir, child_conn))
+        w.start()
+        child_conn.close()
+        return w, conn, workdir
+
+    @staticmethod
+    def _stop(worker, kill=False):
+        """
+        Stop a worker (killing its process group if kill), close its pipe and remove its working directory.
+        """
+        w, conn, workdir = worker
+        if kill:
+            try:
+                os.killpg(w.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+            w.kill()  # the group may not exist yet
+        w.join(timeout=10)
+        conn.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    def _replace(self, i):
+        """
+        Kill worker i (hung or dead) and start a new one.
+        """
+        self._stop(self._workers[i], kill=True)
+        self._workers[i] = self._start()
+
+    def _send(self, i, batch):
+        """
+        Send a batch to worker i, replacing the worker if it died while idle.
+        """
+        try:
+            self._workers[i][1].send(batch)
+        except (BrokenPipeError, OSError):
+            self._replace(i)
+            self._workers[i][1].send(batch)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __call__(self, nh_values):
+        return self.run(nh_values)
+
+    def run(self, nh_values, table=None, decimals=4, verbose=False):
+        """
+        Simulate NH values on all workers.
+
+        Parameters:
+        - nh_values (list of float): NH values in 1e22 atoms/cm^2.
+        - table (str, optional): Results table. Rows already present are not simulated again and new rows are
+          appended (and flushed) as soon as they arrive, so an interrupted run can be resumed. Default is None.
+        - decimals (int, optional): Rounding used to match NH values with the table. Default is 4.
+        - verbose (bool, optional): If True, print the progress. Default is False.
+
+        Returns:
+        - list of tuple: (nh, rate, flux, expos), in the order of nh_values.
+        """
+        done = read_table(table, decimals) if table else {}
+        todo = [nh for nh in dict.fromkeys(nh_values) if round(nh, decimals) not in done]
+        if verbose and done:
+            print("{0} NH values already simulated in {1}".format(len(nh_values) - len(todo), table))
+
+        out = None
+        if table:
+            new_file = not os.path.exists(table) or os.path.getsize(table) == 0
+            out = open(table, 'a')
+            if new_file:
+                out.write('nh rate flux exp\n')
+        try:
+            waiting = [todo[i:i + self.batch] for i in range(0, len(todo), self.batch)][::-1]
+            n_batches = len(waiting)
+            busy = {}  # worker index -> (NH values, deadline)
+
+            errors = []
+            while waiting or busy:
+                for i in range(len(self._workers)):
+                    if i not in busy and waiting:
+                        batch = waiting.pop()
+                        self._send(i, batch)
+                        busy[i] = (batch, time.time() + self.timeout * len(batch) + 60)
+                ready = mp_connection.wait([self._workers[i][1] for i in busy], timeout=10)
+                for i in list(busy):
+                    batch, deadline = busy[i]
+                    if self._workers[i][1] in ready:
+                        del busy[i]
+                        try:
+                            status, payload = self._workers[i][1].recv()
+                        except (EOFError, OSError):
+                            errors.append("XSPEC worker died while simulating nh={0}...{1}, worker restarted.".format(batch[0], batch[-1]))
+                            self._replace(i)
+                            continue
+                    elif time.time() > deadline:
+                        del busy[i]
+                        errors.append("Batch nh={0}...{1} still running after {2:.0f} s, worker restarted.".format(
+                            batch[0], batch[-1], self.timeout * len(batch) + 60))
+                        self._replace(i)
+                        continue
+                    else:
+                        continue
+                    if status == 'error':
+                        errors.append(payload)
+                        continue
+                    for nh, row in zip(batch, payload):
+                        done[round(nh, decimals)] = row
+                        if out:
+                            out.write('{0} {1} {2} {3}\n'.format(*row))
+                    if out:
+                        out.flush()
+                    if verbose:
+                        print("{0}/{1} batches done".format(n_batches - len(waiting) - len(busy), n_batches))
+        finally:
+            if out:
+                out.close()
+
+        if errors:
+            raise RuntimeError("{0} batches failed, rerun to resume. First error:\n{1}".format(len(errors), errors[0]))
+
+        return [done[round(nh, decimals)] for nh in nh_values]
+
+    def close(self):
+        """
+        Stop the worker sessions.
+        """
+        for w, conn, _ in self._workers:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in self._workers:
+            worker[0].join(timeout=60)
+            self._stop(worker, kill=worker[0].is_alive())
@@ -15,6 +15,20 @@ else
     suff="_uni"
 fi
 
+# PIPELINE_TRACE=<file.jsonl>: record wall/CPU time, peak memory and I/O of each xspec run ($ ./PY_trace.py report <file>)
+# PY_trace.py is beside this script (copies in the working folder), else in $PIPELINE_SCRIPTS/filtering_and_pib_sub
+# (default: filtering_and_pib_sub/ of the repository of this script)
+here=$(dirname "$(realpath "$0")")
+pytrace=$here/PY_trace.py
+[ -f "$pytrace" ] || pytrace=${PIPELINE_SCRIPTS:-$here/..}/filtering_and_pib_sub/PY_trace.py
+trace=""
+if [ -n "${PIPELINE_TRACE}" ]
+then
+    export PIPELINE_TRACE=$(realpath -m ${PIPELINE_TRACE})
+    export PIPELINE_TRACE_TAGS="cluster=${cluster}"
+    trace="$pytrace run --stage xspec_sim --"
+fi
+
 # Create Xspec Script, v1: statistics chi2, counting statistic=no, no fitting
 echo "model apec + TBabs*(apec + pow)"
 echo "Abundance table: Asplund"
@@ -92,7 +106,7 @@ do
 
     # Run it
     # echo "Launching Xspec for nh=${nh}..."
-    xspec - $XsScript >& $XsLog
+    $trace xspec - $XsScript >& $XsLog
     rm XSPEC_SIM_TM${tms[i]}_${nh}_v1.fak $XsScript $XsLog
   done
 
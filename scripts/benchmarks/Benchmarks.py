@@ -0,0 +1,282 @@
+import json
+import os
+import platform
+import socket
+import statistics
+import sys
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+for sub in ('..', '../filtering_and_pib_sub', '../NH_absorption'):
+    sys.path.insert(0, os.path.normpath(os.path.join(HERE, sub)))  # modules of the pipeline
+
+import Synthetic
+
+# image size, number of events, lightcurves and time bins per lightcurve
+SCALES = {'small': {'size': 1024, 'events': 10 ** 6, 'lightcurves': 100, 'nbins': 5000},
+          'medium': {'size': 4096, 'events': 10 ** 7, 'lightcurves': 300, 'nbins': 5000},
+          'large': {'size': 10000, 'events': 10 ** 8, 'lightcurves': 1000, 'nbins': 5000},
+          'full': {'size': 18000, 'events': 10 ** 9, 'lightcurves': 3000, 'nbins': 5000}}
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """
+    Register a benchmark: a function setup(ws) of a Workspace returning (run, work, unit), run being the callable that
+    is timed, work the amount of work of one call in units unit (e.g., 1e6 pixels, 'Mpix').
+    """
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+class Workspace:
+    """
+    Synthetic data of one scale, generated on first use in a directory and reused by the next runs.
+
+    Parameters:
+    - directory (str): Data directory (one sub-directory per scale and size).
+    - scale (dict): size, events, lightcurves and nbins (see SCALES).
+    - seed (int, optional): Random seed. Default is 0.
+    """
+    def __init__(self, directory, scale, seed=0):
+        self.scale = dict(scale)
+        self.directory = os.path.join(directory, 'syn_{size}_{events:.0e}_{lightcurves}'.format(**scale).replace('+', ''))
+        self.seed = seed
+        self._paths = None
+        self._cache = {}
+
+    @property
+    def paths(self):
+        if self._paths is None:
+            start = time.time()
+            self._paths = Synthetic.make_dataset(self.directory, size=self.scale['size'], n_events=self.scale['events'],
+                                                 n_lightcurves=self.scale['lightcurves'], nbins=self.scale['nbins'], seed=self.seed)
+            print("Synthetic data in {0} ({1:.1f} s)".format(self.directory, time.time() - start), flush=True)
+        return self._paths
+
+    def image(self, key):
+        """
+        Data of an image of the data set (cached).
+        """
+        if key not in self._cache:
+            from astropy.io import fits
+            self._cache[key] = fits.getdata(self.paths[key])
+        return self._cache[key]
+
+    def companion(self, key):
+        from MyFits import PrimCompanion
+        return PrimCompanion().from_fits(self.paths[key])
+
+
+@benchmark('corr_map')
+def _corr_map(ws):
+    from NHCorrection import corr_table, corr_map
+    table = np.loadtxt(ws.paths['sim1'], skiprows=1)
+    nh_table, corr, _ = corr_table(table[:, 0], table[:, 1])
+    nh = np.round(ws.image('nh') / 1e22, 4)
+    return (lambda: corr_map(nh, nh_table, corr)), nh.size / 1e6, 'Mpix'
+
+
+@benchmark('nh_response_corr_map')
+def _response_corr_map(ws):
+    from NHResponse import NHResponseModel
+    model = NHResponseModel.from_table(ws.paths['sim1'])
+    nh = np.round(ws.image('nh') / 1e22, 4)
+    return (lambda: model.corr_map(nh, float(np.nanmedian(nh)))), nh.size / 1e6, 'Mpix'
+
+
+@benchmark('nh_box_grid')
+def _nh_box_grid(ws):
+    from astropy.wcs import WCS
+    from NHGrid import box_grid, interp_fill
+    from NH2Provider import MockNH2Provider
+    size = ws.scale['size']
+    w = WCS(Synthetic.image_header(size))
+    box = max(size // 50, 1)
+
+    def run():
+        ra, dec, xc, yc = box_grid(w, (size, size), box)
+        values = np.asarray(MockNH2Provider().query_many(list(ra.ravel()), list(dec.ravel())), dtype=float)
+        return interp_fill(values.reshape(ra.shape), xc, yc, (size, size))
+    return run, size * size / 1e6, 'Mpix'
+
+
+@benchmark('nh_adaptive_grid')
+def _nh_adaptive_grid(ws):
+    from NHResponse import NHResponseModel
+
+    def simulate(nh):
+        rate = Synthetic.simulation_rates(nh)
+        return [(n, r, 1.2e-12 * r, 2500.) for n, r in zip(nh, rate)]
+    return (lambda: NHResponseModel.from_simulation(simulate, 0.001, 0.5, rtol=1e-4, max_nodes=64, verbose=False)), 1, 'grid'
+
+
+@benchmark('lightcurve_clip')
+def _lightcurve_clip(ws):
+    from LightcurveThreshold import read_lightcurve, clip_thresholds
+    rates = [read_lightcurve(f)[1] for f in ws.paths['lightcurves']]
+    return (lambda: clip_thresholds(rates)), len(rates), 'lc'
+
+
+@benchmark('lightcurve_levmar')
+def _lightcurve_levmar(ws):
+    from LightcurveThreshold import read_lightcurve, levmar_threshold
+    rates = [read_lightcurve(f)[1] for f in ws.paths['lightcurves'][:20]]
+    return (lambda: [levmar_threshold(r) for r in rates]), len(rates), 'lc'
+
+
+@benchmark('bin_events')
+def _bin_events(ws):
+    from EventBinner import EventBinner
+
+    def run():
+        binner = EventBinner(ws.paths['events'], ws.scale['size'], gti='FLAREGTI')
+        for lo, hi in (('6.0', '9.0'), ('5.5', '6.15'), ('6.7', '9.0')):
+            binner.add([1, 2, 3, 4, 6], [lo], [hi])
+        return binner.run()
+    return run, ws.scale['events'] / 1e6, 'Mevt'
+
+
+@benchmark('fgauss')
+def _fgauss(ws):
+    img = ws.companion('counts8')
+    return (lambda: img.fgauss(4)), img.data.size / 1e6, 'Mpix'
+
+
+@benchmark('fgauss_wide')
+def _fgauss_wide(ws):
+    img = ws.companion('counts8')
+    return (lambda: img.fgauss(24)), img.data.size / 1e6, 'Mpix'
+
+
+@benchmark('cutout')
+def _cutout(ws):
+    from astropy.coordinates import SkyCoord
+    img = ws.companion('counts8')
+    centre = SkyCoord(Synthetic.RA, Synthetic.DEC, unit='deg')
+    size = ws.scale['size'] // 4
+    return (lambda: img.cutout(centre, (size, size))), 1, 'cutout'
+
+
+@benchmark('cutouts')
+def _cutouts(ws):
+    img = ws.companion('counts8')
+    rng = np.random.default_rng(0)
+    positions = img.wcs.pixel_to_world(*rng.uniform(0, ws.scale['size'], (2, 1000)))
+    return (lambda: img.cutouts(positions, 64)), 1000, 'cutout'
+
+
+@benchmark('plot')
+def _plot(ws):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    img = ws.companion('counts8')
+
+    def run():
+        fig = img.plot(compress=True, regions=False)
+        plt.close('all')
+        return fig
+    return run, img.data.size / 1e6, 'Mpix'
+
+
+@benchmark('hist')
+def _hist(ws):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from MyFits import BinCompanion
+    table = BinCompanion().from_fits(ws.paths['events'], 'EVENTS', memmap=True)
+
+    def run():
+        out = table.hist(table.data['PI'])
+        plt.close('all')
+        return out
+    return run, ws.scale['events'] / 1e6, 'Mevt'
+
+
+def time_call(run, repeat=3, warmup=True):
+    """
+    Wall times (s) of repeat calls of run (after one untimed call if warmup).
+    """
+    if warmup:
+        run()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def run_benchmarks(names, workspace, repeat=3, verbose=True):
+    """
+    Run benchmarks on a Workspace.
+
+    A benchmark whose module (or optional dependency, e.g. matplotlib for plot and the MyFits benchmarks) cannot be
+    imported is skipped, with a warning on stderr (also when not verbose).
+
+    Returns:
+    - dict: {name: {'status', 'min', 'median', 'times', 'work', 'unit', 'rate'}} with rate = work / min (unit/s).
+    """
+    results = {}
+    for name in names:
+        try:
+            run, work, unit = BENCHMARKS[name](workspace)
+        except ImportError as err:
+            results[name] = {'status': 'skipped', 'reason': str(err)}
+            print("WARNING: {0:<22} skipped ({1})".format(name, err), file=sys.stderr, flush=True)
+            continue
+        times = time_call(run, repeat)
+        best = min(times)
+        results[name] = {'status': 'ok', 'min': best, 'median': statistics.median(times), 'times': times,
+                         'work': work, 'unit': unit, 'rate': work / best if best > 0 else float('inf')}
+        if verbose:
+            print("{0:<22} {1:>9.4f} s (median {2:.4f} s)  {3:>10.3g} {4}/s".format(name, best, results[name]['median'], results[name]['rate'], unit), flush=True)
+    return results
+
+
+def environment():
+    """
+    Machine and library versions of a result file (results are only comparable on the same machine).
+    """
+    import astropy
+    import scipy
+    return {'host': socket.gethostname(), 'platform': platform.platform(), 'python': platform.python_version(),
+            'numpy': np.__version__, 'scipy': scipy.__version__, 'astropy': astropy.__version__,
+            'cpus': os.cpu_count(), 'date': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    Benchmarks slower than the baseline by more than tolerance (relative, on the best time).
+
+    Returns:
+    - list of (name, baseline min, min, ratio): The regressions.
+    - list of (name, baseline min, min, ratio): All compared benchmarks.
+    """
+    compared, regressions = [], []
+    for name, res in results.items():
+        old = baseline.get('results', {}).get(name)
+        if res.get('status') != 'ok' or not old or old.get('status') != 'ok':
+            continue
+        row = (name, old['min'], res['min'], res['min'] / old['min'])
+        compared.append(row)
+        if row[3] > 1 + tolerance:
+            regressions.append(row)
+    return regressions, compared
+
+
+def load(file_path):
+    with open(file_path) as f:
+        return json.load(f)
+
+
+def save(file_path, results, scale, repeat):
+    with open(file_path, 'w') as f:
+        json.dump({'environment': environment(), 'scale': scale, 'repeat': repeat, 'results': results}, f, indent=1)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+import tempfile
+from Benchmarks import BENCHMARKS, SCALES, Workspace, run_benchmarks, compare, load, save
+
+script_version = 0.0
+script_descr="""
+Timed benchmarks of the Python hot paths of the pipeline on synthetic data (Synthetic.py: event list, lightcurves,
+count, exposure and NH maps, simulation tables), generated once per scale in --data-dir and reused.
+Results can be saved as a baseline and later runs compared with it (exit code 1 on a regression).
+Baselines are only meaningful on the machine that wrote them.
+Examples:
+  $ ./PY_benchmark.py --scale small --save-baseline baselines/$(hostname)_small.json
+  $ ./PY_benchmark.py --scale small --baseline baselines/$(hostname)_small.json
+  $ ./PY_benchmark.py corr_map fgauss --size 18000 --repeat 1"""
+
+# Open argument parser
+parser = argparse.ArgumentParser(description=script_descr, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--version',action='version',version='%(prog)s v{}'.format(script_version))
+
+# Optional
+parser.add_argument('names',nargs='*',default=list(BENCHMARKS),help='benchmarks to run (default: all; see --list)')
+parser.add_argument('--list',action='store_true',help='list the benchmarks and scales')
+parser.add_argument('--scale',default='small',choices=list(SCALES),help='data scale')
+parser.add_argument('--size',default=None,type=int,help='image size in pixels (overrides the scale)')
+parser.add_argument('--events',default=None,type=float,help='number of events (overrides the scale)')
+parser.add_argument('--lightcurves',default=None,type=int,help='number of lightcurves (overrides the scale)')
+parser.add_argument('--repeat',default=3,type=int,help='timed calls per benchmark (the best time is kept)')
+parser.add_argument('--data-dir',default=os.environ.get('BENCHMARK_DATA', os.path.join(tempfile.gettempdir(), 'eRASS_benchmarks')),help='directory of the synthetic data (default: $BENCHMARK_DATA or the temporary directory)')
+parser.add_argument('--out',default=None,help='write the results to this JSON file')
+parser.add_argument('--save-baseline',default=None,help='write the results as a baseline JSON file')
+parser.add_argument('--baseline',default=None,help='baseline JSON file to compare with')
+parser.add_argument('--tolerance',default=0.25,type=float,help='relative slowdown reported as a regression')
+
+args = parser.parse_args()
+
+if args.list:
+    print("Benchmarks: {0}".format(' '.join(BENCHMARKS)))
+    for name, scale in SCALES.items():
+        print("Scale {0}: {1}".format(name, scale))
+    sys.exit()
+
+unknown = [n for n in args.names if n not in BENCHMARKS]
+if unknown:
+    parser.error('unknown benchmark(s) {0} (see --list)'.format(' '.join(unknown)))
+
+scale = dict(SCALES[args.scale])
+for key in ('size', 'events', 'lightcurves'):
+    if getattr(args, key) is not None:
+        scale[key] = int(getattr(args, key))
+print("Scale: {0}".format(scale), flush=True)
+
+workspace = Workspace(args.data_dir, scale)
+results = run_benchmarks(args.names, workspace, repeat=args.repeat)
+skipped = [name for name, res in results.items() if res['status'] == 'skipped']
+if skipped:
+    print("WARNING: {0} of {1} benchmark(s) skipped: {2}".format(len(skipped), len(results), ' '.join(skipped)), file=sys.stderr, flush=True)
+
+for path in (args.out, args.save_baseline):
+    if path:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        save(path, results, scale, args.repeat)
+        print("Results written to {0}".format(path))
+
+if args.baseline:
+    baseline = load(args.baseline)
+    if baseline.get('scale') != scale:
+        print("WARNING: baseline scale {0} differs from {1}".format(baseline.get('scale'), scale))
+    regressions, compared = compare(results, baseline, args.tolerance)
+    print("\nComparison with {0} ({1}, {2}):".format(args.baseline, baseline['environment']['host'], baseline['environment']['date']))
+    for name, old, new, ratio in compared:
+        print("{0:<22} {1:>9.4f} s -> {2:>9.4f} s  x{3:.2f}{4}".format(name, old, new, ratio, '  REGRESSION' if ratio > 1 + args.tolerance else ''))
+    if regressions:
+        sys.exit("{0} regression(s) beyond {1:.0%}".format(len(regressions), args.tolerance))
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+import argparse
+from Synthetic import make_dataset
+
+script_version = 0.0
+script_descr="""
+Write a synthetic data set (Synthetic.py) named like the pipeline products: event list with GTI/FLAREGTI extensions,
+flaregti lightcurves, TM8/TM9 count, exposure and single-exposure maps, NH map and simulation tables. Files already in
+the output directory are kept.
+Example:
+  $ ./PY_synthetic.py /data/syn18k --size 18000 --events 1e9"""
+
+# Open argument parser
+parser = argparse.ArgumentParser(description=script_descr, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--version',action='version',version='%(prog)s v{}'.format(script_version))
+
+# Mandatory
+parser.add_argument('outdir',help='output directory')
+# Optional
+parser.add_argument('--size',default=1024,type=int,help='image size in pixels')
+parser.add_argument('--events',default=1e6,type=float,help='number of events')
+parser.add_argument('--lightcurves',default=100,type=int,help='number of lightcurves')
+parser.add_argument('--nbins',default=5000,type=int,help='time bins per lightcurve')
+parser.add_argument('--seed',default=0,type=int,help='random seed')
+
+args = parser.parse_args()
+
+paths = make_dataset(args.outdir, size=args.size, n_events=int(args.events), n_lightcurves=args.lightcurves, nbins=args.nbins, seed=args.seed)
+for key, path in paths.items():
+    print('{0:<12} {1}'.format(key, '{0} files'.format(len(path)) if isinstance(path, list) else path))
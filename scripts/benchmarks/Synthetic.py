@@ -0,0 +1,279 @@
+import os
+
+import numpy as np
+from astropy.io import fits
+
+RA, DEC = 96.6, -35.2  # default pointing (any position works)
+SKY_PIXEL = 0.05 / 3600  # event X/Y pixel in degrees (0.05")
+REBIN = 80  # image pixel in sky pixels (4")
+EVENT_DTYPE = np.dtype([('TIME', '>f8'), ('X', '>i4'), ('Y', '>i4'), ('PI', '>f4'), ('FLAG', '>i4'),
+                        ('PAT_TYP', '>i2'), ('TM_NR', '>i2')])
+
+
+def image_header(size, ra=RA, dec=DEC, rebin=REBIN):
+    """
+    WCS header of a size x size image centred on (ra, dec), with the pixel size and projection of the evtool images.
+    """
+    hdr = fits.Header()
+    for axis, ctype, crval in ((1, 'RA---SIN', ra), (2, 'DEC--SIN', dec)):
+        hdr['CTYPE{0}'.format(axis)] = ctype
+        hdr['CRPIX{0}'.format(axis)] = size / 2 + 0.5
+        hdr['CRVAL{0}'.format(axis)] = crval
+        hdr['CDELT{0}'.format(axis)] = (-1 if axis == 1 else 1) * SKY_PIXEL * rebin
+        hdr['CUNIT{0}'.format(axis)] = 'deg'
+    hdr['RADESYS'] = 'FK5'
+    hdr['EQUINOX'] = 2000.
+    return hdr
+
+
+def beta_radii(rng, n, rc, rmax):
+    """
+    Radii of n points drawn from a beta model (beta = 2/3) of core radius rc, truncated at rmax (same units).
+    The 2D cumulative distribution of (1 + r^2/rc^2)^-1.5 is inverted analytically.
+    """
+    umax = 1 - (1 + (rmax / rc) ** 2) ** -0.5
+    u = rng.uniform(0, umax, n)
+    return rc * np.sqrt((1 - u) ** -2. - 1)
+
+
+def cluster_model(size, rc=None, amplitude=1., background=0.05, nsources=20, seed=0):
+    """
+    Surface brightness image (arbitrary units) of a beta-model cluster in the centre, a flat background and point
+    sources (Gaussians of 2 pixels).
+    """
+    rng = np.random.default_rng(seed)
+    rc = rc or size / 20.
+    y, x = np.ogrid[:size, :size]
+    r2 = (x - size / 2 + 0.5) ** 2 + (y - size / 2 + 0.5) ** 2
+    model = amplitude * (1 + r2 / rc ** 2) ** -1.5 + background
+    for xs, ys, flux in zip(rng.uniform(0, size, nsources), rng.uniform(0, size, nsources), rng.lognormal(0, 1, nsources)):
+        sl = (slice(max(int(ys) - 8, 0), min(int(ys) + 9, size)), slice(max(int(xs) - 8, 0), min(int(xs) + 9, size)))
+        yy, xx = np.ogrid[sl]
+        model[sl] += flux * np.exp(-0.5 * ((xx - xs) ** 2 + (yy - ys) ** 2) / 4.)
+    return model
+
+
+def exposure_map(size, exposure=2000., seed=0):
+    """
+    Exposure map (s) with a smooth large-scale gradient, the seams of 3 x 3 survey tiles (lower exposure) and zeros
+    in the image corners, as the combined-tile expmaps.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.ogrid[:size, :size]
+    gradient = 1 + 0.3 * np.sin(np.pi * y / size + rng.uniform(0, np.pi)) * np.cos(np.pi * x / size)
+    seams = np.ones((size, size))
+    for k in (size // 3, 2 * size // 3):
+        width = max(size // 100, 1)
+        seams[k - width:k + width] *= 0.6
+        seams[:, k - width:k + width] *= 0.6
+    expo = exposure * gradient * seams
+    r2 = (x - size / 2) ** 2 + (y - size / 2) ** 2
+    expo[r2 > (0.7 * size) ** 2] = 0
+    return expo.astype(np.float32)
+
+
+def count_map(size, exposure=None, rate=2e-4, seed=0):
+    """
+    Poisson counts image of cluster_model times the exposure (exposure_map if None), with rate in cts/s/pixel at
+    the cluster centre. Returns int32 counts.
+    """
+    rng = np.random.default_rng(seed)
+    exposure = exposure_map(size, seed=seed) if exposure is None else exposure
+    return rng.poisson(rate * cluster_model(size, seed=seed) * exposure).astype(np.int32)
+
+
+def nh_map(size, nh=3e20, amplitude=0.5, scale=None, decimals=4, seed=0):
+    """
+    Smooth NH map (atoms/cm^2) around nh with relative variations of the given amplitude on scales of scale pixels
+    (default size / 4), rounded like the NH maps of the pipeline (decimals of 1e22).
+    """
+    rng = np.random.default_rng(seed)
+    scale = scale or size / 4.
+    y, x = np.ogrid[:size, :size]
+    field = np.zeros((size, size))
+    for _ in range(6):
+        kx, ky = rng.normal(0, 1 / scale, 2)
+        field += np.cos(2 * np.pi * (kx * x + ky * y) + rng.uniform(0, 2 * np.pi))
+    return np.round(nh * (1 + amplitude * field / 6.) / 1e22, decimals) * 1e22
+
+
+def simulation_rates(nh, rate0=1., slope=2.):
+    """
+    Count-rates of an absorbed spectrum as a function of NH (in 1e22): smooth and decreasing, like the XSPEC fakeit rates.
+    """
+    nh = np.asarray(nh, dtype=float)
+    return rate0 * np.exp(-slope * nh) * (1 + 0.1 * nh) / (1 + 5 * nh ** 2)
+
+
+def simulation_table(file_path, n=200, nh_min=0.001, nh_max=0.5, seed=0):
+    """
+    Write a simulation results file (columns nh rate flux exp, as RESULTS_SIM_TM*_NH_*.txt) of n NH values.
+    """
+    rng = np.random.default_rng(seed)
+    nh = np.round(np.sort(rng.uniform(nh_min, nh_max, n)), 4)
+    rate = simulation_rates(nh)
+    with open(file_path, 'w') as f:
+        f.write('nh rate flux exp\n')
+        for row in zip(nh, rate, rate * 1.2e-12, np.full(n, 2500.)):
+            f.write('{0} {1} {2} {3}\n'.format(*row))
+    return file_path
+
+
+def lightcurves(n, nbins, rate=5., flare_fraction=0.05, empty_fraction=0.1, seed=0):
+    """
+    Rates of n flaregti-like lightcurves of nbins time bins: Gaussian quiescent rate, zero-rate bins (no exposure) and
+    flares (rates several times higher) in flare_fraction of the bins.
+
+    Returns:
+    - list of numpy.ndarray: One rate array per lightcurve (lengths vary by +-10%).
+    """
+    rng = np.random.default_rng(seed)
+    curves = []
+    for _ in range(n):
+        m = int(nbins * rng.uniform(0.9, 1.1))
+        r = rng.normal(rate * rng.uniform(0.7, 1.3), 0.1 * rate, m)
+        r[rng.random(m) < flare_fraction] *= rng.uniform(2, 10)
+        r[rng.random(m) < empty_fraction] = 0
+        curves.append(np.clip(r, 0, None))
+    return curves
+
+
+def write_lightcurve(file_path, rate, timebin=20., tstart=6e8):
+    """
+    Write a lightcurve with TIME and RATE columns (first extension), as the flaregti lightcurves.
+    """
+    rate = np.asarray(rate, dtype=float)
+    cols = [fits.Column(name='TIME', format='D', array=tstart + timebin * np.arange(len(rate))),
+            fits.Column(name='RATE', format='D', array=rate)]
+    fits.HDUList([fits.PrimaryHDU(), fits.BinTableHDU.from_columns(cols, name='LIGHTCURVE')]).writeto(file_path, overwrite=True)
+    return file_path
+
+
+def write_image(file_path, data, header=None):
+    fits.PrimaryHDU(data=data, header=header).writeto(file_path, overwrite=True)
+    return file_path
+
+
+def _gti_hdu(name, tstart, duration, ngaps, rng):
+    edges = np.sort(rng.uniform(tstart, tstart + duration, 2 * ngaps))
+    start = np.concatenate([[tstart], edges[1::2]])
+    stop = np.concatenate([edges[::2], [tstart + duration]])
+    return fits.BinTableHDU.from_columns([fits.Column(name='START', format='D', array=start),
+                                          fits.Column(name='STOP', format='D', array=stop)], name=name)
+
+
+def write_events(file_path, n_events, size=3240, rebin=REBIN, ra=RA, dec=DEC, tms=range(1, 8), duration=1e5,
+                 cluster_fraction=0.3, bad_fraction=0.03, chunk=5000000, seed=0):
+    """
+    Write a synthetic eROSITA event file (EVENTS with TIME, X, Y, PI, FLAG, PAT_TYP and TM_NR, and GTI<tm> and
+    FLAREGTI<tm> extensions) of n_events events over a size x size image of rebin sky pixels.
+
+    The EVENTS table is streamed to the file chunk rows at a time, so that files of 10^9 events can be written with
+    little memory. A fraction cluster_fraction of the events follows a beta model in the centre, the others are
+    uniform; PI is drawn from a falling spectrum (eV); bad_fraction of the events have a rejected FLAG bit or
+    pattern type.
+
+    Parameters:
+    - file_path (str): Output file.
+    - n_events (int): Number of events.
+    - size (int, optional): Image size in pixels. Default is 3240.
+    - rebin (int, optional): Image pixel in sky pixels. Default is 80.
+    - ra, dec (float, optional): Pointing (REFXCRVL, REFYCRVL). Default is RA, DEC.
+    - tms (iterable, optional): Telescope modules. Default is 1-7.
+    - duration (float, optional): Length of the observation in s. Default is 1e5.
+    - cluster_fraction, bad_fraction (float, optional): See above. Default is 0.3 and 0.03.
+    - chunk (int, optional): Number of rows written at once. Default is 5000000.
+    - seed (int, optional): Random seed. Default is 0.
+    """
+    rng = np.random.default_rng(seed)
+    n_events = int(n_events)
+    tms = np.asarray(list(tms), dtype=np.int16)
+    tstart = 6e8
+    half = size * rebin / 2
+
+    table = fits.BinTableHDU(np.zeros(0, dtype=EVENT_DTYPE), name='EVENTS')
+    hdr = table.header
+    hdr['NAXIS2'] = n_events
+    for ref, ctype, crval, cdelt in (('REFX', 'RA---SIN', ra, -SKY_PIXEL), ('REFY', 'DEC--SIN', dec, SKY_PIXEL)):
+        hdr['{0}CTYP'.format(ref)] = ctype
+        hdr['{0}CRPX'.format(ref)] = 0.
+        hdr['{0}CRVL'.format(ref)] = crval
+        hdr['{0}CDLT'.format(ref)] = cdelt
+        hdr['{0}CUNI'.format(ref)] = 'deg'
+    hdr['TSTART'] = tstart
+    hdr['TSTOP'] = tstart + duration
+    hdr['RA_CEN'] = ra
+    hdr['DEC_CEN'] = dec
+
+    with open(file_path, 'wb') as f:
+        f.write(fits.PrimaryHDU().header.tostring().encode('ascii'))
+        f.write(hdr.tostring().encode('ascii'))
+        for i0 in range(0, n_events, chunk):
+            m = min(chunk, n_events - i0)
+            rows = np.zeros(m, dtype=EVENT_DTYPE)
+            rows['TIME'] = np.sort(rng.uniform(tstart, tstart + duration, m))
+            in_cluster = rng.random(m) < cluster_fraction
+            r = beta_radii(rng, m, half / 20, half)
+            phi = rng.uniform(0, 2 * np.pi, m)
+            rows['X'] = np.where(in_cluster, r * np.cos(phi), rng.uniform(-half, half, m))
+            rows['Y'] = np.where(in_cluster, r * np.sin(phi), rng.uniform(-half, half, m))
+            rows['PI'] = np.clip(200 + rng.exponential(1200, m), 200, 10000)
+            bad = rng.random(m) < bad_fraction
+            rows['FLAG'] = np.where(bad & (rng.random(m) < 0.5), 0x10, 0)
+            rows['PAT_TYP'] = np.where(bad & (rows['FLAG'] == 0), 6, rng.choice([1, 2, 3, 4], m, p=[0.6, 0.25, 0.1, 0.05]))
+            rows['TM_NR'] = rng.choice(tms, m)
+            f.write(rows.tobytes())
+        padding = (-(n_events * EVENT_DTYPE.itemsize)) % 2880
+        f.write(b'\0' * padding)
+
+    for tm in tms:
+        for gti, ngaps in (('GTI', 2), ('FLAREGTI', 6)):
+            hdu = _gti_hdu('{0}{1}'.format(gti, tm), tstart, duration, ngaps, rng)
+            fits.append(file_path, hdu.data, hdu.header)
+    return file_path
+
+
+def make_dataset(directory, size=1024, n_events=10 ** 6, n_lightcurves=100, nbins=5000, seed=0, prefix='c020_sm03_SYN_combined_tiles'):
+    """
+    Write a synthetic data set with the file names of the pipeline (missing files only, so that it can be reused):
+    event file <prefix>_0_CLfilt.fits, counts, exposure and single-exposure maps of TM8 and TM9 (CLevlistBGSUB,
+    CLexpmap, CLexpmap-single in 0.2-2.3 keV and 0.8-2.3 keV), an NH map NH_SYN.fits, simulation tables
+    RESULTS_SIM_TM1/TM5_*_NH_SYN.txt and lightcurves in lightcurve/.
+
+    Returns:
+    - dict: Paths of the products ('events', 'counts8', 'expmap8', 'nh', 'sim1', 'lightcurves', ...).
+    """
+    os.makedirs(os.path.join(directory, 'lightcurve'), exist_ok=True)
+    hdr = image_header(size)
+    paths = {'events': os.path.join(directory, '{0}_0_CLfilt.fits'.format(prefix)),
+             'nh': os.path.join(directory, 'NH_SYN.fits'),
+             'sim1': os.path.join(directory, 'RESULTS_SIM_TM1_0.2-2.3keV_NH_SYN.txt'),
+             'sim5': os.path.join(directory, 'RESULTS_SIM_TM5_0.8-2.3keV_NH_SYN.txt')}
+    if not os.path.exists(paths['events']):
+        write_events(paths['events'], n_events, size=size, seed=seed)
+    for tm, band, k in (('8', '0.2-2.3keV', 0), ('9', '0.8-2.3keV', 1)):
+        expo = None
+        for product, key in (('CLexpmap', 'expmap'), ('CLexpmap-single', 'single'), ('CLevlistBGSUB', 'counts')):
+            path = os.path.join(directory, '{0}_{1}_{2}_{3}.fits'.format(prefix, tm, product, band))
+            paths[key + tm] = path
+            if os.path.exists(path):
+                continue
+            if expo is None:
+                expo = exposure_map(size, seed=seed + k) * (1 if tm == '8' else 0.4)
+            if product == 'CLevlistBGSUB':
+                data = count_map(size, expo, seed=seed + k).astype(np.float32)
+            else:
+                data = expo * (5 if product == 'CLexpmap' else 1)
+            write_image(path, data, hdr)
+    if not os.path.exists(paths['nh']):
+        write_image(paths['nh'], nh_map(size, seed=seed).astype(np.float32), hdr)
+    for key in ('sim1', 'sim5'):
+        if not os.path.exists(paths[key]):
+            simulation_table(paths[key], seed=seed)
+    paths['lightcurves'] = []
+    for i, rate in enumerate(lightcurves(n_lightcurves, nbins, seed=seed)):
+        path = os.path.join(directory, 'lightcurve', 'SYN{0:04d}_CL_lightcurve1_20s.fits'.format(i))
+        if not os.path.exists(path):
+            write_lightcurve(path, rate)
+        paths['lightcurves'].append(path)
+    return paths
@@ -0,0 +1,248 @@
+import ast
+import getpass
+import hashlib
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import subprocess
+import tempfile
+import time
+
+STORE_DIR = os.environ.get('ARTIFACT_STORE', os.path.expanduser('~/.cache/eRASS_artifacts'))
+# folders of the pipeline modules (scripts/, filtering_and_pib_sub/, NH_absorption/)
+MODULE_DIRS = [os.path.normpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), d)) for d in ('..', '.', '../NH_absorption')]
+SCRIPT_ENV = ('PIPELINE_COMPRESSION',)  # environment settings that change the products of the pipeline scripts
+
+
+def tool_version(tool):
+    """
+    Version string of a tool: its resolved path, size and modification time (changes when the tool is reinstalled).
+    """
+    path = shutil.which(tool)
+    if path is None:
+        return 'unknown'
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    return '{0}:{1}:{2}'.format(path, stat.st_size, int(stat.st_mtime))
+
+
+def script_modules(path):
+    """
+    Pipeline modules imported by a Python script, directly or through other pipeline modules: the files <name>.py of
+    its import statements found beside the importing file or in MODULE_DIRS (other modules are not followed).
+    """
+    path = os.path.realpath(path)
+    found, todo = set(), [path]
+    while todo:
+        src = todo.pop()
+        with open(src) as f:
+            tree = ast.parse(f.read(), src)
+        names = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names.update(a.name.split('.')[0] for a in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names.add(node.module.split('.')[0])
+        for name in names:
+            for folder in [os.path.dirname(src)] + MODULE_DIRS:
+                module = os.path.realpath(os.path.join(folder, name + '.py'))
+                if os.path.isfile(module):
+                    if module not in found and module != path:
+                        found.add(module)
+                        todo.append(module)
+                    break
+    return sorted(found)
+
+
+class ArtifactStore:
+    """
+    Content-addressed store of pipeline products with provenance manifests.
+
+    A product (the set of output files of one command) is keyed by the SHA-256 of the tool, its version, the parameters
+    and the content hashes of the input files, so that it does not depend on where and under which paths it was made:
+    identical intermediates (e.g., hard-band images of the same event file) are shared by all band directories and runs.
+    Each product is kept in <root>/objects/<key[:2]>/<key>/ with its files and a manifest.json (tool, version,
+    parameters, inputs and outputs with their hashes, command, host, user, date).
+    The content hashes of the input files are cached in <root>/index.sqlite by (path, size, mtime).
+
+    Parameters:
+    - root (str, optional): Directory of the store. Default is $ARTIFACT_STORE or ~/.cache/eRASS_artifacts.
+    - link (bool, optional): If True, hard-link the files between the store and the working directories instead of
+      copying them (no extra disk space, but products must not be modified in place). Default is False.
+
+    Methods:
+    - file_hash(path): SHA-256 of a file (cached).
+    - key(tool, version, params, inputs): Key of a product.
+    - has(key), manifest(key): Is the product present / its manifest.
+    - get(key, outputs): Copy (or link) the files of a product to the output paths; False if the product is missing.
+    - put(key, outputs, info): Store output files under a key with their manifest.
+    - script_version(path, env): Version of a pipeline script (its content, its modules and SCRIPT_ENV).
+    - run(cmd, inputs, outputs, params, version, cwd): Run a command unless its product is in the store.
+    """
+    def __init__(self, root=None, link=False):
+        self.root = os.path.abspath(root or STORE_DIR)
+        self.link = link
+        os.makedirs(os.path.join(self.root, 'objects'), exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(self.root, 'index.sqlite'), timeout=60)
+        self._db.execute('CREATE TABLE IF NOT EXISTS hashes (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, sha256 TEXT)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS outputs (sha256 TEXT, key TEXT, name TEXT, PRIMARY KEY (sha256, key, name))')
+        self._db.commit()
+
+    def file_hash(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        row = self._db.execute('SELECT sha256 FROM hashes WHERE path=? AND size=? AND mtime=?', (path, stat.st_size, stat.st_mtime_ns)).fetchone()
+        if row is not None:
+            return row[0]
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 23), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        self._db.execute('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?)', (path, stat.st_size, stat.st_mtime_ns, digest))
+        self._db.commit()
+        return digest
+
+    def key(self, tool, version, params, inputs):
+        """
+        Key of a product.
+
+        Parameters:
+        - tool (str): Tool name (e.g., evtool).
+        - version (str): Tool version.
+        - params (dict or list): Parameters (JSON serialisable), without input/output paths.
+        - inputs (list of str): Input files, in the order they are used.
+        """
+        doc = {'tool': tool, 'version': version, 'params': params, 'inputs': [self.file_hash(f) for f in inputs]}
+        return hashlib.sha256(json.dumps(doc, sort_keys=True).encode()).hexdigest()
+
+    def script_version(self, path, env=None):
+        """
+        Version of a Python pipeline script: the content hashes of the script and of the pipeline modules it imports
+        (script_modules), and the settings SCRIPT_ENV of the environment env (default os.environ) it runs in, which
+        change its products (e.g., PIPELINE_COMPRESSION, the layout of the images).
+        """
+        env = os.environ if env is None else env
+        doc = {'script': self.file_hash(path),
+               'modules': {os.path.basename(m): self.file_hash(m) for m in script_modules(path)},
+               'env': {k: env.get(k) for k in SCRIPT_ENV}}
+        return hashlib.sha256(json.dumps(doc, sort_keys=True).encode()).hexdigest()
+
+    def _dir(self, key):
+        return os.path.join(self.root, 'objects', key[:2], key)
+
+    def has(self, key):
+        return os.path.exists(os.path.join(self._dir(key), 'manifest.json'))
+
+    def manifest(self, key):
+        with open(os.path.join(self._dir(key), 'manifest.json')) as f:
+            return json.load(f)
+
+    def _transfer(self, src, dst):
+        if os.path.lexists(dst):
+            os.remove(dst)
+        if self.link:
+            try:
+                os.link(src, dst)
+                return
+            except OSError:
+                pass
+        shutil.copy2(src, dst)
+
+    def get(self, key, outputs):
+        """
+        Copy (or link) the files of a stored product to the paths outputs (matched by position). Returns False if the
+        product is not in the store.
+        """
+        if not self.has(key):
+            return False
+        names = [o['name'] for o in self.manifest(key)['outputs']]
+        if len(names) != len(outputs):
+            return False
+        for name, out in zip(names, outputs):
+            self._transfer(os.path.join(self._dir(key), name), out)
+        return True
+
+    def put(self, key, outputs, info):
+        """
+        Store the files outputs under key with a manifest made of info and the output names, sizes and hashes.
+        """
+        if self.has(key):
+            return self.manifest(key)
+        os.makedirs(os.path.dirname(self._dir(key)), exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix='.tmp_', dir=os.path.dirname(self._dir(key)))
+        manifest = dict(info, key=key, outputs=[])
+        for i, out in enumerate(outputs):
+            name = '{0}_{1}'.format(i, os.path.basename(out))
+            self._transfer(out, os.path.join(tmp, name))
+            manifest['outputs'].append({'name': name, 'path': os.path.abspath(out), 'size': os.path.getsize(out), 'sha256': self.file_hash(out)})
+        with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        try:
+            os.rename(tmp, self._dir(key))
+        except OSError:
+            # stored meanwhile by another run
+            shutil.rmtree(tmp)
+        self._db.executemany('INSERT OR IGNORE INTO outputs VALUES (?, ?, ?)', [(o['sha256'], key, o['name']) for o in manifest['outputs']])
+        self._db.commit()
+        return manifest
+
+    def find(self, path):
+        """
+        Keys of the products containing a file with the content of path.
+        """
+        return [row[0] for row in self._db.execute('SELECT key FROM outputs WHERE sha256=?', (self.file_hash(path),))]
+
+    def run(self, cmd, inputs, outputs, params=None, version=None, cwd=None, **kwargs):
+        """
+        Run cmd unless the product of (tool, version, parameters, inputs) is in the store, in which case its files are
+        copied to outputs; otherwise the outputs are stored after a successful run. In the key, the input and output paths
+        in the command are replaced by placeholders, so that equal commands in different directories share their product.
+
+        Parameters:
+        - cmd (list of str): Command.
+        - inputs, outputs (list of str): Input and output files (relative to cwd).
+        - params (dict, optional): Extra parameters of the key. Default is None.
+        - version (str, optional): Tool version. Default is None (tool_version of cmd[0], or script_version for python
+          scripts).
+        - cwd (str, optional): Working directory. Default is None (current directory).
+        - kwargs: Passed to subprocess.run.
+
+        Returns:
+        - str: 'hit' (taken from the store) or 'stored'.
+        """
+        base = cwd or os.getcwd()
+        inputs_abs = [os.path.join(base, f) for f in inputs]
+        outputs_abs = [os.path.join(base, f) for f in outputs]
+        placeholders = dict([(f, '{{in{0}}}'.format(i)) for i, f in enumerate(inputs)] + [(f, '{{out{0}}}'.format(i)) for i, f in enumerate(outputs)])
+        args = []
+        for arg in cmd[1:]:
+            for path, ph in sorted(placeholders.items(), key=lambda p: -len(p[0])):
+                arg = arg.replace(path, ph)
+            args.append(arg)
+        tool = os.path.basename(cmd[0])
+        if tool.startswith('python') and len(cmd) > 1 and cmd[1].endswith('.py'):
+            # pipeline script: its content, that of its modules and its environment settings are its version
+            tool, args = os.path.basename(cmd[1]), args[1:]
+            version = version or self.script_version(os.path.join(base, cmd[1]), kwargs.get('env'))
+        version = version or tool_version(cmd[0])
+        key = self.key(tool, version, {'args': args, 'extra': params or {}}, inputs_abs)
+
+        if self.get(key, outputs_abs):
+            return 'hit'
+        start = time.time()
+        subprocess.run(cmd, cwd=cwd, check=True, **kwargs)
+        missing = [f for f in outputs_abs if not os.path.exists(f)]
+        if missing:
+            raise FileNotFoundError("{0} did not write {1}".format(tool, ', '.join(missing)))
+        self.put(key, outputs_abs, {'tool': tool, 'version': version, 'params': {'args': args, 'extra': params or {}},
+                                    'inputs': [{'path': f, 'sha256': self.file_hash(f)} for f in inputs_abs],
+                                    'command': cmd, 'cwd': os.path.abspath(base), 'elapsed': round(time.time() - start, 1),
+                                    'host': socket.gethostname(), 'user': getpass.getuser(),
+                                    'created': time.strftime('%Y-%m-%dT%H:%M:%S')})
+        return 'stored'
+
+    def close(self):
+        self._db.close()
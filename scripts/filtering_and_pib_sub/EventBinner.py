@@ -0,0 +1,165 @@
+import numpy as np
+from astropy.io import fits
+
+from ImageIO import write_image
+
+FLAG_MASK = 0xe00fff30  # evtool flag: events with any of these bits set are rejected
+PATTERN = 15  # evtool pattern: bit mask of accepted pattern types (1 single, 2 double, 4 triple, 8 quadruple)
+REBIN = 80  # evtool rebin: image pixel in sky pixels (80 x 0.05" = 4")
+
+
+def band_label(low, hie):
+    """
+    Band label of the file names, e.g., (['0.2'], ['2.3']) -> '0.2-2.3keV', (['0.2', '1.6'], ['1.35', '2.3']) -> '0.2-2.3keV_uni'.
+    """
+    return '{0}-{1}keV{2}'.format(low[0], hie[-1], '' if len(low) == 1 else '_uni')
+
+
+def image_header(evhdr, size, rebin=REBIN):
+    """
+    WCS header of a size x size image binned by rebin sky pixels, centred on the reference position of an event file
+    (REFXCRVL/REFYCRVL), as evtool images.
+    """
+    hdr = fits.Header()
+    for axis, ref in ((1, 'REFX'), (2, 'REFY')):
+        hdr['CTYPE{0}'.format(axis)] = evhdr['{0}CTYP'.format(ref)]
+        hdr['CRPIX{0}'.format(axis)] = size / 2 + 0.5
+        hdr['CRVAL{0}'.format(axis)] = evhdr['{0}CRVL'.format(ref)]
+        hdr['CDELT{0}'.format(axis)] = evhdr['{0}CDLT'.format(ref)] * rebin
+        hdr['CUNIT{0}'.format(axis)] = evhdr.get('{0}CUNI'.format(ref), 'deg')
+    for key in ('RADESYS', 'EQUINOX', 'TELESCOP', 'INSTRUME', 'OBS_ID', 'DATE-OBS', 'DATE-END', 'TSTART', 'TSTOP'):
+        if key in evhdr:
+            hdr[key] = evhdr[key]
+    return hdr
+
+
+class EventBinner:
+    """
+    Bin an eROSITA event file into many (TM, band) images while reading the EVENTS table only once.
+
+    The EVENTS table is memory-mapped and read in chunks of rows. For each chunk the evtool cuts (FLAG,
+    pattern, GTI of the TM of each event) are applied once, and every requested image is filled with
+    the counts of the pixels hit by its events (PI within its band(s)); only one int32 image per request is kept in
+    memory (see memory()).
+
+    Parameters:
+    - file_path (str): Event file (e.g., c020_sm04_A3391_combined_tiles_0_CLfilt.fits).
+    - size (int): Image size in pixels.
+    - rebin (int, optional): Image pixel size in sky pixels. Default is 80.
+    - flag (int, optional): Events with any of these FLAG bits set are rejected. Default is 0xe00fff30.
+    - pattern (int, optional): Bit mask of accepted pattern types. Default is 15.
+    - gti (str, optional): GTI extension type, the extension of TM n being <gti><n> (e.g., FLAREGTI3). Default is 'GTI'.
+    - chunk (int, optional): Number of events read at once. Default is 4000000.
+
+    Methods:
+    - add(tms, low, hie): Request the image of the TMs tms in the band(s) low-hie; returns its key.
+    - run(verbose): Read the events and fill all requested images.
+    - memory(size, n_images, chunk): Peak memory (bytes) of a run.
+    - write(key, file_path, copy_gti): Write an image as primary HDU (int32), with the GTI extensions of its TMs.
+    """
+    def __init__(self, file_path, size, rebin=REBIN, flag=FLAG_MASK, pattern=PATTERN, gti='GTI', chunk=4000000):
+        self.file_path = file_path
+        self.size = int(size)
+        self.rebin = rebin
+        self.flag = flag
+        self.pattern = pattern
+        self.gti = gti
+        self.chunk = chunk
+        self.requests = {}
+        self.images = {}
+        self.header = None
+
+    def add(self, tms, low, hie):
+        tms = tuple(sorted(int(tm) for tm in np.atleast_1d(tms)))
+        low, hie = [str(e) for e in np.atleast_1d(low)], [str(e) for e in np.atleast_1d(hie)]
+        if len(low) != len(hie):
+            raise ValueError("low and hie must have the same number of elements.")
+        key = (tms, band_label(low, hie))
+        self.requests[key] = [(float(lo) * 1000, float(hi) * 1000) for lo, hi in zip(low, hie)]  # PI in eV
+        return key
+
+    @staticmethod
+    def memory(size, n_images, chunk=4000000):
+        """
+        Approximate peak memory (bytes) of a run: one int32 image per request plus about 100 bytes per event of a chunk.
+        """
+        return 4 * int(size) ** 2 * n_images + 100 * chunk
+
+    def _gtis(self, hdul, tms):
+        gtis = {}
+        for tm in tms:
+            for name in ('{0}{1}'.format(self.gti, tm), self.gti):
+                if name in hdul:
+                    table = hdul[name].data
+                    order = np.argsort(table['START'])
+                    gtis[tm] = (np.asarray(table['START'], dtype=float)[order], np.asarray(table['STOP'], dtype=float)[order])
+                    break
+            else:
+                raise ValueError("No {0}{1} (or {0}) extension in {2}.".format(self.gti, tm, self.file_path))
+        return gtis
+
+    def run(self, verbose=False):
+        """
+        Read the events once and fill all requested images. Returns {key: image}.
+        """
+        n = self.size
+        tms = sorted({tm for key in self.requests for tm in key[0]})
+        acc = {key: np.zeros(n * n, dtype=np.int32) for key in self.requests}
+        with fits.open(self.file_path, memmap=True) as hdul:
+            events = hdul['EVENTS']
+            hdr = events.header
+            self.header = image_header(hdr, n, self.rebin)
+            gtis = self._gtis(hdul, tms)
+            x0, y0 = hdr['REFXCRPX'], hdr['REFYCRPX']
+            nrows = events.header['NAXIS2']
+
+            for i0 in range(0, nrows, self.chunk):
+                rows = slice(i0, min(i0 + self.chunk, nrows))
+                data = events.data[rows]
+                tm_nr = np.asarray(data['TM_NR'])
+                pat = np.asarray(data['PAT_TYP']).astype(np.int64)
+                good = ((np.asarray(data['FLAG']).astype(np.int64) & self.flag) == 0) & (pat >= 1) & (((self.pattern >> np.clip(pat - 1, 0, 31)) & 1) == 1)
+                ix = np.floor((np.asarray(data['X'], dtype=float) - x0) / self.rebin + n / 2).astype(np.int64)
+                iy = np.floor((np.asarray(data['Y'], dtype=float) - y0) / self.rebin + n / 2).astype(np.int64)
+                good &= (ix >= 0) & (ix < n) & (iy >= 0) & (iy < n)
+
+                time = np.asarray(data['TIME'], dtype=float)
+                in_gti = np.zeros(len(time), dtype=bool)
+                for tm in tms:
+                    sel = good & (tm_nr == tm)
+                    start, stop = gtis[tm]
+                    k = np.searchsorted(start, time[sel], side='right') - 1
+                    in_gti[sel] = (k >= 0) & (time[sel] < stop[np.clip(k, 0, None)])
+                good &= in_gti
+
+                pix = (iy * n + ix)[good]
+                pi = np.asarray(data['PI'], dtype=float)[good]
+                tm_good = tm_nr[good]
+                for key, bands in self.requests.items():
+                    sel = np.isin(tm_good, key[0]) & np.any([(pi >= lo) & (pi < hi) for lo, hi in bands], axis=0)
+                    touched, counts = np.unique(pix[sel], return_counts=True)  # only the pixels hit by this chunk
+                    acc[key][touched] += counts.astype(np.int32)
+                if verbose:
+                    print("{0}/{1} events".format(rows.stop, nrows), end='\r')
+        if verbose:
+            print()
+
+        self.images = {key: a.reshape(n, n) for key, a in acc.items()}
+        return self.images
+
+    def write(self, key, file_path, copy_gti=True, compression=None):
+        """
+        Write an image (primary HDU, int32, or RICE-compressed first extension with compression='auto' or 'rice', see
+        ImageIO.compression_kwargs; default $PIPELINE_COMPRESSION or none) and, with copy_gti, the GTI extensions of its TMs.
+        """
+        hdr = self.header.copy()
+        hdr['EMIN_EV'] = (min(lo for lo, _ in self.requests[key]), 'lower energy limit (eV)')
+        hdr['EMAX_EV'] = (max(hi for _, hi in self.requests[key]), 'upper energy limit (eV)')
+        hdr['TMS'] = (' '.join(str(tm) for tm in key[0]), 'telescope modules')
+        if copy_gti:
+            with fits.open(self.file_path, memmap=True) as events:
+                gtis = [fits.BinTableHDU(events[name].data, header=events[name].header)
+                        for name in ('{0}{1}'.format(self.gti, tm) for tm in key[0]) if name in events]
+                write_image(file_path, self.images[key], hdr, compression=compression, extensions=gtis)
+        else:
+            write_image(file_path, self.images[key], hdr, compression=compression)
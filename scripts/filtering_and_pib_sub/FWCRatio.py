@@ -0,0 +1,187 @@
+import os
+import sqlite3
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.interpolate import PchipInterpolator
+
+FWC_SCRIPT = '/vol/erosita1/data1/eROSITA/public/eRoScripts'
+REF_BAND = ('6.7', '9.0')  # hard band used to scale the PIB
+NODES = tuple('{0:g}'.format(e) for e in np.round(np.arange(0.2, 10.0001, 0.05), 2))  # energy nodes (keV) of the cumulative ratio
+
+
+def energy(value):
+    """
+    Normalised string of an energy in keV, e.g., '9.0' -> '9', so that equal energies give equal keys.
+    """
+    return '{0:g}'.format(float(value))
+
+
+def fwc_ratio(low, hie, tm, proc, ref=REF_BAND, script=FWC_SCRIPT):
+    """
+    FWC ratio of a band to the reference hard band for one TM, computed by cmp_FWCratio.csh (F. Pacaud).
+
+    Parameters:
+    - low, hie (list of str): Lower and upper energy limits of the band (one or two elements each).
+    - tm (int): Telescope module (1-7).
+    - proc (str): FWC processing version, e.g., c020.
+    - ref (tuple of str, optional): Reference hard band. Default is ('6.7', '9.0').
+    - script (str, optional): Path to the csh script. Default is FWC_SCRIPT.
+
+    Returns:
+    - float: FWC count ratio band / reference band.
+    """
+    out = subprocess.run(['csh', '-f', script, ' '.join(low), ' '.join(hie), str(tm), 'proc={0}'.format(proc),
+                          'refEmin={0}'.format(ref[0]), 'refEmax={0}'.format(ref[1])],
+                         capture_output=True, text=True, check=True)
+    return float(out.stdout.split()[-1])
+
+
+class FWCRatioTable:
+    """
+    Persistent lookup table of FWC ratios keyed by (TM, band, reference band, FWC processing version).
+
+    Parameters:
+    - file_path (str, optional): Path to the SQLite file, created if it does not exist. Default is ':memory:' (not persistent).
+    """
+    def __init__(self, file_path=':memory:'):
+        self.file_path = file_path
+        if file_path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+        self._db = sqlite3.connect(file_path, timeout=60)
+        self._db.execute('CREATE TABLE IF NOT EXISTS fwc (tm INTEGER, low TEXT, hie TEXT, ref TEXT, proc TEXT, ratio REAL, '
+                         'PRIMARY KEY (tm, low, hie, ref, proc))')
+        self._db.commit()
+
+    @staticmethod
+    def key(low, hie, tm, proc, ref=REF_BAND):
+        """
+        Return the table key of a query.
+        """
+        return (int(tm), ' '.join(energy(e) for e in low), ' '.join(energy(e) for e in hie),
+                '{0}-{1}'.format(energy(ref[0]), energy(ref[1])), str(proc))
+
+    def get_many(self, keys):
+        """
+        Return {key: ratio} for the keys present in the table.
+        """
+        found = {}
+        for key in set(keys):
+            row = self._db.execute('SELECT ratio FROM fwc WHERE tm=? AND low=? AND hie=? AND ref=? AND proc=?', key).fetchone()
+            if row is not None:
+                found[key] = row[0]
+        return found
+
+    def put_many(self, items):
+        """
+        Store {key: ratio} items.
+        """
+        self._db.executemany('INSERT OR REPLACE INTO fwc VALUES (?, ?, ?, ?, ?, ?)', [k + (v,) for k, v in items.items()])
+        self._db.commit()
+
+    def cumulative(self, tm, proc, ref=REF_BAND, start=NODES[0]):
+        """
+        Return the stored cumulative ratios C(E) = ratio(start-E keV) as (energies, ratios), sorted by energy.
+        """
+        _, low, _, ref, proc = self.key([start], [start], tm, proc, ref)
+        rows = self._db.execute("SELECT hie, ratio FROM fwc WHERE tm=? AND low=? AND ref=? AND proc=? AND hie NOT LIKE '% %'",
+                                (int(tm), low, ref, proc)).fetchall()
+        rows = sorted((float(e), r) for e, r in rows if float(e) > float(low))
+        return np.array([float(low)] + [e for e, _ in rows]), np.array([0.] + [r for _, r in rows])
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM fwc').fetchone()[0]
+
+    def close(self):
+        self._db.close()
+
+
+class FWCRatio:
+    """
+    FWC ratio service: every (TM, band, reference band, FWC processing version) is computed by cmp_FWCratio.csh
+    only once and kept in a FWCRatioTable; bulk queries compute the missing ratios in parallel.
+
+    With interpolate=True, bands that are not in the table are derived from the cumulative ratio
+    C(E) = ratio(E0-E keV) precomputed on energy nodes (see build_nodes): the ratio of the band lo-hi is
+    C(hi) - C(lo), and the ratio of a union of two bands (e.g., "0.2 1.6" - "1.35 2.3") is the sum of both.
+    C(E) is interpolated with a monotonic PCHIP interpolant between the nodes.
+
+    Parameters:
+    - table (FWCRatioTable or str, optional): Lookup table or path to its file. Default is None (in-memory table).
+    - script (str, optional): Path to cmp_FWCratio.csh. Default is FWC_SCRIPT.
+    - nproc (int, optional): Number of cmp_FWCratio.csh run in parallel. Default is 4.
+    - interpolate (bool, optional): If True, interpolate the bands missing from the table instead of computing them. Default is False.
+
+    Attributes:
+    - hits, computed, interpolated (int): Number of ratios found in the table, computed and interpolated so far.
+
+    Methods:
+    - ratios(queries): Bulk query of a list of (low, hie, tm, proc, ref).
+    - ratio(low, hie, tm, proc, ref): Single query.
+    - build_nodes(tms, proc, ref, nodes): Precompute the cumulative ratios used for the interpolation.
+    """
+    def __init__(self, table=None, script=FWC_SCRIPT, nproc=4, interpolate=False):
+        if table is None or isinstance(table, str):
+            table = FWCRatioTable(table or ':memory:')
+        self.table = table
+        self.script = script
+        self.nproc = nproc
+        self.interpolate = interpolate
+        self.hits = 0
+        self.computed = 0
+        self.interpolated = 0
+        self._cumulative = {}
+
+    def ratio(self, low, hie, tm, proc, ref=REF_BAND):
+        return self.ratios([(low, hie, tm, proc, ref)])[0]
+
+    def ratios(self, queries):
+        """
+        Return the FWC ratios of a list of queries (low, hie, tm, proc, ref), low and hie being lists of str.
+        """
+        queries = [(list(low), list(hie), tm, proc, tuple(ref)) for low, hie, tm, proc, ref in queries]
+        keys = [self.table.key(*q) for q in queries]
+        found = self.table.get_many(keys)
+        self.hits += len(set(found))
+
+        missing = {}
+        for key, q in zip(keys, queries):
+            if key in found or key in missing:
+                continue
+            value = self._interp(*q) if self.interpolate else None
+            if value is None:
+                missing[key] = q
+            else:
+                found[key] = value
+                self.interpolated += 1
+
+        if missing:
+            with ThreadPoolExecutor(self.nproc) as pool:
+                values = list(pool.map(lambda q: fwc_ratio(*q, script=self.script), missing.values()))
+            computed = dict(zip(missing, values))
+            self.table.put_many(computed)
+            self.computed += len(computed)
+            found.update(computed)
+
+        return [found[key] for key in keys]
+
+    def build_nodes(self, tms, proc, ref=REF_BAND, nodes=NODES):
+        """
+        Compute (or complete) the cumulative ratios C(E) = ratio(nodes[0]-E keV) of the TMs on the energy nodes.
+        """
+        self.ratios([([nodes[0]], [e], tm, proc, ref) for tm in tms for e in nodes[1:]])
+        for tm in tms:
+            self._cumulative.pop((int(tm), str(proc), tuple(ref)), None)
+
+    def _interp(self, low, hie, tm, proc, ref):
+        key = (int(tm), str(proc), tuple(ref))
+        if key not in self._cumulative:
+            e, c = self.table.cumulative(tm, proc, ref)
+            self._cumulative[key] = PchipInterpolator(e, c, extrapolate=False) if len(e) > 2 else None
+        interp = self._cumulative[key]
+        if interp is None:
+            return None
+
+        value = float(np.sum(interp(np.array(hie, dtype=float)) - interp(np.array(low, dtype=float))))
+        return None if np.isnan(value) else value
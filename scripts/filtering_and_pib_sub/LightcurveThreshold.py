@@ -0,0 +1,186 @@
+import numpy as np
+from astropy.io import fits
+
+
+def read_lightcurve(file_path):
+    """
+    TIME and RATE columns of a flaregti lightcurve (e.g., <tile>_CL_lightcurve1_20s.fits).
+    """
+    data = fits.getdata(file_path, 1)
+    return np.asarray(data['TIME'], dtype=float), np.asarray(data['RATE'], dtype=float)
+
+
+def calc_reduced_chi_square(fit, x, y, yerr, N, n_free):
+    """
+    Reduced chi square of a fit to histogram counts (errors of empty bins set to 1).
+
+    Parameters:
+    - fit (array): Fit values at x.
+    - x, y, yerr (arrays): Data.
+    - N (int): Total number of points.
+    - n_free (int): Number of fitted parameters.
+    """
+    yerr = np.array(yerr, dtype=float)
+    yerr[y < 1] = 1
+    return 1.0 / (N - n_free) * np.sum(((fit - y) / yerr) ** 2)
+
+
+def clip_thresholds(rates, nsigma=3.0, maxiter=20, exclude_zero=True):
+    """
+    Flare thresholds of many lightcurves at once by iterative sigma clipping of the rates.
+
+    The lightcurves are stacked in a NaN-padded 2D array; at each iteration the Gaussian (maximum likelihood:
+    mean and standard deviation) of the kept rates of every lightcurve is estimated and rates outside
+    mean +- nsigma * stddev are rejected, until no lightcurve changes.
+
+    Parameters:
+    - rates (list of arrays or 2D array): Rates of the lightcurves.
+    - nsigma (float, optional): Clipping in units of stddev. Default is 3.
+    - maxiter (int, optional): Maximum number of iterations. Default is 20.
+    - exclude_zero (bool, optional): Ignore zero rates (bins without exposure). Default is True.
+
+    Returns:
+    - dict of arrays (one element per lightcurve): 'mean', 'stddev', 'threshold' (mean + nsigma * stddev),
+      'lower' (mean - nsigma * stddev), 'mean_all', 'stddev_all' (first, unclipped estimate), 'n' (number of kept rates)
+      and 'niter'.
+    """
+    rates = [np.asarray(r, dtype=float).ravel() for r in rates]
+    size = max([len(r) for r in rates] or [0])
+    stack = np.full((len(rates), size), np.nan)
+    for i, r in enumerate(rates):
+        stack[i, :len(r)] = r
+    base = np.isfinite(stack)
+    if exclude_zero:
+        base &= stack != 0
+
+    keep = base.copy()
+    niter = np.zeros(len(rates), dtype=int)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for it in range(maxiter + 1):
+            n = keep.sum(axis=1)
+            mean = np.where(keep, stack, 0).sum(axis=1) / n
+            stddev = np.sqrt(np.where(keep, (stack - mean[:, None]) ** 2, 0).sum(axis=1) / n)
+            if it == 0:
+                mean_all, stddev_all = mean, stddev
+            if it == maxiter:
+                break
+            new = base & (np.abs(stack - mean[:, None]) <= nsigma * stddev[:, None])
+            changed = (new != keep).any(axis=1)
+            if not changed.any():
+                break
+            niter += changed
+            keep = new
+
+    return {'mean': mean, 'stddev': stddev, 'threshold': mean + nsigma * stddev, 'lower': mean - nsigma * stddev,
+            'mean_all': mean_all, 'stddev_all': stddev_all, 'n': n, 'niter': niter}
+
+
+def levmar_threshold(rate, nsigma=3.0):
+    """
+    Flare threshold of one lightcurve from three successive LevMar Gaussian fits of the rate histogram
+    (all bins, non-zero bins, nsigma-clipped non-zero bins), as in the original PY_lightcurve_check_temp.py.
+
+    Returns:
+    - dict: as clip_thresholds for one lightcurve (floats), plus 'chi2' (reduced chi square of the last fit).
+    """
+    from astropy.modeling import models, fitting
+
+    def fit(sample, bins):
+        heights, borders = np.histogram(sample, bins=bins)
+        centers = borders[:-1] + np.diff(borders) / 2
+        best_fit = fitting.LevMarLSQFitter()(models.Gaussian1D(), centers, heights)
+        chi2 = calc_reduced_chi_square(best_fit(centers), centers, heights, np.sqrt(heights), len(centers), 3)
+        return best_fit.mean.value, abs(best_fit.stddev.value), borders, chi2
+
+    rate = np.asarray(rate, dtype=float)
+    mean_all, stddev_all, borders, _ = fit(rate, 'auto')
+    rate_non0 = rate[rate != 0]
+    mean_non0, stddev_non0, _, _ = fit(rate_non0, borders)
+    rate_sig = rate_non0[np.abs(rate_non0 - mean_non0) <= nsigma * stddev_non0]
+    mean, stddev, _, chi2 = fit(rate_sig, borders)
+    return {'mean': mean, 'stddev': stddev, 'threshold': mean + nsigma * stddev, 'lower': mean - nsigma * stddev,
+            'mean_all': mean_all, 'stddev_all': stddev_all, 'n': len(rate_sig), 'niter': 3, 'chi2': chi2}
+
+
+def lost_fraction(rate, threshold):
+    """
+    Fraction of the exposed (non-zero rate) time bins above the threshold, i.e., the exposure removed by the flare GTIs.
+    NaN if there is no exposed bin or the threshold is not finite (no threshold, not "nothing lost").
+    """
+    rate = np.asarray(rate, dtype=float)
+    exposed = np.count_nonzero(rate)
+    if not exposed or not np.isfinite(threshold):
+        return np.nan
+    return np.count_nonzero(rate > threshold) / exposed
+
+
+def gaussian_chi2(rate, result):
+    """
+    Reduced chi square (calc_reduced_chi_square) of the Gaussian of a threshold result (one element of clip_thresholds)
+    against the histogram of the kept (non-zero, clipped) rates.
+    """
+    rate = np.asarray(rate, dtype=float)
+    mean, stddev = float(result['mean']), float(result['stddev'])
+    sample = rate[(rate != 0) & (rate >= result['lower']) & (rate <= result['threshold'])]
+    if len(sample) < 5 or not stddev > 0:
+        return np.nan
+    heights, borders = np.histogram(sample, bins='auto')
+    if len(heights) <= 3:
+        return np.nan
+    centers = borders[:-1] + np.diff(borders) / 2
+    fit = len(sample) * np.diff(borders) / (np.sqrt(2 * np.pi) * stddev) * np.exp(-0.5 * ((centers - mean) / stddev) ** 2)
+    return calc_reduced_chi_square(fit, centers, heights, np.sqrt(heights), len(centers), 2)
+
+
+def plot_lightcurve(t, rate, result, file_path, title='', nsigma=3.0, timebin=20):
+    """
+    Three-panel plot (lightcurve vs. time, lightcurve vs. good time, rate histogram with the Gaussian estimates)
+    of one lightcurve and its threshold result (one element of clip_thresholds or levmar_threshold), saved to file_path
+    (a file name or an open matplotlib PdfPages). matplotlib is only imported here.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.ticker import MultipleLocator
+
+    mean, stddev, lower, upper = (float(result[k]) for k in ('mean', 'stddev', 'lower', 'threshold'))
+    fig = plt.figure(figsize=(10, 8))
+    plt.subplots_adjust(hspace=0.3)
+    for panel, x in ((311, (t - t[0]) / 1e3), (312, np.arange(len(rate)) * timebin / 1e3)):
+        plt.subplot(panel)
+        plt.plot(x, rate, linewidth=1.0, color='firebrick')
+        plt.axhspan(lower, upper, color='midnightblue', alpha=0.25, label=r'${1}\sigma_{{clipped}}$={0}'.format(round(upper, 2), nsigma))
+        plt.axhline(mean, color='midnightblue', linewidth=0.75, label=r'$\mu±1\sigma$={0}±{1}'.format(round(mean, 2), round(stddev, 2)))
+        plt.xlabel('time [ks]')
+        plt.ylabel('rate\n[cts/s/deg$^2$]')
+        if panel == 312:
+            plt.ylim(0, mean + 10 * stddev)
+        plt.legend(loc='best', fontsize=11)
+        if panel == 311:
+            plt.title('\n\nflaregti (5-10 keV): {0}, timebin={1}'.format(title, timebin))
+
+    plt.subplot(313)
+    heights, borders = np.histogram(rate, bins='auto')
+    widths = np.diff(borders)
+    centers = borders[:-1] + widths / 2
+    sig = rate[(rate != 0) & (rate >= lower) & (rate <= upper)]
+    heights_sig = np.histogram(sig, bins=borders)[0]
+    x = np.linspace(borders[0], borders[-1], 10000)
+    plt.bar(centers, heights, width=widths, color='firebrick', label='5-10 keV')
+    for mu, sd, n, c in ((float(result['mean_all']), float(result['stddev_all']), len(rate), 'red'), (mean, stddev, len(sig), 'midnightblue')):
+        if sd > 0:
+            plt.plot(x, n * widths.mean() / (np.sqrt(2 * np.pi) * sd) * np.exp(-0.5 * ((x - mu) / sd) ** 2), c=c,
+                     label=r'$\mu$= {0}, $\sigma$= {1}'.format(round(mu, 3), round(sd, 3)))
+    plt.bar(centers, heights_sig, width=widths, color='midnightblue', label=r'${0}\sigma$-clipped'.format(nsigma))
+    plt.axvspan(lower, upper, color='red', alpha=0.1)
+    ax = plt.gca()
+    ax.xaxis.set_minor_locator(MultipleLocator(0.5))
+    plt.xlim(0, mean + 10 * stddev)
+    plt.xlabel('rate [cts/s/deg$^2$]')
+    plt.ylabel('counts')
+    plt.legend(loc='best', fontsize=11)
+    if hasattr(file_path, 'savefig'):
+        file_path.savefig(fig)
+    else:
+        plt.savefig(file_path)
+    plt.close(fig)
@@ -0,0 +1,199 @@
+from contextlib import ExitStack
+
+import numpy as np
+
+from ImageIO import open_image, read_header, create_image, out_dtype, row_blocks, image_sum
+from FWCRatio import FWCRatio, REF_BAND
+
+TMS = (1, 2, 3, 4, 5, 6, 7)
+TM8 = (1, 2, 3, 4, 6)  # TMs with on-chip filter
+TM9 = (5, 7)  # TMs without on-chip filter
+CHECK_BANDS = {'Hfull': ('6.0', '9.0'), 'H1': ('5.5', '6.15')}  # other reference hard bands, for comparison
+
+
+class PIBSub:
+    """
+    PIB subtraction, TM8/TM9/TM0 combination and TM9 exposure correction of the combined-tile images of an observation.
+
+    Same products as SH_PIBSUB.sh, but every input image (CLevlist, CLexpmap, CLexpmap_novign and
+    CLexpmap-single of each TM) is memory-mapped and read block by block in a single pass; the
+    intermediate files (renormalised novign maps, TM12/123/1234 sums) are never written.
+
+    Parameters:
+    - procver (str): Processing version, e.g., c020.
+    - obs (str): Observation name, e.g., em01.
+    - cluster (str): Cluster name, e.g., A3391.
+    - lowe, lowe9 (list of str): Lower energy limits of TM8 and TM9, e.g., ['0.2'] or ['0.2', '1.5'].
+    - hie (list of str): Upper energy limits, e.g., ['2.3'] or ['1.3', '2.3'].
+    - fwcproc (str, optional): FWC processing version. Default is procver.
+    - fwc (FWCRatio, optional): FWC ratio service. Default is None (ratios computed by cmp_FWCratio.csh, kept in memory only).
+    - rows (int, optional): Number of image rows per block. Default is 1024.
+    - compression (str, optional): Compression of the products (see ImageIO.compression_kwargs). Default is None ($PIPELINE_COMPRESSION or none).
+
+    Methods:
+    - name(tm, product, ...): File name of a product, following the SH_PIBSUB.sh naming scheme.
+    - fwc_ratios(ref): FWC ratios of the seven TMs.
+    - run(verbose): Create all products and return the PIB counts and correction factors.
+    """
+    def __init__(self, procver, obs, cluster, lowe, lowe9, hie, fwcproc=None, fwc=None, rows=1024, compression=None):
+        self.prefix = '{0}_{1}_{2}_combined_tiles'.format(procver, obs, cluster)
+        self.lowe = list(lowe)
+        self.lowe9 = list(lowe9)
+        self.hie = list(hie)
+        self.suff = '' if len(self.lowe) == 1 else '_uni'
+        self.fwcproc = fwcproc or procver
+        self.fwc = fwc or FWCRatio()
+        self.rows = rows
+        self.compression = compression
+
+    def low(self, tm):
+        """
+        Lower energy limits of a TM (or of the combinations 8 and 9).
+        """
+        return self.lowe9 if tm in TM9 + (9,) else self.lowe
+
+    def band(self, tm):
+        """
+        Band label of a TM in the file names, e.g., 0.2-2.3 (TM0: 0.20.8-2.3).
+        """
+        if tm == 0:
+            return '{0}{1}-{2}'.format(self.lowe[0], self.lowe9[0], self.hie[-1])
+        return '{0}-{1}'.format(self.low(tm)[0], self.hie[-1])
+
+    def name(self, tm, product, band=None, suff=None, tail=''):
+        """
+        File name of a product, e.g., name(8, 'CLexpmap') or name('0BG0', 'CLCRBGSUB', band=self.band(8), tail='_corr').
+        """
+        band = self.band(tm) if band is None else band
+        suff = self.suff if suff is None else suff
+        return '{0}_{1}_{2}_{3}keV{4}{5}.fits'.format(self.prefix, tm, product, band, suff, tail)
+
+    def fwc_ratios(self, ref=REF_BAND):
+        """
+        FWC ratios of the band of each TM to the reference hard band.
+        """
+        return self.fwc.ratios([(self.low(tm), self.hie, tm, self.fwcproc, ref) for tm in TMS])
+
+    def hard_counts(self, ref=REF_BAND):
+        """
+        Total counts of each TM in a hard band (CLevlist_<ref>keV.fits images).
+        """
+        return [image_sum(open_image(self.name(tm, 'CLevlist', band='{0}-{1}'.format(*ref), suff='')), self.rows) for tm in TMS]
+
+    def run(self, verbose=True):
+        """
+        Create the PIB maps, PIB-subtracted images, TM8/TM9/TM0 combinations and corrected TM0 count-rate maps.
+
+        Parameters:
+        - verbose (bool, optional): If True, print the intermediate values as SH_PIBSUB.sh does. Default is True.
+
+        Returns:
+        - dict: FWC ratios ('fwcrat'), PIB counts ('hr') and TM9 correction factors ('corr', 'corrs').
+        """
+        log = print if verbose else (lambda *a, **k: None)
+        products = ('CLevlist', 'CLexpmap', 'CLexpmap_novign', 'CLexpmap-single')
+        img = {(tm, p): open_image(self.name(tm, p)) for tm in TMS for p in products}
+        hdr = {(tm, p): read_header(self.name(tm, p)) for tm in TMS for p in products}
+        shape = img[(1, 'CLevlist')].shape
+        groups = {8: TM8, 9: TM9}
+
+        # Pass 1: FWC ratios of all reference bands in one bulk query, totals of the unvignetted exposure maps and of the hard band images
+        self.fwc.ratios([(self.low(tm), self.hie, tm, self.fwcproc, ref) for ref in (REF_BAND,) + tuple(CHECK_BANDS.values()) for tm in TMS])
+        log("FWC ratio values (FWC type used: {0})".format(self.fwcproc))
+        fwcrat = self.fwc_ratios()
+        log('\n'.join(str(v) for v in fwcrat))
+        tot_unvig = [image_sum(img[(tm, 'CLexpmap_novign')], self.rows) for tm in TMS]
+        log("Unvignetted values\n" + '\n'.join('{0:.5f}'.format(v) for v in tot_unvig) + '\n')
+        hard = self.hard_counts()
+        log("Hard count ({0}-{1} keV) values\n".format(*REF_BAND) + '\n'.join(str(v) for v in hard) + '\n')
+        hr = [h * r for h, r in zip(hard, fwcrat)]
+        log("Calculated PIB counts of the observation in {0}({1})-{2}{3} keV band:\n".format(self.lowe[0], self.lowe9[0], self.hie[-1], self.suff)
+            + '\n'.join('{0:.7f}'.format(v) for v in hr))
+
+        # Pass 2: PIB maps, PIB-subtracted images and TM combinations, block by block
+        log("\nCreating PIB maps (CLBGmap) and PIB subtracted photon maps (CLevlistBGSUB), combining TM8, TM9 and TM0...")
+        tot = dict.fromkeys(['BGSUB8', 'BGSUB9', 'exp8', 'exp9', 'exps8', 'exps9'], 0.)
+        renorm = dict.fromkeys(TMS, 0.)
+        with ExitStack() as stack:
+            def create(tm, product, header, dtype=np.float32):
+                return stack.enter_context(create_image(self.name(tm, product), header, shape, dtype=dtype, compression=self.compression))
+
+            src = {'CLBGmap': 'CLexpmap_novign', 'CLevlistBGSUB': 'CLevlist'}  # header taken from the first input, as farith does
+            out = {}
+            for tm in TMS:
+                for p in ('CLBGmap', 'CLevlistBGSUB'):
+                    out[(tm, p)] = create(tm, p, hdr[(tm, src[p])])
+            for g, members in groups.items():
+                for p in products:
+                    out[(g, p)] = create(g, p, hdr[(members[0], p)], out_dtype(*[img[(tm, p)] for tm in members]))
+                for p in ('CLBGmap', 'CLevlistBGSUB'):
+                    out[(g, p)] = create(g, p, hdr[(members[0], src[p])])
+            for p in ('CLevlist', 'CLexpmap', 'CLexpmap-single', 'CLBGmap', 'CLevlistBGSUB'):
+                out[(0, p)] = create(0, p, hdr[(1, src.get(p, p))], out[(8, p)].dtype)
+
+            for rows in row_blocks(shape[0], self.rows):
+                block = {}
+                for i, tm in enumerate(TMS):
+                    novign = img[(tm, 'CLexpmap_novign')][rows]
+                    renorm[tm] += np.nansum(novign, dtype=np.float64) / tot_unvig[i]
+                    block[(tm, 'CLBGmap')] = (novign / tot_unvig[i] * hr[i]).astype(np.float32)
+                    block[(tm, 'CLevlistBGSUB')] = img[(tm, 'CLevlist')][rows] - block[(tm, 'CLBGmap')]
+                    for p in products:
+                        block.setdefault((tm, p), img[(tm, p)][rows])
+                for g, members in groups.items():
+                    for p in products + ('CLBGmap', 'CLevlistBGSUB'):
+                        block[(g, p)] = sum(block[(tm, p)] for tm in members)
+                    tot['BGSUB{0}'.format(g)] += np.nansum(block[(g, 'CLevlistBGSUB')], dtype=np.float64)
+                    tot['exp{0}'.format(g)] += np.nansum(block[(g, 'CLexpmap')], dtype=np.float64)
+                    tot['exps{0}'.format(g)] += np.nansum(block[(g, 'CLexpmap-single')], dtype=np.float64)
+                for p in ('CLevlist', 'CLexpmap', 'CLexpmap-single', 'CLBGmap', 'CLevlistBGSUB'):
+                    block[(0, p)] = block[(8, p)] + block[(9, p)]
+                for key, data in out.items():
+                    data[rows] = block[key]
+
+        log("CHECK: Sum of renormed CLexpmap_novign should ~1!")
+        log('\n'.join('TM{0}: {1}'.format(tm, renorm[tm]) for tm in TMS))
+        for g in (8, 9, 0):
+            log("===> {0} is created!".format(self.name(g, 'CLevlistBGSUB')))
+
+        # Pass 3: TM9 exposure correction and TM0 count-rate maps
+        result = {'fwcrat': fwcrat, 'hr': hr}
+        bgsub0 = open_image(self.name(0, 'CLevlistBGSUB'))
+        for exp, key, tkey, cr in (('CLexpmap', 'corr', 'exp', 'CLCRBGSUB'), ('CLexpmap-single', 'corrs', 'exps', 'CLCRBGSUB-single')):
+            totexp8, totexp9 = tot[tkey + '8'], tot[tkey + '9']
+            corr = (tot['BGSUB9'] / tot['BGSUB8']) * (totexp8 / totexp9)
+            result[key] = corr
+            log("\nCalculating correction factor for {0} TM9...".format(exp))
+            log("total counts in CLevlistBGSUB_8: {0:.5f}".format(tot['BGSUB8']))
+            log("total counts in CLevlistBGSUB_9: {0:.5f}".format(tot['BGSUB9']))
+            log("total exposure in CLexp_8: {0:.5f}".format(totexp8))
+            log("total exposure in CLexp_9: {0:.5f}".format(totexp9))
+            log("correction factor (count-rate_9/count-rate_8): {0:.7f}".format(corr))
+
+            exp8, exp9 = open_image(self.name(8, exp)), open_image(self.name(9, exp))
+            band0 = self.band(8)
+            with create_image(self.name(9, exp, tail='_corr'), hdr[(5, exp)], shape, exp9.dtype, self.compression) as exp9_corr, \
+                 create_image(self.name('0BG0', exp, band=band0, tail='_corr'), hdr[(1, exp)], shape, exp8.dtype, self.compression) as exp0, \
+                 create_image(self.name('0BG0', cr, band=band0, tail='_corr'), hdr[(1, 'CLevlist')], shape, compression=self.compression) as rate:
+                for rows in row_blocks(shape[0], self.rows):
+                    e9 = exp9[rows] * corr
+                    e0 = exp8[rows] + e9
+                    exp9_corr[rows] = e9
+                    exp0[rows] = e0
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        rate[rows] = np.where(e0 != 0, bgsub0[rows] / e0, 0)  # farith DIV blank=0
+            log("===> {0} is created!".format(self.name('0BG0', cr, band=band0, tail='_corr')))
+
+        # Comparison with other reference hard bands
+        log("\n\n===> Comparing different hard bands for calculating PIB counts in {0}({1})-{2}{3} keV <=== \n Consult if the relative differences are too large!".format(
+            self.lowe[0], self.lowe9[0], self.hie[-1], self.suff))
+        for hname, ref in CHECK_BANDS.items():
+            fwcrath = self.fwc_ratios(ref=ref)
+            hrh = [h * r for h, r in zip(self.hard_counts(ref=ref), fwcrath)]
+            log("FWC ratio values (reference hard band: {0}-{1} keV ({2})) (FWC type used: {3})".format(ref[0], ref[1], hname, self.fwcproc))
+            log('\n'.join(str(v) for v in fwcrath))
+            log("Calculated PIB counts ({0}):\n".format(hname) + '\n'.join('{0:.5f}'.format(v) for v in hrh))
+            log("===> Relative difference to {0}-{1} keV band [%]: ".format(*REF_BAND)
+                + ' '.join('{0:.5f}'.format((a - b) * 100 / b) for a, b in zip(hrh, hr)) + '\n')
+
+        return result
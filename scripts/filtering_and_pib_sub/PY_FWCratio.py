@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+import argparse
+import os
+from FWCRatio import FWCRatio, FWC_SCRIPT, NODES
+
+script_version = 0.0
+script_descr="""
+FWC ratios (band / reference hard band) of the TMs, printed one per line in the order of --tms.
+Every (TM, band, reference band, FWC processing version) is computed by cmp_FWCratio.csh only once and kept in a persistent table;
+the ratios missing from the table are computed in parallel. TM5 and TM7 use the TM9 lower energy limits.
+Usage in a shell script: fwcrat=($(./PY_FWCratio.py "${lowe[*]}" "${lowe9[*]}" "${hie[*]}" --proc ${fwcproc} --ref 6.7 9.0))"""
+
+# Open argument parser
+parser = argparse.ArgumentParser(description=script_descr)
+parser.add_argument('--version',action='version',version='%(prog)s v{}'.format(script_version))
+
+# Mandatory
+parser.add_argument('lowe8',help='lower energy limit used for TM8, e.g., "0.2" or "0.2 1.5"')
+parser.add_argument('lowe9',help='lower energy limit used for TM9, e.g., "0.8" or "0.8 1.5"')
+parser.add_argument('hie',help='high energy limit of both TM types, e.g., "2.3" or "1.3 2.3"')
+parser.add_argument('--proc',required=True,help='FWC processing version (e.g., c020)')
+# Optional
+parser.add_argument('--ref',nargs=2,default=['6.7', '9.0'],metavar=('EMIN', 'EMAX'),help='reference hard band')
+parser.add_argument('--tms',nargs='+',default=list(range(1, 8)),type=int,help='TMs')
+parser.add_argument('--table',default=os.environ.get('FWC_RATIO_TABLE', os.path.expanduser('~/.cache/FWCratio.sqlite')),help='persistent FWC ratio table (env FWC_RATIO_TABLE)')
+parser.add_argument('--script',default=FWC_SCRIPT,help='path to cmp_FWCratio.csh')
+parser.add_argument('--nproc',default=4,type=int,help='number of cmp_FWCratio.csh run in parallel')
+parser.add_argument('--interpolate',action='store_true',help='interpolate the bands missing from the table between the energy nodes')
+parser.add_argument('--build-nodes',action='store_true',help='first compute the cumulative ratios on the energy nodes {0}-{1} keV'.format(NODES[0], NODES[-1]))
+
+args = parser.parse_args()
+lowe = args.lowe8.split()
+lowe9 = args.lowe9.split()
+hie = args.hie.split()
+
+fwc = FWCRatio(args.table, script=args.script, nproc=args.nproc, interpolate=args.interpolate)
+if args.build_nodes:
+    fwc.build_nodes(args.tms, args.proc, ref=args.ref)
+ratios = fwc.ratios([(lowe9 if tm in (5, 7) else lowe, hie, tm, args.proc, args.ref) for tm in args.tms])
+print('\n'.join(str(r) for r in ratios))
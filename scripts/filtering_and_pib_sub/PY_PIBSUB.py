@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+from PIBSub import PIBSub
+from ImageIO import COMPRESSION
+from FWCRatio import FWCRatio, FWC_SCRIPT
+import RunTrace
+
+script_version = 0.0
+script_descr="""
+PIB subtraction of the combined-tile images (same arguments and products as SH_PIBSUB.sh).
+Every TM's CLevlist, CLexpmap, CLexpmap_novign and CLexpmap-single images are memory-mapped and processed block by block:
+PIB maps (CLBGmap), PIB-subtracted images (CLevlistBGSUB), TM8/TM9/TM0 combinations and the TM9-corrected TM0 exposure and
+count-rate maps are computed in NumPy and only the final products are written (no _renorm or TM12/123/1234 files).
+Must be run from the cluster folder (containing filtered/ and log/)."""
+
+# Open argument parser
+parser = argparse.ArgumentParser(description=script_descr)
+parser.add_argument('--version',action='version',version='%(prog)s v{}'.format(script_version))
+
+# Mandatory (same as SH_PIBSUB.sh)
+parser.add_argument('obs',help='observation name (e.g., sm03, em01)')
+parser.add_argument('cluster',help='cluster name (e.g., A3391)')
+parser.add_argument('proc',help='processing version (e.g., c946, c010, c020)')
+parser.add_argument('lowe8',help='lower energy limit used for TM8, e.g., "0.2" or "0.2 1.5"')
+parser.add_argument('lowe9',help='lower energy limit used for TM9, e.g., "0.8" or "0.8 1.5"')
+parser.add_argument('hie',help='high energy limit of both TM types, e.g., "2.3" or "1.3 2.3"')
+parser.add_argument('fwcproc',nargs='?',default=None,help='FWC processing version (default: proc)')
+# Optional
+parser.add_argument('--rows',default=1024,type=int,help='number of image rows per block')
+parser.add_argument('--fwc-script',default=FWC_SCRIPT,help='path to cmp_FWCratio.csh')
+parser.add_argument('--fwc-table',default=os.environ.get('FWC_RATIO_TABLE', os.path.expanduser('~/.cache/FWCratio.sqlite')),help='persistent FWC ratio table (env FWC_RATIO_TABLE)')
+parser.add_argument('--fwc-interpolate',action='store_true',help='interpolate FWC ratios between precomputed energy nodes (see PY_FWCratio.py --build-nodes)')
+parser.add_argument('--compression',default=COMPRESSION,help='tile compression of the products: none, auto (RICE for integer, lossless GZIP for float images), rice, gzip or gzip:<level> (quantized floats) (env PIPELINE_COMPRESSION)')
+parser.add_argument('--no-log',action='store_true',help='print to the terminal instead of the log/ file')
+
+args = parser.parse_args()
+lowe = args.lowe8.split()
+lowe9 = args.lowe9.split()
+hie = args.hie.split()
+suff = "" if len(lowe) == 1 else "_uni"
+
+cwd = os.getcwd()
+if not args.no_log:
+    if not os.path.isdir('log'):
+        print("Creating log directory... All log files will be here.")
+        os.mkdir('log')
+    else:
+        print("log file will be at log/ dir.")
+    log = open('log/LOG_{0}_{1}_{2}_{3}-{4}keV{5}_PIBSUB_expocorr.log'.format(args.proc, args.obs, args.cluster, lowe[0], hie[-1], suff), 'w')
+    sys.stdout = sys.stderr = log
+
+os.chdir('{0}/filtered/PIBsub_{1}-{2}{3}_combinedtiles'.format(cwd, lowe[0], hie[-1], suff))
+fwc = FWCRatio(args.fwc_table, script=args.fwc_script, interpolate=args.fwc_interpolate)
+pib = PIBSub(args.proc, args.obs, args.cluster, lowe, lowe9, hie, fwcproc=args.fwcproc, fwc=fwc, rows=args.rows, compression=args.compression)
+with RunTrace.stage('pibsub', 'PIBSub', {'cluster': args.cluster, 'obs': args.obs, 'proc': args.proc}):
+    pib.run()
+print("FWC ratios: {0} from table {1}, {2} interpolated, {3} computed".format(fwc.hits, args.fwc_table, fwc.interpolated, fwc.computed))
+print("Done!")
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import subprocess
+import sys
+from ArtifactStore import ArtifactStore, STORE_DIR
+
+script_version = 0.0
+script_descr="""
+Content-addressed artifact store of pipeline products (see ArtifactStore.py).
+  run --input F... --output F... [--param k=v...] -- cmd args...
+      run the command unless its product (same tool, version, parameters and input file contents) is in the store,
+      in which case the stored outputs are copied; otherwise store the outputs with a JSON provenance manifest.
+  show KEY       print the manifest of a product
+  find FILE      print the keys (and manifests) of the products containing a file with the same content
+The store is $ARTIFACT_STORE (default ~/.cache/eRASS_artifacts)."""
+
+# the command of run follows '--'
+argv = sys.argv[1:]
+cmd = []
+if '--' in argv:
+    cmd = argv[argv.index('--') + 1:]
+    argv = argv[:argv.index('--')]
+
+# Open argument parser
+parser = argparse.ArgumentParser(description=script_descr, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--version',action='version',version='%(prog)s v{}'.format(script_version))
+
+# Mandatory
+parser.add_argument('action',choices=['run', 'show', 'find'],help='action')
+parser.add_argument('target',nargs='?',help='key (show) or file (find)')
+# Optional
+parser.add_argument('--input',nargs='+',default=[],help='input files of the command')
+parser.add_argument('--output',nargs='+',default=[],help='output files of the command')
+parser.add_argument('--param',nargs='+',default=[],help='extra key parameters as key=value')
+parser.add_argument('--tool-version',default=None,help='tool version (default: path, size and date of the executable)')
+parser.add_argument('--store',default=STORE_DIR,help='store directory')
+parser.add_argument('--link',action='store_true',help='hard-link instead of copying the files')
+
+args = parser.parse_args(argv)
+store = ArtifactStore(args.store, link=args.link or os.environ.get('ARTIFACT_LINK') == '1')
+
+if args.action == 'run':
+    if not cmd or not args.output:
+        parser.error('run needs --output and a command after --')
+    params = dict(p.split('=', 1) for p in args.param)
+    try:
+        status = store.run(cmd, args.input, args.output, params=params, version=args.tool_version)
+    except subprocess.CalledProcessError as err:
+        sys.exit(err.returncode)
+    print("[artifact] {0}: {1} ({2})".format(os.path.basename(cmd[0]), 'taken from the store' if status == 'hit' else 'stored', ' '.join(args.output)), flush=True)
+elif args.action == 'show':
+    print(json.dumps(store.manifest(args.target), indent=2, sort_keys=True))
+else:
+    for key in store.find(args.target):
+        print(key)
+        print(json.dumps(store.manifest(key), indent=2, sort_keys=True))
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import time
+from EventBinner import EventBinner, FLAG_MASK, PATTERN, REBIN
+from ImageIO import COMPRESSION
+
+script_version = 0.0
+script_descr="""
+Images of an event file in several energy bands and TM selections at once (evtool flag/pattern/GTI cuts, image=yes),
+reading the EVENTS table only once. Each image is written as primary HDU (int32, WCS of the evtool image) followed by
+the GTI extensions of its TMs, as <prefix>_<tm>_CLevlist_<band>keV[_uni].fits, where <tm> is the TM number or
+0 (TMs 1-7), 8 (TMs 1,2,3,4,6) or 9 (TMs 5,7).
+Note: these files hold no EVENTS extension, so they cannot be used as expmap input/template (use evtool for those)."""
+
+# Open argument parser
+parser = argparse.ArgumentParser(description=script_descr)
+parser.add_argument('--version',action='version',version='%(prog)s v{}'.format(script_version))
+
+# Mandatory
+parser.add_argument('eventfile',help='input event file (e.g., ../c020_sm04_A3391_combined_tiles_0_CLfilt.fits)')
+parser.add_argument('prefix',help='prefix of the output files (e.g., c020_sm04_A3391_combined_tiles)')
+parser.add_argument('size',type=int,help='size of the images in pixels unit')
+# Optional
+parser.add_argument('--band',nargs=2,action='append',metavar=('LOW','HIGH'),help='energy band in keV, e.g., --band 6.7 9.0 or --band "0.2 1.6" "1.35 2.3" (repeat for more bands)')
+parser.add_argument('--tms',nargs='+',default=['1 2 3 4 5 6 7'],help='TM selections, e.g., 1 2 "1 2 3 4 6" (one image per selection and band)')
+parser.add_argument('--gti',default='FLAREGTI',help='GTI extension type (GTI or FLAREGTI)')
+parser.add_argument('--flag',default=hex(FLAG_MASK),help='rejected FLAG bits')
+parser.add_argument('--pattern',default=PATTERN,type=int,help='accepted pattern types (bit mask)')
+parser.add_argument('--rebin',default=REBIN,type=int,help='image pixel size in sky pixels')
+parser.add_argument('--chunk',default=4000000,type=int,help='number of events read at once')
+parser.add_argument('--outdir',default='.',help='output directory')
+parser.add_argument('--compression',default=COMPRESSION,help='tile compression of the images: none, auto or rice (image in the first extension, <file>[1] for the HEASoft tools) (env PIPELINE_COMPRESSION)')
+parser.add_argument('--no-gti',action='store_true',help='do not copy the GTI extensions to the images')
+
+args = parser.parse_args()
+if not args.band:
+    parser.error('at least one --band is required')
+tm_names = {(1, 2, 3, 4, 5, 6, 7): '0', (1, 2, 3, 4, 6): '8', (5, 7): '9'}
+
+binner = EventBinner(args.eventfile, args.size, rebin=args.rebin, flag=int(args.flag, 0), pattern=args.pattern,
+                     gti=args.gti, chunk=args.chunk)
+for tms in args.tms:
+    for low, hie in args.band:
+        binner.add([int(tm) for tm in tms.split()], low.split(), hie.split())
+
+start = time.time()
+print("Binning {0} into {1} images".format(args.eventfile, len(binner.requests)), flush=True)
+images = binner.run(verbose=True)
+os.makedirs(args.outdir, exist_ok=True)
+for key, image in images.items():
+    tms, band = key
+    name = tm_names.get(tms, ''.join(str(tm) for tm in tms))
+    out = os.path.join(args.outdir, '{0}_{1}_CLevlist_{2}.fits'.format(args.prefix, name, band))
+    binner.write(key, out, copy_gti=not args.no_gti, compression=args.compression)
+    print("{0}: {1} counts".format(out, int(image.sum())))
+print("DONE in {0:.1f} s!".format(time.time() - start))
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+import argparse
+import glob
+import os
+import shlex
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+from astropy.io import fits
+import RunTrace
+
+script_version = 0.0
+script_descr="""
+Flare filtering of sky tiles with flaregti (FPfilt=0 branch of SH_filtering.sh), several tiles at once.
+For each tile: evtool (CL), radec2xy to the tile centre (RA_CEN/DEC_CEN), flaregti, PY_lightcurve_check_temp.py (threshold),
+flaregti with the threshold and evtool (CLfilt). Each tile runs in its own working directory with its own PFILES user
+directory, so the parameter files of parallel runs do not collide, and writes one log file with the output of all its steps.
+The products (<tile>_CL.fits, <tile>_CLfilt.fits, lightcurves and, with --plot, PLT_* plots) are moved to the current directory.
+Must be run from the filtered/ folder."""
+
+# Open argument parser
+parser = argparse.ArgumentParser(description=script_descr)
+parser.add_argument('--version',action='version',version='%(prog)s v{}'.format(script_version))
+
+# Mandatory
+parser.add_argument('tiles',nargs='+',help='tile names without .fits (e.g., $(cat TM0.txt))')
+# Optional
+parser.add_argument('--nproc',default=1,type=int,help='number of tiles filtered at once')
+parser.add_argument('--threads',default=1,type=int,help='OMP_NUM_THREADS of each tile')
+parser.add_argument('--timebin',default=20,type=int,help='flaregti timebin in s')
+parser.add_argument('--nsigma',default=3.0,type=float,help='sigma clipping of the lightcurve')
+parser.add_argument('--lc-method',default='clip',choices=['clip', 'levmar'],help='threshold estimate of PY_lightcurve_check_temp.py')
+parser.add_argument('--plot',action='store_true',help='plot the lightcurves (PLT_LC_*.pdf)')
+parser.add_argument('--log-dir',default='../log/filtering_tiles',help='directory of the per-tile log files')
+parser.add_argument('--keep-workdir',action='store_true',help='keep the per-tile working directories')
+
+args = parser.parse_args()
+cwd = os.getcwd()
+lc_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'PY_lightcurve_check_temp.py')
+workroot = os.path.join(cwd, 'tile_work')
+log_dir = os.path.abspath(args.log_dir)
+os.makedirs(log_dir, exist_ok=True)
+
+# PFILES = "user dir;system dir": each tile gets its own user dir, the system dir is shared
+pfiles = os.environ.get('PFILES', '')
+syspfiles = pfiles.split(';')[-1] if pfiles else os.path.join(os.environ.get('HEADAS', ''), 'syspfiles')
+
+
+def filter_tile(tile):
+    work = os.path.join(workroot, tile)
+    if os.path.isdir(work):
+        shutil.rmtree(work)
+    os.makedirs(os.path.join(work, 'pfiles'))
+    os.symlink(os.path.join(cwd, '{0}.fits'.format(tile)), os.path.join(work, '{0}.fits'.format(tile)))
+    env = dict(os.environ, PFILES='{0};{1}'.format(os.path.join(work, 'pfiles'), syspfiles), OMP_NUM_THREADS=str(args.threads))
+    timebin = args.timebin
+    threshold = None
+    start = time.time()
+
+    with open(os.path.join(log_dir, 'LOG_{0}_filtering.log'.format(tile)), 'w') as log:
+        def run(cmd):
+            log.write('\n$ {0}\n'.format(shlex.join(cmd)))
+            log.flush()
+            # stdout through a file: RunTrace.call (records the run in $PIPELINE_TRACE if set) needs no pipe
+            with tempfile.TemporaryFile('w+') as out:
+                code = RunTrace.call(cmd, 'filtering', {'tile': tile}, cwd=work, env=env, stdout=out, stderr=log)
+                out.seek(0)
+                stdout = out.read()
+            log.write(stdout)
+            log.flush()
+            if code != 0:
+                raise RuntimeError('{0} FAILED (exit code {1})'.format(cmd[0], code))
+            return stdout
+
+        try:
+            run(['evtool', 'eventfiles={0}.fits'.format(tile), 'outfile={0}_CL.fits'.format(tile), 'flag=0xe00fff30', 'gti=GTI',
+                 'pattern=15', 'emin=0.2', 'emax=10.0', 'image=yes', 'repair_gtis=yes'])
+            # rerun radec2xy using tile centre
+            header = fits.getheader(os.path.join(work, '{0}_CL.fits'.format(tile)), 'EVENTS')
+            ra1, dec1 = header['RA_CEN'], header['DEC_CEN']
+            log.write('\nRA_CEN={0} DEC_CEN={1}\n'.format(ra1, dec1))
+            run(['radec2xy', 'ra0={0}'.format(ra1), 'dec0={0}'.format(dec1), '{0}_CL.fits'.format(tile)])
+            # run flaregti for large source size and higher grid size (as area is larger)
+            flaregti = ['flaregti', '{0}_CL.fits'.format(tile), 'pimin=5000', 'source_size=150', 'gridsize=26', 'write_mask=no',
+                        'timebin={0}'.format(timebin)]
+            run(flaregti + ['lightcurve={0}_CL_lightcurve1_{1}s.fits'.format(tile, timebin)])
+            threshold = run([sys.executable, lc_script, '.', '{0}_CL'.format(tile), '--nsigma', str(args.nsigma),
+                             '--timebin', str(timebin), '--method', args.lc_method] + (['--plot'] if args.plot else [])).split()[0]
+            if not np.isfinite(float(threshold)):
+                raise RuntimeError('threshold {0} is not finite, flaregti not run'.format(threshold))
+            run(flaregti + ['lightcurve={0}_CL_lightcurve_{1}s.fits'.format(tile, timebin), 'threshold={0}'.format(threshold)])
+            run(['evtool', 'eventfiles={0}_CL.fits'.format(tile), 'outfile={0}_CLfilt.fits'.format(tile), 'flag=0xe00fff30',
+                 'gti=FLAREGTI', 'pattern=15', 'emin=0.2', 'emax=10.0', 'image=yes', 'repair_gtis=yes'])
+        except (RuntimeError, KeyError, OSError, IndexError, ValueError) as err:
+            log.write('\n{0}\n'.format(err))
+            return tile, False, time.time() - start, threshold, str(err)
+
+        products = [f for f in glob.glob(os.path.join(work, '*')) if not os.path.islink(f) and os.path.basename(f) != 'pfiles']
+        for f in products:
+            shutil.move(f, os.path.join(cwd, os.path.basename(f)))
+        log.write('\nDone in {0:.1f} s\n'.format(time.time() - start))
+
+    if not args.keep_workdir:
+        shutil.rmtree(work)
+    return tile, True, time.time() - start, threshold, ''
+
+
+print("Filtering {0} tiles with flaregti, {1} at once (logs in {2})".format(len(args.tiles), args.nproc, log_dir), flush=True)
+failed = []
+with ThreadPoolExecutor(max_workers=args.nproc) as pool:
+    futures = [pool.submit(filter_tile, tile) for tile in args.tiles]
+    for future in as_completed(futures):
+        tile, ok, elapsed, threshold, err = future.result()
+        if ok:
+            print("{0}: threshold {1}, done in {2:.1f} s".format(tile, threshold, elapsed), flush=True)
+        else:
+            failed.append(tile)
+            print("{0}: {1} (see {2}/LOG_{0}_filtering.log)".format(tile, err, log_dir), flush=True)
+
+if os.path.isdir(workroot) and not os.listdir(workroot):
+    os.rmdir(workroot)
+if failed:
+    sys.exit("{0} tile(s) FAILED: {1}".format(len(failed), ' '.join(failed)))
+print("DONE!")
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+import argparse
+import glob
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from astropy.table import Table
+from LightcurveThreshold import read_lightcurve, clip_thresholds, levmar_threshold, lost_fraction, gaussian_chi2, plot_lightcurve
+
+script_version = 0.0
+script_descr="""
+Quality check of many flaregti lightcurves in one process: the lightcurves (directories or glob patterns) are read
+concurrently, the flare thresholds of all of them are computed at once, and a summary table (threshold, mean, stddev,
+fraction of the exposure lost to the flare GTIs, reduced chi square of the Gaussian) is written, optionally with one
+multi-page PDF of all lightcurves."""
+
+# Open argument parser
+parser = argparse.ArgumentParser(description=script_descr)
+parser.add_argument('--version',action='version',version='%(prog)s v{}'.format(script_version))
+
+# Mandatory
+parser.add_argument('inputs',nargs='+',help='lightcurve files, glob patterns or directories (e.g., filtered/lightcurve/)')
+# Optional
+parser.add_argument('--timebin',default=20,type=int,help='timebin in s (lightcurves *_lightcurve1_<timebin>s.fits of directories)')
+parser.add_argument('--nsigma',default=3.0,type=float,help='sigma clipping')
+parser.add_argument('--method',default='clip',choices=['clip', 'levmar'],help='threshold estimate')
+parser.add_argument('--threads',default=8,type=int,help='number of lightcurves read at once')
+parser.add_argument('--out',default='lightcurve_QA.ecsv',help='summary table (format from the extension, e.g., .ecsv, .csv, .fits)')
+parser.add_argument('--pdf',default=None,help='multi-page PDF of all lightcurves (e.g., PLT_LC_QA.pdf)')
+
+args = parser.parse_args()
+
+files = []
+for item in args.inputs:
+    if os.path.isdir(item):
+        files += sorted(glob.glob(os.path.join(item, '*_lightcurve1_{0}s.fits'.format(args.timebin))))
+    else:
+        files += sorted(glob.glob(item)) or [item]
+files = list(dict.fromkeys(files))
+if not files:
+    parser.error('no lightcurve found')
+
+start = time.time()
+with ThreadPoolExecutor(max_workers=args.threads) as pool:
+    lightcurves = list(pool.map(read_lightcurve, files))
+print("Read {0} lightcurves in {1:.1f} s".format(len(files), time.time() - start), flush=True)
+
+if args.method == 'clip':
+    res = clip_thresholds([rate for _, rate in lightcurves], nsigma=args.nsigma)
+    results = [{k: v[i] for k, v in res.items()} for i in range(len(files))]
+else:
+    results = [levmar_threshold(rate, nsigma=args.nsigma) for _, rate in lightcurves]
+
+rows = []
+for file_path, (t, rate), result in zip(files, lightcurves, results):
+    name = re.sub(r'_lightcurve1?_\d+s\.fits$', '', os.path.basename(file_path))
+    chi2 = result['chi2'] if 'chi2' in result else gaussian_chi2(rate, result)
+    rows.append((name, len(rate), np.count_nonzero(rate), float(result['mean']), float(result['stddev']),
+                 round(float(result['threshold']), 2), lost_fraction(rate, result['threshold']), float(chi2), int(result['niter'])))
+table = Table(rows=rows, names=('tile', 'nbins', 'nexposed', 'mean', 'stddev', 'threshold', 'lost_frac', 'chi2_red', 'niter'))
+for col in ('mean', 'stddev', 'lost_frac', 'chi2_red'):
+    table[col].format = '.4g'
+table.meta['method'] = args.method
+table.meta['nsigma'] = args.nsigma
+table.write(args.out, overwrite=True)
+table.pprint(max_lines=-1, max_width=-1)
+print("Summary written to {0}".format(args.out))
+failed = [row['tile'] for row in table if not np.isfinite(row['threshold'])]
+if failed:
+    print("WARNING: no finite threshold (lost_frac is nan) for {0} tile(s): {1}".format(len(failed), ' '.join(failed)))
+
+if args.pdf:
+    from matplotlib.backends.backend_pdf import PdfPages
+    with PdfPages(args.pdf) as pdf:
+        for row, (t, rate), result in zip(table, lightcurves, results):
+            if np.isfinite(result['threshold']):
+                plot_lightcurve(t, rate, result, pdf, title=row['tile'], nsigma=args.nsigma, timebin=args.timebin)
+    print("Plots written to {0}".format(args.pdf))
+print("DONE in {0:.1f} s!".format(time.time() - start))
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+from TaskGraph import Task, TaskGraph
+from EventBinner import EventBinner
+
+script_version = 0.0
+script_descr="""
+SH_prep.sh for all TMs at once. The evtool (hard bands, science band) and expmap (merged, single, novign, single-novign)
+runs of every TM are expanded into tasks with explicit file dependencies and run concurrently within a core budget;
+tasks whose outputs are newer than their inputs are skipped, so an interrupted run can simply be restarted.
+Must be run from the cluster folder (containing filtered/ and log/). Per-task logs are in log/prep_<proc>_<obs>_<cluster>/."""
+
+# Open argument parser
+parser = argparse.ArgumentParser(description=script_descr)
+parser.add_argument('--version',action='version',version='%(prog)s v{}'.format(script_version))
+
+# Mandatory
+parser.add_argument('obs',help='observation name (e.g., sm03, em01)')
+parser.add_argument('cluster',help='cluster name (e.g., A3391)')
+parser.add_argument('proc',help='processing version (e.g., c946, c010, c020)')
+parser.add_argument('size',help='size of the image in pixels unit')
+parser.add_argument('lowe8',help='lower energy limit used for TM8, e.g., "0.2" or "0.2 1.6"')
+parser.add_argument('lowe9',help='lower energy limit used for TM9, e.g., "0.8" or "0.8 1.6"')
+parser.add_argument('hie',help='high energy limit of both TM types, e.g., "2.3" or "1.35 2.3"')
+parser.add_argument('fpfilt',type=int,choices=[0, 1],help="0: filtered with flaregti, 1: filtered with Florian's script")
+# Optional
+parser.add_argument('--tms',nargs='+',default=list(range(1, 8)),type=int,help='TMs to process')
+parser.add_argument('--cores',default=os.cpu_count(),type=int,help='total number of cores used at once')
+parser.add_argument('--memory',default=None,type=float,help='total memory in GB used at once by the PY_bin_events.py tasks (default: no limit)')
+parser.add_argument('--expmap-threads',default=4,type=int,help='OMP_NUM_THREADS of each expmap run')
+parser.add_argument('--binner',action='store_true',help='make the hard-band images with PY_bin_events.py (one read of the events per TM) instead of evtool')
+parser.add_argument('--store',default=os.environ.get('ARTIFACT_STORE'),help='artifact store (PY_artifact.py) shared by all runs: evtool, expmap and PY_bin_events.py tasks whose product is stored are not rerun (default: $ARTIFACT_STORE, none if unset)')
+parser.add_argument('--force',action='store_true',help='rerun tasks even if their outputs are up to date')
+parser.add_argument('--dry-run',action='store_true',help='only print the commands')
+
+args = parser.parse_args()
+lowe8 = args.lowe8.split()
+lowe9 = args.lowe9.split()
+hie = args.hie.split()
+gtiext = 'GTI' if args.fpfilt == 1 else 'FLAREGTI'
+suff = "" if len(lowe8) == 1 else "_uni"
+abslo = lowe8[0]
+hard_min = ('6.0', '5.5', '6.7')
+hard_max = ('9.0', '6.15', '9.0')
+
+cwd = os.getcwd()
+outdir = '{0}/filtered/PIBsub_{1}-{2}{3}_combinedtiles'.format(cwd, abslo, hie[-1], suff)
+os.makedirs(outdir, exist_ok=True)
+prefix = '{0}_{1}_{2}_combined_tiles'.format(args.proc, args.obs, args.cluster)
+binner = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'PY_bin_events.py')
+artifact = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'PY_artifact.py')
+
+
+def stored(cmd, inputs, outputs):
+    """
+    Command run through the artifact store if any (products are then shared with the other band directories and runs).
+    """
+    if not args.store:
+        return cmd
+    return [sys.executable, artifact, 'run', '--store', args.store, '--input'] + inputs + ['--output'] + outputs + ['--'] + cmd
+
+
+graph = TaskGraph(cores=args.cores, memory=args.memory, log_dir='{0}/log/prep_{1}_{2}_{3}'.format(cwd, args.proc, args.obs, args.cluster),
+                  force=args.force, dry_run=args.dry_run, stage='prep', tags={'cluster': args.cluster, 'obs': args.obs})
+
+for tm in args.tms:
+    lowe = lowe9 if tm in (5, 7) else lowe8
+    evfile = '../{0}_{1}_CLfilt.fits'.format(prefix, tm)
+    evtool = ['evtool', 'eventfiles={0}'.format(evfile), 'flag=0xe00fff30', 'gti={0}'.format(gtiext), 'pattern=15',
+              'image=yes', 'size={0}'.format(args.size), 'repair_gtis=yes']
+
+    if args.binner:
+        # hard-band images are only used as images (PIB estimate): bin them all in one pass over the events
+        outs = ['{0}_{1}_CLevlist_{2}-{3}keV.fits'.format(prefix, tm, lo, hi) for lo, hi in zip(hard_min, hard_max)]
+        cmd = [sys.executable, binner, evfile, prefix, args.size, '--tms', str(tm), '--gti', gtiext]
+        for lo, hi in zip(hard_min, hard_max):
+            cmd += ['--band', lo, hi]
+        graph.add(Task('TM{0}_binner_hard'.format(tm), stored(cmd, [evfile], outs), inputs=[evfile], outputs=outs,
+                       cost=len(outs), memory=EventBinner.memory(args.size, len(outs)) / 1e9, cwd=outdir))
+    else:
+        for lo, hi in zip(hard_min, hard_max):
+            out = '{0}_{1}_CLevlist_{2}-{3}keV.fits'.format(prefix, tm, lo, hi)
+            cmd = evtool + ['outfile={0}'.format(out), 'emin={0}'.format(lo), 'emax={0}'.format(hi)]
+            graph.add(Task('TM{0}_evtool_{1}-{2}keV'.format(tm, lo, hi), stored(cmd, [evfile], [out]), inputs=[evfile], outputs=[out], cwd=outdir))
+
+    band = '{0}-{1}'.format(lowe[0], hie[-1])
+    evlist = '{0}_{1}_CLevlist_{2}keV{3}.fits'.format(prefix, tm, band, suff)
+    cmd = evtool + ['outfile={0}'.format(evlist), 'emin={0}'.format(' '.join(lowe)), 'emax={0}'.format(' '.join(hie))]
+    graph.add(Task('TM{0}_evtool_{1}keV{2}'.format(tm, band, suff), stored(cmd, [evfile], [evlist]), inputs=[evfile], outputs=[evlist], cwd=outdir))
+    if suff:
+        # expmap of a union of bands is computed in the full continuous band
+        template = '{0}_{1}_CLevlist_{2}keV.fits'.format(prefix, tm, band)
+        cmd = evtool + ['outfile={0}'.format(template), 'emin={0}'.format(lowe[0]), 'emax={0}'.format(hie[-1])]
+        graph.add(Task('TM{0}_evtool_{1}keV'.format(tm, band), stored(cmd, [evfile], [template]), inputs=[evfile], outputs=[template], cwd=outdir))
+        emin, emax = lowe[0], hie[-1]
+    else:
+        template = evlist
+        emin, emax = ' '.join(lowe), ' '.join(hie)
+
+    expmap = ['expmap', 'inputdatasets={0}'.format(template), 'emin={0}'.format(emin), 'emax={0}'.format(emax),
+              'templateimage={0}'.format(template), 'gtitype={0}'.format(gtiext), 'withdetmaps=yes']
+    for product, options in (('CLexpmap', ['mergedmaps']),
+                             ('CLexpmap-single', ['singlemaps', 'withmergedmaps=NO', 'withsinglemaps=YES']),
+                             ('CLexpmap_novign', ['mergedmaps', 'withvignetting=no']),
+                             ('CLexpmap-single_novign', ['singlemaps', 'withvignetting=no', 'withmergedmaps=NO', 'withsinglemaps=YES'])):
+        out = '{0}_{1}_{2}_{3}keV{4}.fits'.format(prefix, tm, product, band, suff)
+        cmd = expmap + ['{0}={1}'.format(options[0], out)] + options[1:]
+        graph.add(Task('TM{0}_expmap_{1}'.format(tm, product), stored(cmd, [template], [out]), inputs=[template], outputs=[out],
+                       cores=args.expmap_threads, cost=10., cwd=outdir))
+
+ok = graph.run()
+if not ok:
+    sys.exit("Some tasks FAILED, see the logs in {0}".format(graph.log_dir))
+print("DONE!")
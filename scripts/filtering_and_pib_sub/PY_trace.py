@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import sys
+import time
+from RunTrace import call, read_trace, summarize, critical_path, format_bytes, TRACE_FILE
+
+script_version = 0.0
+script_descr="""
+Instrumentation of the pipeline runs (see RunTrace.py).
+  run [--stage S] [--tag k=v...] [--trace FILE] -- cmd args...
+      run the command and append to the JSONL trace (default $PIPELINE_TRACE) its wall time, CPU time, peak RSS and
+      bytes read and written; the exit code of the command is returned.
+  report TRACE... [--by stage tool] [--json FILE] [--baseline FILE]
+      summary per cluster (tag cluster) grouped by --by, and the critical path (chain of runs that set the elapsed time);
+      --json writes the summary, --baseline compares with a summary written before (regressions of wall time and I/O
+      throughput beyond --tolerance).
+The shell scripts of the pipeline trace their tools when PIPELINE_TRACE is set, e.g.:
+  $ PIPELINE_TRACE=$PWD/log/trace.jsonl ./SH_prep.sh ...; ./PY_trace.py report log/trace.jsonl"""
+
+# the command of run follows '--'
+argv = sys.argv[1:]
+cmd = []
+if '--' in argv:
+    cmd = argv[argv.index('--') + 1:]
+    argv = argv[:argv.index('--')]
+
+# Open argument parser
+parser = argparse.ArgumentParser(description=script_descr, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--version',action='version',version='%(prog)s v{}'.format(script_version))
+
+# Mandatory
+parser.add_argument('action',choices=['run', 'report'],help='action')
+parser.add_argument('traces',nargs='*',help='trace files (report)')
+# Optional
+parser.add_argument('--stage',default='',help='stage name of the run (e.g., filtering, prep, pibsub)')
+parser.add_argument('--tag',nargs='+',default=[],help='extra fields of the run as key=value (e.g., cluster=A3391 obs=sm03)')
+parser.add_argument('--trace',default=TRACE_FILE,help='trace file of run (default: $PIPELINE_TRACE)')
+parser.add_argument('--by',nargs='+',default=['stage', 'tool'],help='fields (or tags) grouped in the report')
+parser.add_argument('--top',default=20,type=int,help='number of groups printed per cluster')
+parser.add_argument('--json',default=None,help='write the summary to this JSON file')
+parser.add_argument('--baseline',default=None,help='summary JSON of a previous report to compare with')
+parser.add_argument('--tolerance',default=0.2,type=float,help='relative change reported as a regression')
+
+args = parser.parse_args(argv)
+
+if args.action == 'run':
+    if not cmd:
+        parser.error('run needs a command after --')
+    tags = dict(t.split('=', 1) for t in args.tag)
+    try:
+        code = call(cmd, stage=args.stage, tags=tags, trace_file=os.path.abspath(args.trace) if args.trace else None)
+    except FileNotFoundError:
+        print("{0}: command not found".format(cmd[0]), file=sys.stderr)
+        sys.exit(127)
+    sys.exit(code if code >= 0 else 128 - code)
+
+if not args.traces:
+    parser.error('report needs trace files')
+records = read_trace(args.traces)
+if not records:
+    sys.exit("No record in {0}".format(' '.join(args.traces)))
+
+clusters = {}
+for r in records:
+    clusters.setdefault(r.get('tags', {}).get('cluster', '-'), []).append(r)
+
+summary = {}
+for cluster, group in sorted(clusters.items()):
+    elapsed = max(r['end'] for r in group) - min(r['start'] for r in group)
+    rows = summarize(group, by=args.by)
+    summary[cluster] = {'elapsed': round(elapsed, 1), 'rows': rows}
+    print("\n=== cluster {0}: {1} runs, {2:.1f} h elapsed ({3} to {4}) ===".format(
+        cluster, len(group), elapsed / 3600., time.strftime('%Y-%m-%d %H:%M', time.localtime(min(r['start'] for r in group))),
+        time.strftime('%Y-%m-%d %H:%M', time.localtime(max(r['end'] for r in group)))))
+    print('{:<28}{:>6}{:>5}{:>10}{:>10}{:>6}{:>9}{:>10}{:>10}{:>8}'.format(
+        '/'.join(args.by), 'n', 'fail', 'wall[s]', 'cpu[s]', 'eff', 'rss[MB]', 'read[MB]', 'wrt[MB]', 'MB/s'))
+    for row in rows[:args.top]:
+        print('{:<28}{:>6}{:>5}{:>10.1f}{:>10.1f}{:>6.2f}{:>9.0f}{:>10.1f}{:>10.1f}{:>8.1f}'.format(
+            '/'.join(str(row[k]) for k in args.by)[:27], row['n'], row['failed'], row['wall'], row['cpu'], row['cpu_eff'],
+            row['maxrss_mb'], row['read_mb'], row['written_mb'], row['io_mb_s']))
+
+    chain = critical_path(group)
+    path_time = sum(r['wall'] for r, _ in chain)
+    print("\nCritical path: {0} runs, {1:.1f} s in runs, {2:.1f} s idle".format(len(chain), path_time, sum(gap for _, gap in chain)))
+    for r, gap in chain:
+        if r['wall'] >= 0.01 * path_time or gap >= 0.01 * path_time:
+            print("  {0:>8.1f} s {1:>5.1f}% {2:<10} {3:<20} rss {4:>7.0f} MB  I/O {5:>8} / {6:>8}{7}".format(
+                r['wall'], 100. * r['wall'] / elapsed if elapsed else 0, r['stage'][:10], r['tool'][:20], r['maxrss_mb'],
+                format_bytes(r.get('read')), format_bytes(r.get('written')), '  (after {0:.0f} s idle)'.format(gap) if gap >= 1 else ''))
+    summary[cluster]['critical_path'] = [{'stage': r['stage'], 'tool': r['tool'], 'wall': r['wall'], 'gap': round(gap, 1)} for r, gap in chain]
+
+if args.json:
+    with open(args.json, 'w') as f:
+        json.dump({'by': args.by, 'clusters': summary}, f, indent=1)
+    print("\nSummary written to {0}".format(args.json))
+
+if args.baseline:
+    with open(args.baseline) as f:
+        base = json.load(f)
+    regressions = []
+    for cluster, entry in summary.items():
+        old_rows = {tuple(row.get(k) for k in args.by): row for row in base['clusters'].get(cluster, {}).get('rows', [])}
+        for row in entry['rows']:
+            old = old_rows.get(tuple(row.get(k) for k in args.by))
+            if old is None or not old['n']:
+                continue
+            # per run, so that runs with a different number of tiles or bands can be compared
+            wall, old_wall = row['wall'] / row['n'], old['wall'] / old['n']
+            if old_wall > 1 and wall > (1 + args.tolerance) * old_wall:
+                regressions.append("{0} {1}: wall per run {2:.1f} s -> {3:.1f} s".format(cluster, '/'.join(str(row[k]) for k in args.by), old_wall, wall))
+            if old['io_mb_s'] > 0 and row['io_mb_s'] < (1 - args.tolerance) * old['io_mb_s']:
+                regressions.append("{0} {1}: I/O throughput {2:.1f} MB/s -> {3:.1f} MB/s".format(cluster, '/'.join(str(row[k]) for k in args.by), old['io_mb_s'], row['io_mb_s']))
+    print("\n{0} regression(s) with respect to {1}".format(len(regressions), args.baseline))
+    for line in regressions:
+        print("  " + line)
+    if regressions:
+        sys.exit(1)
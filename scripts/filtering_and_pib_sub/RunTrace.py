@@ -0,0 +1,191 @@
+import json
+import os
+import resource
+import shlex
+import socket
+import subprocess
+import time
+from contextlib import contextmanager
+
+TRACE_FILE = os.environ.get('PIPELINE_TRACE')
+# fields of all records, e.g. PIPELINE_TRACE_TAGS="cluster=A3391 obs=sm03" (set by the shell scripts)
+TRACE_TAGS = dict(t.split('=', 1) for t in os.environ.get('PIPELINE_TRACE_TAGS', '').split() if '=' in t)
+IO_KEYS = ('rchar', 'wchar', 'read_bytes', 'write_bytes')
+
+
+def proc_io(pid='self'):
+    """
+    I/O counters of a process from /proc/<pid>/io: 'rchar'/'wchar' (bytes read/written by the process, including the
+    page cache) and 'read_bytes'/'write_bytes' (bytes actually read from/sent to the disks). Empty dict if unavailable.
+    """
+    try:
+        with open('/proc/{0}/io'.format(pid)) as f:
+            counters = dict(line.split(':') for line in f)
+    except (OSError, ValueError):
+        return {}
+    return {k: int(counters[k]) for k in IO_KEYS if k in counters}
+
+
+def write_record(record, trace_file=None):
+    """
+    Append one record (dict) as a JSON line to the trace file (default $PIPELINE_TRACE; nothing is written if unset).
+    Single O_APPEND writes, so parallel runs can share one trace file.
+    """
+    path = trace_file or TRACE_FILE
+    if not path:
+        return
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, (json.dumps(record, sort_keys=True) + '\n').encode())
+    finally:
+        os.close(fd)
+
+
+def _record(stage, tool, cmd, start, end, utime, stime, maxrss, io, code, tags):
+    return {'stage': stage, 'tool': tool, 'cmd': cmd[:2000], 'cwd': os.getcwd(), 'host': socket.gethostname(),
+            'start': round(start, 3), 'end': round(end, 3), 'wall': round(end - start, 3),
+            'utime': round(utime, 3), 'stime': round(stime, 3), 'cpu': round(utime + stime, 3),
+            'maxrss_mb': round(maxrss / 1024., 1), 'read': io.get('rchar'), 'written': io.get('wchar'),
+            'disk_read': io.get('read_bytes'), 'disk_written': io.get('write_bytes'), 'exit': code, 'tags': dict(TRACE_TAGS, **(tags or {}))}
+
+
+def call(cmd, stage='', tags=None, trace_file=None, **kwargs):
+    """
+    Run a command like subprocess.call and append its record to the trace file: wall time, user and system CPU time,
+    peak RSS and bytes read and written by the command and all the processes it waited for.
+
+    The process is waited for without being reaped (waitid WNOWAIT) to read its final I/O counters, then reaped with
+    wait4 for its resource usage.
+
+    Parameters:
+    - cmd (list of str): Command.
+    - stage (str, optional): Pipeline stage (e.g., filtering, prep). Default is ''.
+    - tags (dict, optional): Extra fields of the record (e.g., {'cluster': 'A3391'}). Default is None.
+    - trace_file (str, optional): JSONL trace file. Default is None ($PIPELINE_TRACE).
+    - kwargs: Passed to subprocess.Popen (cwd, env, stdout, ...; no pipes that are read after the end of the command).
+
+    Returns:
+    - int: Exit code (negative signal number if killed).
+    """
+    cmd = [str(c) for c in cmd]
+    start = time.time()
+    proc = subprocess.Popen(cmd, **kwargs)
+    try:
+        os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+        io = proc_io(proc.pid)
+    except (ChildProcessError, AttributeError):
+        io = {}
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    end = time.time()
+    tool = os.path.basename(cmd[1] if os.path.basename(cmd[0]).startswith('python') and cmd[1:2] and cmd[1].endswith('.py') else cmd[0])
+    write_record(_record(stage, tool, shlex.join(cmd), start, end, usage.ru_utime, usage.ru_stime, usage.ru_maxrss,
+                         io, proc.returncode, tags), trace_file)
+    return proc.returncode
+
+
+@contextmanager
+def stage(name, tool='python', tags=None, trace_file=None):
+    """
+    Context manager recording a block of Python code of the current process as one trace record (as call). The CPU time
+    includes the child processes the block waited for (e.g., the workers of a multiprocessing pool that is closed in the
+    block); the peak RSS is the peak of the whole process (or of its largest child) up to the end of the block.
+
+    Example:
+    with stage('pibsub', 'PIBSub', {'cluster': 'A3391'}):
+        ...
+    """
+    if not (trace_file or TRACE_FILE):
+        yield
+        return
+    before, io_before, start = _usage(), proc_io(), time.time()
+    code = 0
+    try:
+        yield
+    except BaseException:
+        code = 1
+        raise
+    finally:
+        after, io_after, end = _usage(), proc_io(), time.time()
+        io = {k: io_after[k] - io_before[k] for k in io_after if k in io_before}
+        write_record(_record(name, tool, '', start, end, after[0] - before[0], after[1] - before[1], after[2], io, code, tags), trace_file)
+
+
+def _usage():
+    """
+    User and system CPU time of the current process and its waited-for children, and the largest peak RSS of both.
+    """
+    me, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    return me.ru_utime + children.ru_utime, me.ru_stime + children.ru_stime, max(me.ru_maxrss, children.ru_maxrss)
+
+
+def read_trace(paths):
+    """
+    Records of one or more JSONL trace files (lines that are not valid JSON, e.g., of an interrupted write, are skipped).
+    """
+    records = []
+    for path in [paths] if isinstance(paths, str) else paths:
+        with open(path) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    pass
+    return records
+
+
+def summarize(records, by=('stage', 'tool')):
+    """
+    Totals of the records grouped by some of their fields (or tags): number of runs, failures, wall and CPU time,
+    CPU efficiency (cpu / wall), largest peak RSS, bytes read and written and I/O throughput, sorted by total wall time.
+
+    Returns:
+    - list of dict: One per group.
+    """
+    groups = {}
+    for r in records:
+        key = tuple(r.get(k, r.get('tags', {}).get(k, '')) for k in by)
+        groups.setdefault(key, []).append(r)
+    rows = []
+    for key, group in groups.items():
+        wall = sum(r['wall'] for r in group)
+        cpu = sum(r['cpu'] for r in group)
+        io = sum((r.get('read') or 0) + (r.get('written') or 0) for r in group)
+        row = dict(zip(by, key))
+        row.update({'n': len(group), 'failed': sum(r['exit'] != 0 for r in group), 'wall': round(wall, 1), 'cpu': round(cpu, 1),
+                    'cpu_eff': round(cpu / wall, 2) if wall > 0 else 0., 'maxrss_mb': max(r['maxrss_mb'] for r in group),
+                    'read_mb': round(sum(r.get('read') or 0 for r in group) / 2 ** 20, 1),
+                    'written_mb': round(sum(r.get('written') or 0 for r in group) / 2 ** 20, 1),
+                    'io_mb_s': round(io / 2 ** 20 / wall, 1) if wall > 0 else 0.})
+        rows.append(row)
+    return sorted(rows, key=lambda row: -row['wall'])
+
+
+def critical_path(records):
+    """
+    Chain of runs that determined the elapsed time: starting from the run that ended last, each step goes to the run
+    that ended last before the current one started (the one it was waiting for). Runs nested in a longer run (e.g.,
+    tools started by a traced Python stage) are not part of the chain.
+
+    Returns:
+    - list of (record, gap): The runs in time order, with the idle time in s before each (time spent outside traced runs).
+    """
+    runs = sorted(records, key=lambda r: r['end'])
+    chain = []
+    current = runs[-1] if runs else None
+    while current is not None:
+        before = [r for r in runs if r['end'] <= current['start'] + 1e-3 and r is not current]
+        previous = before[-1] if before else None
+        chain.append((current, current['start'] - previous['end'] if previous else 0.))
+        current = previous
+    return chain[::-1]
+
+
+def format_bytes(n):
+    if n is None:
+        return '-'
+    for unit in ('B', 'kB', 'MB', 'GB'):
+        if abs(n) < 1024:
+            return '{0:.0f} {1}'.format(n, unit)
+        n /= 1024.
+    return '{0:.1f} TB'.format(n)
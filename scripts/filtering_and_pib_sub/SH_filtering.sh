@@ -2,10 +2,10 @@
 ############################################################
 # Help                                                     #
 ############################################################
-if [[ $# -ne 7 ]] || [ $1 == '-h' ]
+if [[ $# -lt 7 ]] || [[ $# -gt 8 ]] || [ $1 == '-h' ]
 then
     echo "   *** eROSITA combining and flare-filtering script ***"
-    echo "USAGE : $ ./Script.sh obs clus proc ra dec size FPfilt"
+    echo "USAGE : $ ./Script.sh obs clus proc ra dec size FPfilt [nproc]"
     echo "obs   : observation name (e.g., sm03, em01)"
     echo "clus  : cluster name (e.g., A3391)"
     echo "proc  : processing version (e.g., c946, c010, c020)"
@@ -13,6 +13,7 @@ then
     echo "dec   : Declination (degree) of the image center"
     echo "size  : image size in pixels (maximum is 18000)"
     echo -e "FPfilt: whether to filter light curve using Florian's flare filtering script (ero_FlareFilter.csh).\n         0 using flaregti, 1 using Florian's script"
+    echo "[nproc]: number of tiles filtered at once with flaregti (FPfilt=0). Default is 1"
     echo "   *** Latest version 06.04.23 @A.Veronica ***"
     echo "   *** Filtering script ero_FlareFilter.csh @F.Pacaud ***"
     echo "Print this help: $ ./Script.sh -h"
@@ -28,6 +29,7 @@ ra=$4
 dec=$5
 size=$6
 fpfilt=$7
+nproc=${8:-1}
 
 timebin=20  # flaregti timebin in s
 
@@ -45,6 +47,15 @@ exec 3>&1 4>&2
 trap 'exec 2>&4 1>&3' 0 1 2 3
 exec 1>log/LOG_${procver}_${obs}_${cluster}_filtering.log 2>&1
 
+# PIPELINE_TRACE=<file.jsonl>: record wall/CPU time, peak memory and I/O of each tool run ($ ./PY_trace.py report <file>)
+trace=""
+if [ -n "${PIPELINE_TRACE}" ]
+then
+    export PIPELINE_TRACE=$(realpath -m ${PIPELINE_TRACE})
+    export PIPELINE_TRACE_TAGS="cluster=${cluster} obs=${obs} proc=${procver}"
+    trace="$cwd/PY_trace.py run --stage filtering --"
+fi
+
 if [ ! -d "$cwd/filtered/" ]
 then
     echo "Creating filtered directory... All output will be here."
@@ -66,11 +77,11 @@ then
     echo -e "CHECK if there is 'FAILED' in any processes!\n>>>>>>>>>>>>>>>>>>>>Filtering using Florian Pacaud's script!\nRe-position tiles' center..."
     for tile in $(cat TM0.txt)
         do
-        radec2xy file="${tile}" ra0=${ra} dec0=${dec}
+        $trace radec2xy file="${tile}" ra0=${ra} dec0=${dec}
         done
 
     echo "Combining tiles..."
-    evtool eventfiles="@TM0.txt" outfile="${procver}_${obs}_${cluster}_combined_tiles_0_CL.fits" flag=0xe00fff30 gti="GTI" pattern=15 image=yes size=${size} repair_gtis=yes
+    $trace evtool eventfiles="@TM0.txt" outfile="${procver}_${obs}_${cluster}_combined_tiles_0_CL.fits" flag=0xe00fff30 gti="GTI" pattern=15 image=yes size=${size} repair_gtis=yes
 
     for tile in $(cat TM0.txt)
         do
@@ -83,33 +94,20 @@ then
     for i in "${!tm[@]}"
     do
         echo "************************* TM${tm[i]} *************************"
-        evtool eventfiles="${procver}_${obs}_${cluster}_combined_tiles_0_CL.fits" telid="${tm[i]}" outfile="${procver}_${obs}_${cluster}_combined_tiles_${tm[i]}_CL.fits" flag=0xe00fff30 gti="GTI" pattern=15 emin=0.2 emax=10.0 image=yes size=${size} repair_gtis=yes
-        fstruct ${procver}_${obs}_${cluster}_combined_tiles_${tm[i]}_CL.fits
+        $trace evtool eventfiles="${procver}_${obs}_${cluster}_combined_tiles_0_CL.fits" telid="${tm[i]}" outfile="${procver}_${obs}_${cluster}_combined_tiles_${tm[i]}_CL.fits" flag=0xe00fff30 gti="GTI" pattern=15 emin=0.2 emax=10.0 image=yes size=${size} repair_gtis=yes
+        $trace fstruct ${procver}_${obs}_${cluster}_combined_tiles_${tm[i]}_CL.fits
         echo ">>>>>>>>>>Filtering..."
-        /vol/erosita1/data1/eROSITA/eRoScripts/ero_FlareFilter.csh ${procver}_${obs}_${cluster}_combined_tiles_${tm[i]}_CL.fits FPfilt_${tm[i]} ${tm[i]}
+        $trace /vol/erosita1/data1/eROSITA/eRoScripts/ero_FlareFilter.csh ${procver}_${obs}_${cluster}_combined_tiles_${tm[i]}_CL.fits FPfilt_${tm[i]} ${tm[i]}
         echo -e "Applying new GTIs to event file... \n\n"
-        evtool eventfiles="${procver}_${obs}_${cluster}_combined_tiles_${tm[i]}_CL.fits" outfile="${procver}_${obs}_${cluster}_combined_tiles_${tm[i]}_CLfilt.fits" flag=0xe00fff30 gti=FPfilt_${tm[i]}_GTIs.fits pattern=15 emin=0.2 emax=10.0 image=yes size=${size} repair_gtis=yes
+        $trace evtool eventfiles="${procver}_${obs}_${cluster}_combined_tiles_${tm[i]}_CL.fits" outfile="${procver}_${obs}_${cluster}_combined_tiles_${tm[i]}_CLfilt.fits" flag=0xe00fff30 gti=FPfilt_${tm[i]}_GTIs.fits pattern=15 emin=0.2 emax=10.0 image=yes size=${size} repair_gtis=yes
     done
-    evtool eventfiles="@TM0filt.txt" outfile="${procver}_${obs}_${cluster}_combined_tiles_0_CLfilt.fits" flag=0xe00fff30 gti="GTI" pattern=15 image=yes size=${size} repair_gtis=yes
+    $trace evtool eventfiles="@TM0filt.txt" outfile="${procver}_${obs}_${cluster}_combined_tiles_0_CLfilt.fits" flag=0xe00fff30 gti="GTI" pattern=15 image=yes size=${size} repair_gtis=yes
 else
     echo -e ">>>>>>>>>>>>>>>>>>>>Filtering using flaregti...\n"
     sed -i 's/.fits//g' TM0.txt
 
-    for tile in $(cat TM0.txt)
-        do
-        evtool eventfiles="${tile}.fits" outfile="${tile}_CL.fits" flag=0xe00fff30 gti="GTI" pattern=15 emin=0.2 emax=10.0 image=yes repair_gtis=yes
-        # rerun radec2xy using tile centre
-        fkeypar ${tile}_CL.fits'[EVENTS]' RA_CEN
-        ra1=$(pget fkeypar value)
-        fkeypar ${tile}_CL.fits'[EVENTS]' DEC_CEN
-        dec1=$(pget fkeypar value)
-        radec2xy ra0="$ra1" dec0="$dec1" ${tile}_CL.fits
-        # run flaregti for large source size and higher grid size (as area is larger)
-        flaregti ${tile}_CL.fits pimin=5000 source_size=150 gridsize=26 lightcurve=${tile}_CL_lightcurve1_${timebin}s.fits write_mask=no timebin=${timebin}
-        threshold=$(../PY_lightcurve_check_temp.py . ${tile}_CL --nsigma 3.0 --timebin ${timebin})
-        flaregti ${tile}_CL.fits pimin=5000 source_size=150 gridsize=26 lightcurve=${tile}_CL_lightcurve_${timebin}s.fits write_mask=no threshold=${threshold} timebin=${timebin}
-        evtool eventfiles="${tile}_CL.fits" outfile="${tile}_CLfilt.fits" flag=0xe00fff30 gti="FLAREGTI" pattern=15 emin=0.2 emax=10.0 image=yes repair_gtis=yes
-        done
+    # evtool, radec2xy to the tile centre, flaregti, threshold and flaregti again, ${nproc} tile(s) at once
+    $trace ../PY_filter_tiles.py $(cat TM0.txt) --nproc ${nproc} --timebin ${timebin} --nsigma 3.0 --log-dir ../log/filtering_tiles_${procver}_${obs}_${cluster}
 
     ls -1 *_CLfilt.fits > TM0filt.txt
     tile_listfilt=TM0filt.txt
@@ -117,20 +115,20 @@ else
     echo "Re-position tiles' center..."
     for tilefilt in $(cat ${tile_listfilt})
         do
-        radec2xy file="${tilefilt}" ra0=${ra} dec0=${dec}
+        $trace radec2xy file="${tilefilt}" ra0=${ra} dec0=${dec}
         done
     
     ls -1 *_CL.fits > TM0_1.txt
     for tilecl in $(cat TM0_1.txt)
         do
-        radec2xy file="${tilecl}" ra0=${ra} dec0=${dec}
+        $trace radec2xy file="${tilecl}" ra0=${ra} dec0=${dec}
         done
 
     echo "Combining tiles CL.fits..."
-    evtool eventfiles="@TM0_1.txt" outfile="${procver}_${obs}_${cluster}_combined_tiles_0_CL.fits" flag=0xe00fff30 gti="GTI" pattern=15 image=yes size=${size} repair_gtis=yes
+    $trace evtool eventfiles="@TM0_1.txt" outfile="${procver}_${obs}_${cluster}_combined_tiles_0_CL.fits" flag=0xe00fff30 gti="GTI" pattern=15 image=yes size=${size} repair_gtis=yes
 
     echo "Combining tiles CLfilt..."
-    evtool eventfiles="@${tile_listfilt}" outfile="${procver}_${obs}_${cluster}_combined_tiles_0_CLfilt.fits" flag=0xe00fff30 gti="FLAREGTI" pattern=15 emin=0.2 emax=10.0 image=yes size=${size} repair_gtis=yes
+    $trace evtool eventfiles="@${tile_listfilt}" outfile="${procver}_${obs}_${cluster}_combined_tiles_0_CLfilt.fits" flag=0xe00fff30 gti="FLAREGTI" pattern=15 emin=0.2 emax=10.0 image=yes size=${size} repair_gtis=yes
     
     for tile in $(cat TM0.txt)
         do
@@ -141,8 +139,8 @@ else
     for i in "${!tm[@]}"
         do
         echo "************************* TM${tm[i]} *************************"
-        evtool eventfiles="${procver}_${obs}_${cluster}_combined_tiles_0_CLfilt.fits" telid="${tm[i]}" outfile="${procver}_${obs}_${cluster}_combined_tiles_${tm[i]}_CLfilt.fits" flag=0xe00fff30 gti="FLAREGTI" pattern=15 emin=0.2 emax=10.0 image=yes size=${size} repair_gtis=yes
-        fstruct ${procver}_${obs}_${cluster}_combined_tiles_${tm[i]}_CLfilt.fits
+        $trace evtool eventfiles="${procver}_${obs}_${cluster}_combined_tiles_0_CLfilt.fits" telid="${tm[i]}" outfile="${procver}_${obs}_${cluster}_combined_tiles_${tm[i]}_CLfilt.fits" flag=0xe00fff30 gti="FLAREGTI" pattern=15 emin=0.2 emax=10.0 image=yes size=${size} repair_gtis=yes
+        $trace fstruct ${procver}_${obs}_${cluster}_combined_tiles_${tm[i]}_CLfilt.fits
         done
         
     rm TM0*.txt
@@ -155,14 +153,18 @@ else
         echo "lightcurve/ exists"
     fi
 
-    mv PLT_* *lightcurve*fits lightcurve/
+    mv *lightcurve*fits lightcurve/
+    # lightcurve plots only exist with PY_filter_tiles.py --plot
+    if ls PLT_* > /dev/null 2>&1; then mv PLT_* lightcurve/; fi
+    # one QA table of the lightcurves of all tiles
+    $trace ../PY_lightcurve_qa.py lightcurve/ --timebin ${timebin} --nsigma 3.0 --out ../log/LOG_${procver}_${obs}_${cluster}_lightcurve_QA.ecsv
 
     echo "DONE!"
 fi
 
-OMP_NUM_THREADS=10 expmap inputdatasets="${procver}_${obs}_${cluster}_combined_tiles_0_CLfilt.fits" emin=0.2 emax=10.0 templateimage="${procver}_${obs}_${cluster}_combined_tiles_0_CLfilt.fits" mergedmaps="${procver}_${obs}_${cluster}_combined_tiles_0_CLfiltexpmap.fits" gtitype=FLAREGTI withdetmaps=yes
+OMP_NUM_THREADS=10 $trace expmap inputdatasets="${procver}_${obs}_${cluster}_combined_tiles_0_CLfilt.fits" emin=0.2 emax=10.0 templateimage="${procver}_${obs}_${cluster}_combined_tiles_0_CLfilt.fits" mergedmaps="${procver}_${obs}_${cluster}_combined_tiles_0_CLfiltexpmap.fits" gtitype=FLAREGTI withdetmaps=yes
 
-OMP_NUM_THREADS=10 expmap inputdatasets="${procver}_${obs}_${cluster}_combined_tiles_0_CL.fits" emin=0.2 emax=10.0 templateimage="${procver}_${obs}_${cluster}_combined_tiles_0_CL.fits" mergedmaps="${procver}_${obs}_${cluster}_combined_tiles_0_CLexpmap.fits" gtitype=GTI withdetmaps=yes
+OMP_NUM_THREADS=10 $trace expmap inputdatasets="${procver}_${obs}_${cluster}_combined_tiles_0_CL.fits" emin=0.2 emax=10.0 templateimage="${procver}_${obs}_${cluster}_combined_tiles_0_CL.fits" mergedmaps="${procver}_${obs}_${cluster}_combined_tiles_0_CLexpmap.fits" gtitype=GTI withdetmaps=yes
 
 echo -e "\nHard-band images..."
 hard_min=(5.0)
@@ -170,17 +172,17 @@ hard_max=(10.0)
 for i in "${!hard_min[@]}"
     do
     echo -e "${hard_min[i]}-${hard_max[i]} keV\nCL: evtool"
-    evtool eventfiles="${procver}_${obs}_${cluster}_combined_tiles_0_CLfilt.fits" outfile="${procver}_${obs}_${cluster}_combined_tiles_0_CLfilt_${hard_min[i]}-${hard_max[i]}keV.fits" flag=0xe00fff30 gti="FLAREGTI" pattern=15 emin=${hard_min[i]} emax=${hard_max[i]} image=yes size=${size} repair_gtis=yes
-    evtool eventfiles="${procver}_${obs}_${cluster}_combined_tiles_0_CL.fits" outfile="${procver}_${obs}_${cluster}_combined_tiles_0_CL_${hard_min[i]}-${hard_max[i]}keV.fits" flag=0xe00fff30 gti="GTI" pattern=15 emin=${hard_min[i]} emax=${hard_max[i]} image=yes size=${size} repair_gtis=yes
+    $trace evtool eventfiles="${procver}_${obs}_${cluster}_combined_tiles_0_CLfilt.fits" outfile="${procver}_${obs}_${cluster}_combined_tiles_0_CLfilt_${hard_min[i]}-${hard_max[i]}keV.fits" flag=0xe00fff30 gti="FLAREGTI" pattern=15 emin=${hard_min[i]} emax=${hard_max[i]} image=yes size=${size} repair_gtis=yes
+    $trace evtool eventfiles="${procver}_${obs}_${cluster}_combined_tiles_0_CL.fits" outfile="${procver}_${obs}_${cluster}_combined_tiles_0_CL_${hard_min[i]}-${hard_max[i]}keV.fits" flag=0xe00fff30 gti="GTI" pattern=15 emin=${hard_min[i]} emax=${hard_max[i]} image=yes size=${size} repair_gtis=yes
     echo -e "\n******************expmap******************"
-    OMP_NUM_THREADS=10 expmap inputdatasets="${procver}_${obs}_${cluster}_combined_tiles_0_CLfilt_${hard_min[i]}-${hard_max[i]}keV.fits" emin=${hard_min[i]} emax=${hard_max[i]} templateimage="${procver}_${obs}_${cluster}_combined_tiles_0_CLfilt_${hard_min[i]}-${hard_max[i]}keV.fits" mergedmaps="${procver}_${obs}_${cluster}_combined_tiles_0_CLfiltexpmap_${hard_min[i]}-${hard_max[i]}keV.fits" gtitype=FLAREGTI withdetmaps=yes
-    OMP_NUM_THREADS=10 expmap inputdatasets="${procver}_${obs}_${cluster}_combined_tiles_0_CL_${hard_min[i]}-${hard_max[i]}keV.fits" emin=${hard_min[i]} emax=${hard_max[i]} templateimage="${procver}_${obs}_${cluster}_combined_tiles_0_CL_${hard_min[i]}-${hard_max[i]}keV.fits" mergedmaps="${procver}_${obs}_${cluster}_combined_tiles_0_CLexpmap_${hard_min[i]}-${hard_max[i]}keV.fits" gtitype=GTI withdetmaps=yes
+    OMP_NUM_THREADS=10 $trace expmap inputdatasets="${procver}_${obs}_${cluster}_combined_tiles_0_CLfilt_${hard_min[i]}-${hard_max[i]}keV.fits" emin=${hard_min[i]} emax=${hard_max[i]} templateimage="${procver}_${obs}_${cluster}_combined_tiles_0_CLfilt_${hard_min[i]}-${hard_max[i]}keV.fits" mergedmaps="${procver}_${obs}_${cluster}_combined_tiles_0_CLfiltexpmap_${hard_min[i]}-${hard_max[i]}keV.fits" gtitype=FLAREGTI withdetmaps=yes
+    OMP_NUM_THREADS=10 $trace expmap inputdatasets="${procver}_${obs}_${cluster}_combined_tiles_0_CL_${hard_min[i]}-${hard_max[i]}keV.fits" emin=${hard_min[i]} emax=${hard_max[i]} templateimage="${procver}_${obs}_${cluster}_combined_tiles_0_CL_${hard_min[i]}-${hard_max[i]}keV.fits" mergedmaps="${procver}_${obs}_${cluster}_combined_tiles_0_CLexpmap_${hard_min[i]}-${hard_max[i]}keV.fits" gtitype=GTI withdetmaps=yes
     echo -e "\n******************CR-map******************"
-    farith ${procver}_${obs}_${cluster}_combined_tiles_0_CLfilt_${hard_min[i]}-${hard_max[i]}keV.fits ${procver}_${obs}_${cluster}_combined_tiles_0_CLfiltexpmap_${hard_min[i]}-${hard_max[i]}keV.fits ${procver}_${obs}_${cluster}_combined_tiles_0_CLfiltCR_${hard_min[i]}-${hard_max[i]}keV.fits DIV blank=0 clobber=yes
-    farith ${procver}_${obs}_${cluster}_combined_tiles_0_CL_${hard_min[i]}-${hard_max[i]}keV.fits ${procver}_${obs}_${cluster}_combined_tiles_0_CLexpmap_${hard_min[i]}-${hard_max[i]}keV.fits ${procver}_${obs}_${cluster}_combined_tiles_0_CLCR_${hard_min[i]}-${hard_max[i]}keV.fits DIV blank=0 clobber=yes
+    $trace farith ${procver}_${obs}_${cluster}_combined_tiles_0_CLfilt_${hard_min[i]}-${hard_max[i]}keV.fits ${procver}_${obs}_${cluster}_combined_tiles_0_CLfiltexpmap_${hard_min[i]}-${hard_max[i]}keV.fits ${procver}_${obs}_${cluster}_combined_tiles_0_CLfiltCR_${hard_min[i]}-${hard_max[i]}keV.fits DIV blank=0 clobber=yes
+    $trace farith ${procver}_${obs}_${cluster}_combined_tiles_0_CL_${hard_min[i]}-${hard_max[i]}keV.fits ${procver}_${obs}_${cluster}_combined_tiles_0_CLexpmap_${hard_min[i]}-${hard_max[i]}keV.fits ${procver}_${obs}_${cluster}_combined_tiles_0_CLCR_${hard_min[i]}-${hard_max[i]}keV.fits DIV blank=0 clobber=yes
     echo -e "\n******************Exposure Lost******************"
-    exp=$(ftstat ${procver}_${obs}_${cluster}_combined_tiles_0_CLexpmap_${hard_min[i]}-${hard_max[i]}keV.fits > /dev/null && pget ftstat sum | awk '{printf "%.5f\n", $1}')
-    expf=$(ftstat ${procver}_${obs}_${cluster}_combined_tiles_0_CLfiltexpmap_${hard_min[i]}-${hard_max[i]}keV.fits > /dev/null && pget ftstat sum | awk '{printf "%.5f\n", $1}')
+    exp=$($trace ftstat ${procver}_${obs}_${cluster}_combined_tiles_0_CLexpmap_${hard_min[i]}-${hard_max[i]}keV.fits > /dev/null && pget ftstat sum | awk '{printf "%.5f\n", $1}')
+    expf=$($trace ftstat ${procver}_${obs}_${cluster}_combined_tiles_0_CLfiltexpmap_${hard_min[i]}-${hard_max[i]}keV.fits > /dev/null && pget ftstat sum | awk '{printf "%.5f\n", $1}')
     diff=$(awk "BEGIN {printf \"%.7f\n\", (${expf} - ${exp}) * 100 / ${exp}}")
     echo "Exposure lost/gain = ${diff}%"
     done
@@ -53,6 +53,30 @@ exec 1>log/LOG_${procver}_${obs}_${cluster}_${TM}_${lowe[0]}-${hie[-1]}keV${suff
 
 cwd=$PWD
 cwdf=$cwd/filtered
+
+# PIPELINE_TRACE=<file.jsonl>: record wall/CPU time, peak memory and I/O of each tool run ($ ./PY_trace.py report <file>)
+trace=""
+if [ -n "${PIPELINE_TRACE}" ]
+then
+    export PIPELINE_TRACE=$(realpath -m ${PIPELINE_TRACE})
+    export PIPELINE_TRACE_TAGS="cluster=${cluster} obs=${obs} proc=${procver}"
+    trace="$cwd/PY_trace.py run --stage prep --"
+fi
+
+# artifact IN OUT cmd...: with ARTIFACT_STORE set, take the product from the store if it was already made
+# (same tool, parameters and input content, e.g. in another band directory or a rerun), else run cmd and store it.
+# Used for all evtool and expmap runs.
+artifact () {
+    local in=$1 out=$2
+    shift 2
+    if [ -n "${ARTIFACT_STORE}" ]
+    then
+        $trace $cwd/PY_artifact.py run --input "$in" --output "$out" -- "$@"
+    else
+        $trace "$@"
+    fi
+}
+
 cd $cwdf
 if [ ! -d "$cwdf/PIBsub_${abslo}-${hie[-1]}${suff}_combinedtiles/" ]
 then
@@ -71,16 +95,17 @@ hard_max=(9.0 6.15 9.0)
 for i in "${!hard_min[@]}"
 do
     echo -e "\n${hard_min[i]}-${hard_max[i]}keV"
+    artifact "${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLfilt.fits" "${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${hard_min[i]}-${hard_max[i]}keV.fits" \
     evtool eventfiles="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLfilt.fits" outfile="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${hard_min[i]}-${hard_max[i]}keV.fits" flag=0xe00fff30 gti="${gtiext}" pattern=15 emin=${hard_min[i]} emax=${hard_max[i]} image=yes size=${size} repair_gtis=yes
 done
 
 echo -e "\nRe-sizing event list in (${lowe[*]})-(${hie[*]}) keV for TM${TM}..."
-evtool eventfiles="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLfilt.fits" outfile="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV${suff}.fits" flag=0xe00fff30 gti="${gtiext}" pattern=15 emin="${lowe[*]}" emax="${hie[*]}" image=yes size=${size} repair_gtis=yes
+artifact "${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLfilt.fits" "${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV${suff}.fits" evtool eventfiles="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLfilt.fits" outfile="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV${suff}.fits" flag=0xe00fff30 gti="${gtiext}" pattern=15 emin="${lowe[*]}" emax="${hie[*]}" image=yes size=${size} repair_gtis=yes
 
 if [[ ${#lowe[@]} == 2 ]]
 then
     echo -e "\nRe-sizing event list in full continuous ${lowe[0]}-${hie[-1]} keV for TM${TM}..."
-    evtool eventfiles="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLfilt.fits" outfile="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV.fits" flag=0xe00fff30 gti="${gtiext}" pattern=15 emin="${lowe[0]}" emax="${hie[-1]}" image=yes size=${size} repair_gtis=yes
+    artifact "${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLfilt.fits" "${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV.fits" evtool eventfiles="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLfilt.fits" outfile="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV.fits" flag=0xe00fff30 gti="${gtiext}" pattern=15 emin="${lowe[0]}" emax="${hie[-1]}" image=yes size=${size} repair_gtis=yes
 fi
 
 rm *_${TM}_CLfilt.fits
@@ -88,20 +113,20 @@ rm *_${TM}_CLfilt.fits
 if [[ ${#lowe[@]} == 1 ]]
 then
     echo -e "\nRe-sizing expmap in ${lowe[*]}-${hie[*]} keV for TM${TM}..."
-    OMP_NUM_THREADS=10 expmap inputdatasets="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV${suff}.fits" emin="${lowe[*]}" emax="${hie[*]}" templateimage="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV${suff}.fits" mergedmaps="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLexpmap_${lowe[0]}-${hie[-1]}keV${suff}.fits" gtitype=${gtiext} withdetmaps=yes
+    OMP_NUM_THREADS=10 artifact "${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV${suff}.fits" "${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLexpmap_${lowe[0]}-${hie[-1]}keV${suff}.fits" expmap inputdatasets="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV${suff}.fits" emin="${lowe[*]}" emax="${hie[*]}" templateimage="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV${suff}.fits" mergedmaps="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLexpmap_${lowe[0]}-${hie[-1]}keV${suff}.fits" gtitype=${gtiext} withdetmaps=yes
     echo -e "\nRe-sizing expmap-SINGLE in ${lowe[*]}-${hie[*]} keV for TM${TM}..."
-    OMP_NUM_THREADS=10 expmap inputdatasets="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV${suff}.fits" emin="${lowe[*]}" emax="${hie[*]}" templateimage="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV${suff}.fits" singlemaps="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLexpmap-single_${lowe[0]}-${hie[-1]}keV${suff}.fits" gtitype=${gtiext} withdetmaps=yes withmergedmaps=NO withsinglemaps=YES
+    OMP_NUM_THREADS=10 artifact "${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV${suff}.fits" "${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLexpmap-single_${lowe[0]}-${hie[-1]}keV${suff}.fits" expmap inputdatasets="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV${suff}.fits" emin="${lowe[*]}" emax="${hie[*]}" templateimage="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV${suff}.fits" singlemaps="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLexpmap-single_${lowe[0]}-${hie[-1]}keV${suff}.fits" gtitype=${gtiext} withdetmaps=yes withmergedmaps=NO withsinglemaps=YES
     echo -e "\nFlat exposure map TM${TM}..."
-    OMP_NUM_THREADS=10 expmap inputdatasets="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV${suff}.fits" emin="${lowe[*]}" emax="${hie[*]}" templateimage="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV${suff}.fits" mergedmaps="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLexpmap_novign_${lowe[0]}-${hie[-1]}keV${suff}.fits" gtitype=${gtiext} withdetmaps=yes withvignetting=no
-    OMP_NUM_THREADS=10 expmap inputdatasets="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV${suff}.fits" emin="${lowe[*]}" emax="${hie[*]}" templateimage="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV${suff}.fits" singlemaps="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLexpmap-single_novign_${lowe[0]}-${hie[-1]}keV${suff}.fits" gtitype=${gtiext} withdetmaps=yes withvignetting=no withmergedmaps=NO withsinglemaps=YES
+    OMP_NUM_THREADS=10 artifact "${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV${suff}.fits" "${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLexpmap_novign_${lowe[0]}-${hie[-1]}keV${suff}.fits" expmap inputdatasets="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV${suff}.fits" emin="${lowe[*]}" emax="${hie[*]}" templateimage="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV${suff}.fits" mergedmaps="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLexpmap_novign_${lowe[0]}-${hie[-1]}keV${suff}.fits" gtitype=${gtiext} withdetmaps=yes withvignetting=no
+    OMP_NUM_THREADS=10 artifact "${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV${suff}.fits" "${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLexpmap-single_novign_${lowe[0]}-${hie[-1]}keV${suff}.fits" expmap inputdatasets="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV${suff}.fits" emin="${lowe[*]}" emax="${hie[*]}" templateimage="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV${suff}.fits" singlemaps="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLexpmap-single_novign_${lowe[0]}-${hie[-1]}keV${suff}.fits" gtitype=${gtiext} withdetmaps=yes withvignetting=no withmergedmaps=NO withsinglemaps=YES
 else
     echo -e "\nRe-sizing expmap in full ${lowe[0]} - ${hie[-1]} keV band for TM${TM}.\n*${suff}* is used for file name suffix..."
-    OMP_NUM_THREADS=10 expmap inputdatasets="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV.fits" emin="${lowe[0]}" emax="${hie[-1]}" templateimage="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV.fits" mergedmaps="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLexpmap_${lowe[0]}-${hie[-1]}keV${suff}.fits" gtitype=${gtiext} withdetmaps=yes
+    OMP_NUM_THREADS=10 artifact "${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV.fits" "${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLexpmap_${lowe[0]}-${hie[-1]}keV${suff}.fits" expmap inputdatasets="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV.fits" emin="${lowe[0]}" emax="${hie[-1]}" templateimage="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV.fits" mergedmaps="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLexpmap_${lowe[0]}-${hie[-1]}keV${suff}.fits" gtitype=${gtiext} withdetmaps=yes
     echo -e "\nRe-sizing expmap-SINGLE in ${lowe[*]}-${hie[*]} keV for TM${TM}..."
-    OMP_NUM_THREADS=10 expmap inputdatasets="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV.fits" emin="${lowe[0]}" emax="${hie[-1]}" templateimage="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV.fits" singlemaps="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLexpmap-single_${lowe[0]}-${hie[-1]}keV${suff}.fits" gtitype=${gtiext} withdetmaps=yes withmergedmaps=NO withsinglemaps=YES
+    OMP_NUM_THREADS=10 artifact "${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV.fits" "${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLexpmap-single_${lowe[0]}-${hie[-1]}keV${suff}.fits" expmap inputdatasets="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV.fits" emin="${lowe[0]}" emax="${hie[-1]}" templateimage="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV.fits" singlemaps="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLexpmap-single_${lowe[0]}-${hie[-1]}keV${suff}.fits" gtitype=${gtiext} withdetmaps=yes withmergedmaps=NO withsinglemaps=YES
     echo -e "\nFlat exposure map TM${TM}..."
-    OMP_NUM_THREADS=10 expmap inputdatasets="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV.fits" emin="${lowe[0]}" emax="${hie[-1]}" templateimage="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV.fits" mergedmaps="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLexpmap_novign_${lowe[0]}-${hie[-1]}keV${suff}.fits" gtitype=${gtiext} withdetmaps=yes withvignetting=no
-    OMP_NUM_THREADS=10 expmap inputdatasets="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV.fits" emin="${lowe[0]}" emax="${hie[-1]}" templateimage="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV.fits" singlemaps="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLexpmap-single_novign_${lowe[0]}-${hie[-1]}keV${suff}.fits" gtitype=${gtiext} withdetmaps=yes withvignetting=no withmergedmaps=NO withsinglemaps=YES
+    OMP_NUM_THREADS=10 artifact "${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV.fits" "${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLexpmap_novign_${lowe[0]}-${hie[-1]}keV${suff}.fits" expmap inputdatasets="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV.fits" emin="${lowe[0]}" emax="${hie[-1]}" templateimage="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV.fits" mergedmaps="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLexpmap_novign_${lowe[0]}-${hie[-1]}keV${suff}.fits" gtitype=${gtiext} withdetmaps=yes withvignetting=no
+    OMP_NUM_THREADS=10 artifact "${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV.fits" "${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLexpmap-single_novign_${lowe[0]}-${hie[-1]}keV${suff}.fits" expmap inputdatasets="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV.fits" emin="${lowe[0]}" emax="${hie[-1]}" templateimage="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLevlist_${lowe[0]}-${hie[-1]}keV.fits" singlemaps="${procver}_${obs}_${cluster}_combined_tiles_${TM}_CLexpmap-single_novign_${lowe[0]}-${hie[-1]}keV${suff}.fits" gtitype=${gtiext} withdetmaps=yes withvignetting=no withmergedmaps=NO withsinglemaps=YES
 fi
 
 echo "DONE!"
@@ -0,0 +1,232 @@
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+import time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import RunTrace
+
+
+class Task:
+    """
+    A command with explicit input and output files.
+
+    Parameters:
+    - name (str): Unique task name (also the name of its log file).
+    - cmd (list of str): Command and arguments (run without a shell).
+    - inputs (list of str, optional): Files read by the task. Default is None.
+    - outputs (list of str, optional): Files written by the task. Default is None.
+    - cores (int, optional): Number of cores used by the task (OMP_NUM_THREADS is set to it). Default is 1.
+    - cost (float, optional): Relative run time, used to start the longest chains first. Default is 1.
+    - memory (float, optional): Peak memory of the task in GB, counted against the memory budget of the graph. Default is 0.
+    - cwd (str, optional): Working directory. Default is None (current directory).
+    - env (dict, optional): Extra environment variables. Default is None.
+
+    Attributes:
+    - status (str): 'pending', 'done', 'skipped' (up to date), 'failed' or 'cancelled' (a dependency failed).
+    - elapsed (float): Run time in seconds.
+    """
+    def __init__(self, name, cmd, inputs=None, outputs=None, cores=1, cost=1., memory=0., cwd=None, env=None):
+        self.name = name
+        self.cmd = [str(c) for c in cmd]
+        self.inputs = list(inputs or [])
+        self.outputs = list(outputs or [])
+        self.cores = cores
+        self.cost = cost
+        self.memory = memory
+        self.cwd = cwd
+        self.env = dict(env or {})
+        self.status = 'pending'
+        self.elapsed = 0.
+
+    def _path(self, f):
+        return f if self.cwd is None else os.path.join(self.cwd, f)
+
+    def up_to_date(self):
+        """
+        True if all outputs exist and none is older than any input.
+        """
+        if not self.outputs:
+            return False
+        try:
+            oldest = min(os.path.getmtime(self._path(f)) for f in self.outputs)
+        except FileNotFoundError:
+            return False
+        newest = max([os.path.getmtime(self._path(f)) for f in self.inputs if os.path.exists(self._path(f))] or [0])
+        return oldest >= newest
+
+    def __repr__(self):
+        return "Task({0}: {1})".format(self.name, shlex.join(self.cmd))
+
+
+class TaskGraph:
+    """
+    DAG scheduler: dependencies are given by files (a task depends on the tasks producing its inputs),
+    independent tasks run concurrently within a global core (and memory) budget, and tasks whose outputs are up to date are skipped.
+    Each task gets its own PFILES user directory (<log_dir>/pfiles/<task>, or a temporary one), so that the parameter files
+    of concurrent HEASoft/eSASS runs do not collide.
+
+    Ready tasks are started by decreasing length (sum of costs) of the longest chain they head, so that
+    the whole graph finishes in about the time of its slowest chain.
+
+    Parameters:
+    - cores (int, optional): Core budget shared by all running tasks. Default is the number of CPUs.
+    - memory (float, optional): Memory budget in GB shared by all running tasks. Default is None (no limit).
+    - log_dir (str, optional): Directory of the per-task log files. Default is None (output not captured).
+    - force (bool, optional): If True, run all tasks even if up to date. Default is False.
+    - dry_run (bool, optional): If True, only print the commands in dependency order. Default is False.
+    - verbose (bool, optional): If True, print the start and end of each task. Default is True.
+    - stage (str, optional): Stage name of the task records of the trace ($PIPELINE_TRACE, see RunTrace.py). Default is ''.
+    - tags (dict, optional): Extra fields of the task records of the trace (e.g., {'cluster': 'A3391'}). Default is None.
+
+    Methods:
+    - add(task): Add a task and return it.
+    - run(): Run the graph and return True if no task failed.
+    """
+    def __init__(self, cores=None, memory=None, log_dir=None, force=False, dry_run=False, verbose=True, stage='', tags=None):
+        self.cores = cores or os.cpu_count()
+        self.memory = memory
+        self.log_dir = log_dir
+        self.force = force
+        self.dry_run = dry_run
+        self.verbose = verbose
+        self.stage = stage
+        self.tags = dict(tags or {})
+        self.tasks = {}
+        self._producer = {}
+
+    def add(self, task):
+        if task.name in self.tasks:
+            raise ValueError("Duplicate task name {0}.".format(task.name))
+        for f in task.outputs:
+            path = os.path.abspath(task._path(f))
+            if path in self._producer:
+                raise ValueError("{0} is an output of both {1} and {2}.".format(f, self._producer[path].name, task.name))
+            self._producer[path] = task
+        self.tasks[task.name] = task
+        return task
+
+    def dependencies(self, task):
+        """
+        Tasks producing the inputs of a task.
+        """
+        deps = (self._producer.get(os.path.abspath(task._path(f))) for f in task.inputs)
+        return [d for d in dict.fromkeys(deps) if d is not None]
+
+    def order(self):
+        """
+        Tasks in a topological order. Raises a ValueError on a dependency cycle.
+        """
+        order, state = [], {}
+
+        def visit(task):
+            if state.get(task.name) == 'done':
+                return
+            if state.get(task.name) == 'visiting':
+                raise ValueError("Dependency cycle through task {0}.".format(task.name))
+            state[task.name] = 'visiting'
+            for dep in self.dependencies(task):
+                visit(dep)
+            state[task.name] = 'done'
+            order.append(task)
+
+        for task in self.tasks.values():
+            visit(task)
+        return order
+
+    def _priorities(self, order):
+        dependents = {t.name: [] for t in order}
+        for t in order:
+            for dep in self.dependencies(t):
+                dependents[dep.name].append(t)
+        chain = {}
+        for t in reversed(order):
+            chain[t.name] = t.cost + max([chain[d.name] for d in dependents[t.name]] or [0])
+        return chain
+
+    def _log(self, msg):
+        if self.verbose:
+            print("[{0}] {1}".format(time.strftime('%H:%M:%S'), msg), flush=True)
+
+    def _execute(self, task):
+        if self.log_dir:
+            user = os.path.join(self.log_dir, 'pfiles', task.name)
+            shutil.rmtree(user, ignore_errors=True)
+            os.makedirs(user)
+        with nullcontext(user) if self.log_dir else tempfile.TemporaryDirectory(prefix='pfiles_') as user:
+            return self._call(task, user)
+
+    def _call(self, task, pfiles_dir):
+        # PFILES = "user dir;system dir": private user dir, shared system dir
+        pfiles = os.environ.get('PFILES', '')
+        syspfiles = pfiles.split(';')[-1] if pfiles else os.path.join(os.environ.get('HEADAS', ''), 'syspfiles')
+        env = dict(os.environ, OMP_NUM_THREADS=str(task.cores), PFILES='{0};{1}'.format(pfiles_dir, syspfiles))
+        env.update(task.env)
+        start = time.time()
+        if self.log_dir:
+            with open(os.path.join(self.log_dir, '{0}.log'.format(task.name)), 'w') as log:
+                log.write('{0}\n'.format(shlex.join(task.cmd)))
+                log.flush()
+                code = RunTrace.call(task.cmd, self.stage, dict(self.tags, task=task.name), cwd=task.cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+        else:
+            code = RunTrace.call(task.cmd, self.stage, dict(self.tags, task=task.name), cwd=task.cwd, env=env)
+        task.elapsed = time.time() - start
+        return code
+
+    def run(self):
+        order = self.order()
+        if self.dry_run:
+            for task in order:
+                status = 'up to date' if not self.force and task.up_to_date() else 'run'
+                print("# {0} ({1}, {2} core(s))\n{3}".format(task.name, status, task.cores, shlex.join(task.cmd)))
+            return True
+        if self.log_dir:
+            os.makedirs(self.log_dir, exist_ok=True)
+
+        chain = self._priorities(order)
+        waiting = list(order)
+        running = {}
+        free = self.cores
+        free_memory = float('inf') if self.memory is None else self.memory
+        with ThreadPoolExecutor(max_workers=len(order) or 1) as pool:
+            while waiting or running:
+                for task in list(waiting):
+                    deps = self.dependencies(task)
+                    if any(d.status in ('failed', 'cancelled') for d in deps):
+                        task.status = 'cancelled'
+                        waiting.remove(task)
+                        self._log("{0} cancelled (a dependency failed)".format(task.name))
+                    elif all(d.status in ('done', 'skipped') for d in deps) and not self.force and task.up_to_date():
+                        task.status = 'skipped'
+                        waiting.remove(task)
+                        self._log("{0} is up to date".format(task.name))
+
+                ready = [t for t in waiting if all(d.status in ('done', 'skipped') for d in self.dependencies(t))]
+                for task in sorted(ready, key=lambda t: -chain[t.name]):
+                    cores = min(task.cores, self.cores)
+                    if (cores <= free and task.memory <= free_memory) or not running:
+                        task.cores = cores
+                        free -= cores
+                        free_memory -= task.memory
+                        waiting.remove(task)
+                        running[pool.submit(self._execute, task)] = task
+                        self._log("{0} started ({1} core(s))".format(task.name, cores))
+
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = running.pop(future)
+                    free += task.cores
+                    free_memory += task.memory
+                    code = future.result()
+                    missing = [f for f in task.outputs if not os.path.exists(task._path(f))]
+                    task.status = 'done' if code == 0 and not missing else 'failed'
+                    self._log("{0} {1} in {2:.1f} s{3}".format(task.name, task.status, task.elapsed,
+                                                               '' if code == 0 else ' (exit code {0})'.format(code)))
+
+        counts = {s: sum(t.status == s for t in order) for s in ('done', 'skipped', 'failed', 'cancelled')}
+        self._log("{done} done, {skipped} up to date, {failed} failed, {cancelled} cancelled".format(**counts))
+        return counts['failed'] == 0 and counts['cancelled'] == 0
@@ -0,0 +1,15 @@
+# Environment of the pipeline scripts, to source once (e.g., in ~/.bashrc) before running the SH_*.sh and PY_*.py
+# scripts of the repository or their copies in a working folder:
+#   $ source <repository>/scripts/pipeline_env.sh
+# PIPELINE_SCRIPTS: scripts/ folder of the repository (default: the folder of this file)
+# PYTHONPATH: the folders of the pipeline modules (scripts/, filtering_and_pib_sub/, NH_absorption/); modules beside
+# a PY_*.py script still come first
+export PIPELINE_SCRIPTS=${PIPELINE_SCRIPTS:-$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)}
+for dir in ${PIPELINE_SCRIPTS}/NH_absorption ${PIPELINE_SCRIPTS}/filtering_and_pib_sub ${PIPELINE_SCRIPTS}
+do
+    case ":${PYTHONPATH}:" in
+        *":${dir}:"*) ;;
+        *) export PYTHONPATH=${dir}${PYTHONPATH:+:${PYTHONPATH}} ;;
+    esac
+done
+unset dir
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# pipeline modules, imported as the PY_ scripts do
+scripts_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+sys.path += [os.path.join(scripts_dir, d) for d in ('', 'filtering_and_pib_sub', 'NH_absorption')]
@@ -0,0 +1,59 @@
+import os
+import sys
+
+from ArtifactStore import ArtifactStore, script_modules
+
+SCRIPT = """import sys
+import os
+from helper import scale
+with open(sys.argv[1]) as f, open(sys.argv[2], 'w') as out:
+    out.write('{0} {1}'.format(scale * int(f.read()), os.environ.get('PIPELINE_COMPRESSION')))
+"""
+
+
+def make_stage(folder, scale=2):
+    with open(os.path.join(folder, 'PY_stage.py'), 'w') as f:
+        f.write(SCRIPT)
+    with open(os.path.join(folder, 'helper.py'), 'w') as f:
+        f.write('import numpy\nscale = {0}\n'.format(scale))
+    with open(os.path.join(folder, 'in.txt'), 'w') as f:
+        f.write('21')
+
+
+def run(store, folder, **kwargs):
+    return store.run([sys.executable, 'PY_stage.py', 'in.txt', 'out.txt'], ['in.txt'], ['out.txt'], cwd=folder, **kwargs)
+
+
+def test_script_modules_follows_pipeline_imports(tmp_path):
+    make_stage(str(tmp_path))
+    assert [os.path.basename(m) for m in script_modules(str(tmp_path / 'PY_stage.py'))] == ['helper.py']
+
+
+def test_store_hit_and_module_change(tmp_path):
+    work = tmp_path / 'work'
+    work.mkdir()
+    make_stage(str(work))
+    store = ArtifactStore(str(tmp_path / 'store'))
+    assert run(store, str(work)) == 'stored'
+    os.remove(str(work / 'out.txt'))
+    assert run(store, str(work)) == 'hit'
+    assert (work / 'out.txt').read_text().startswith('42 ')
+
+    make_stage(str(work), scale=3)  # same script, changed module
+    assert run(store, str(work)) == 'stored'
+    assert (work / 'out.txt').read_text().startswith('63 ')
+    store.close()
+
+
+def test_store_key_has_compression(tmp_path):
+    work = tmp_path / 'work'
+    work.mkdir()
+    make_stage(str(work))
+    store = ArtifactStore(str(tmp_path / 'store'))
+    env = dict(os.environ, PIPELINE_COMPRESSION='none')
+    assert run(store, str(work), env=env) == 'stored'
+    assert run(store, str(work), env=dict(env, PIPELINE_COMPRESSION='auto')) == 'stored'
+    assert (work / 'out.txt').read_text() == '42 auto'
+    assert run(store, str(work), env=env) == 'hit'
+    assert (work / 'out.txt').read_text() == '42 none'
+    store.close()
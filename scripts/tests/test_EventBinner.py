@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from EventBinner import EventBinner, FLAG_MASK, band_label
+from ImageIO import open_image, read_header
+
+SIZE, REBIN, X0, Y0 = 16, 8, 1000.5, 2000.5
+GTIS = {1: [(0., 30.), (50., 80.)], 2: [(10., 100.)], 3: [(0., 100.)]}
+
+
+def write_events(file_path, n=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    half = SIZE * REBIN / 2 + 20  # some events off the image
+    cols = [fits.Column('TIME', 'D', array=rng.uniform(0., 100., n)),
+            fits.Column('X', 'J', array=np.round(X0 + rng.uniform(-half, half, n))),
+            fits.Column('Y', 'J', array=np.round(Y0 + rng.uniform(-half, half, n))),
+            fits.Column('PI', 'E', array=rng.uniform(100., 10000., n)),
+            fits.Column('FLAG', 'J', array=rng.choice([0, 0, 0, 0x10, 0x1000000], n)),
+            fits.Column('PAT_TYP', 'I', array=rng.choice([0, 1, 2, 3, 4, 6], n)),
+            fits.Column('TM_NR', 'I', array=rng.choice([1, 2, 3], n))]
+    events = fits.BinTableHDU.from_columns(cols, name='EVENTS')
+    for axis, crpx in (('X', X0), ('Y', Y0)):
+        events.header['REF{0}CTYP'.format(axis)] = 'RA---SIN' if axis == 'X' else 'DEC--SIN'
+        events.header['REF{0}CRPX'.format(axis)] = crpx
+        events.header['REF{0}CRVL'.format(axis)] = 150.
+        events.header['REF{0}CDLT'.format(axis)] = 1.388889e-05
+    gtis = [fits.BinTableHDU.from_columns([fits.Column('START', 'D', array=[g[0] for g in GTIS[tm]][::-1]),
+                                           fits.Column('STOP', 'D', array=[g[1] for g in GTIS[tm]][::-1])], name='GTI{0}'.format(tm))
+            for tm in GTIS]
+    fits.HDUList([fits.PrimaryHDU(), events] + gtis).writeto(file_path)
+    return fits.getdata(file_path, 'EVENTS')
+
+
+def reference(ev, tms, bands):
+    """
+    Image of the evtool cuts with np.histogram2d.
+    """
+    good = ((ev['FLAG'].astype(np.int64) & FLAG_MASK) == 0) & np.isin(ev['PAT_TYP'], [1, 2, 3, 4]) & np.isin(ev['TM_NR'], tms)
+    good &= np.any([(ev['PI'] >= lo * 1000) & (ev['PI'] < hi * 1000) for lo, hi in bands], axis=0)
+    good &= np.any([(ev['TM_NR'] == tm) & (ev['TIME'] >= start) & (ev['TIME'] < stop) for tm in tms for start, stop in GTIS[tm]], axis=0)
+    edges = (np.arange(SIZE + 1) - SIZE / 2) * REBIN
+    image, _, _ = np.histogram2d(ev['Y'][good] - Y0, ev['X'][good] - X0, bins=[edges, edges])
+    return image.astype(np.int32)
+
+
+def test_band_label():
+    assert band_label(['0.2'], ['2.3']) == '0.2-2.3keV'
+    assert band_label(['0.2', '1.6'], ['1.35', '2.3']) == '0.2-2.3keV_uni'
+
+
+@pytest.mark.parametrize('chunk', [333, 4000000])
+def test_images_match_histogram2d(tmp_path, chunk):
+    path = str(tmp_path / 'events.fits')
+    ev = write_events(path)
+    binner = EventBinner(path, SIZE, rebin=REBIN, chunk=chunk)
+    requests = {binner.add([1, 2, 3], 0.2, 2.3): ([1, 2, 3], [(0.2, 2.3)]),
+                binner.add(1, '0.5', '5.0'): ([1], [(0.5, 5.0)]),
+                binner.add([3, 2], ['0.2', '1.6'], ['1.35', '2.3']): ([2, 3], [(0.2, 1.35), (1.6, 2.3)])}
+    assert ((2, 3), '0.2-2.3keV_uni') in requests
+    images = binner.run()
+    assert set(images) == set(requests)
+    for key, (tms, bands) in requests.items():
+        assert images[key].dtype == np.int32
+        assert np.array_equal(images[key], reference(ev, tms, bands)), key
+        assert images[key].sum() > 0
+
+
+def test_missing_gti(tmp_path):
+    path = str(tmp_path / 'events.fits')
+    write_events(path)
+    binner = EventBinner(path, SIZE, rebin=REBIN)
+    binner.add(5, 0.2, 2.3)
+    with pytest.raises(ValueError):
+        binner.run()
+    with pytest.raises(ValueError):
+        binner.add(1, [0.2, 1.6], [2.3])
+
+
+@pytest.mark.parametrize('compression', ['none', 'auto'])
+def test_write(tmp_path, compression):
+    path = str(tmp_path / 'events.fits')
+    write_events(path)
+    binner = EventBinner(path, SIZE, rebin=REBIN)
+    key = binner.add([1, 2], 0.2, 2.3)
+    binner.run()
+    out = str(tmp_path / 'img.fits')
+    binner.write(key, out, compression=compression)
+    assert np.array_equal(open_image(out)[:], binner.images[key])
+    hdr = read_header(out)
+    assert hdr['TMS'] == '1 2' and hdr['EMIN_EV'] == 200. and hdr['EMAX_EV'] == 2300.
+    assert hdr['CRPIX1'] == SIZE / 2 + 0.5 and hdr['CDELT1'] == pytest.approx(1.388889e-05 * REBIN)
+    with fits.open(out) as hdul:
+        assert [h.name for h in hdul if h.name.startswith('GTI')] == ['GTI1', 'GTI2']
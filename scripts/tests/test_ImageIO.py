@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from ImageIO import create_image, image_sum, open_image, read_header, write_image
+
+
+def header():
+    hdr = fits.Header()
+    hdr['CTYPE1'] = 'RA---TAN'
+    hdr['CRVAL1'] = 83.5
+    hdr['OBJECT'] = 'SYN'
+    return hdr
+
+
+@pytest.mark.parametrize('compression, hdu', [('none', 0), ('auto', 1), ('gzip', 1), ('rice', 1)])
+def test_round_trip_int(tmp_path, compression, hdu):
+    rng = np.random.default_rng(0)
+    data = rng.poisson(3., (300, 200)).astype(np.int32)
+    path = str(tmp_path / 'img.fits')
+    write_image(path, data, header(), compression=compression)
+
+    with fits.open(path) as hdul:
+        assert hdul[hdu].header['NAXIS1'] == 200
+        assert isinstance(hdul[hdu], fits.CompImageHDU) == (hdu == 1)
+    assert np.array_equal(open_image(path)[:], data)
+    assert np.array_equal(open_image(path)[10:20, 150:], data[10:20, 150:])
+    hdr = read_header(path)
+    assert hdr['OBJECT'] == 'SYN' and hdr['CRVAL1'] == 83.5
+    assert image_sum(open_image(path), rows=64) == data.sum()
+
+
+@pytest.mark.parametrize('compression', ['none', 'auto', 'gzip'])
+def test_round_trip_float_lossless(tmp_path, compression):
+    data = np.random.default_rng(1).normal(size=(100, 130)).astype(np.float32)
+    data[5, 7] = np.nan
+    path = str(tmp_path / 'img.fits')
+    write_image(path, data, header(), compression=compression)
+    assert np.array_equal(open_image(path)[:], data, equal_nan=True)
+    assert image_sum(open_image(path)) == pytest.approx(np.nansum(data, dtype=np.float64))
+
+
+def test_dtype_and_extensions(tmp_path):
+    data = np.linspace(0., 1., 64 * 64).reshape(64, 64)
+    gti = fits.BinTableHDU.from_columns([fits.Column('START', 'D', array=[0.]), fits.Column('STOP', 'D', array=[1.])], name='GTI')
+    path = str(tmp_path / 'img.fits')
+    write_image(path, data, compression='auto', dtype=np.float32, extensions=[gti])
+    assert open_image(path).dtype == np.float32
+    with fits.open(path) as hdul:
+        assert hdul[-1].name == 'GTI'
+
+
+@pytest.mark.parametrize('compression', ['none', 'auto'])
+def test_create_image(tmp_path, compression):
+    data = np.arange(40 * 30, dtype=np.float32).reshape(40, 30)
+    path = str(tmp_path / 'img.fits')
+    with create_image(path, header(), data.shape, compression=compression) as out:
+        for y0 in range(0, 40, 16):
+            out[y0:y0 + 16] = data[y0:y0 + 16]
+    assert np.array_equal(open_image(path)[:], data)
+    assert read_header(path)['OBJECT'] == 'SYN'
+    assert list(tmp_path.iterdir()) == [tmp_path / 'img.fits']  # temporary file removed
+
+
+def test_unknown_compression(tmp_path):
+    with pytest.raises(ValueError):
+        write_image(str(tmp_path / 'img.fits'), np.zeros((4, 4)), compression='lzw')
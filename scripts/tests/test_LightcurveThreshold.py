@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from LightcurveThreshold import clip_thresholds, gaussian_chi2, lost_fraction, read_lightcurve
+
+
+def lightcurve(n=4000, mean=5., stddev=0.5, n_flare=100, n_empty=300, seed=0):
+    rng = np.random.default_rng(seed)
+    rate = rng.normal(mean, stddev, n)
+    rate[rng.choice(n, n_flare, replace=False)] = rng.uniform(20., 50., n_flare)
+    rate[:n_empty] = 0.
+    return rate
+
+
+def clip_reference(rate, nsigma=3.):
+    kept = rate[rate != 0]
+    while True:
+        mean, stddev = kept.mean(), kept.std()
+        new = rate[(rate != 0) & (np.abs(rate - mean) <= nsigma * stddev)]
+        if len(new) == len(kept):
+            return mean, stddev, len(kept)
+        kept = new
+
+
+def test_clip_recovers_gaussian_without_flares():
+    rate = lightcurve()
+    res = clip_thresholds([rate])
+    assert res['mean'][0] == pytest.approx(5., abs=0.05)
+    assert res['stddev'][0] == pytest.approx(0.5, rel=0.05)
+    assert res['threshold'][0] == pytest.approx(res['mean'][0] + 3 * res['stddev'][0])
+    assert res['lower'][0] == pytest.approx(res['mean'][0] - 3 * res['stddev'][0])
+    assert res['stddev_all'][0] > 2.  # unclipped estimate includes the flares
+    assert res['n'][0] < 3700 and res['niter'][0] >= 1
+    assert lost_fraction(rate, res['threshold'][0]) == pytest.approx(100 / 3700, abs=0.002)
+
+
+def test_clip_many_lightcurves_match_one_by_one():
+    rates = [lightcurve(n=n, mean=m, seed=s) for n, m, s in ((4000, 5., 0), (1500, 2., 1), (2500, 8., 2))]
+    res = clip_thresholds(rates)
+    for i, rate in enumerate(rates):
+        mean, stddev, n = clip_reference(rate)
+        assert res['mean'][i] == pytest.approx(mean)
+        assert res['stddev'][i] == pytest.approx(stddev)
+        assert res['n'][i] == n
+        one = clip_thresholds([rate])
+        assert one['threshold'][0] == pytest.approx(res['threshold'][i])
+
+
+def test_clip_empty_and_zero_lightcurves():
+    res = clip_thresholds([np.zeros(50), [], [np.nan, np.nan], lightcurve()])
+    assert np.all(np.isnan(res['threshold'][:3]))
+    assert np.array_equal(res['n'][:3], [0, 0, 0])
+    assert np.isfinite(res['threshold'][3])
+    assert len(clip_thresholds([])['threshold']) == 0
+
+
+def test_clip_include_zero():
+    rate = np.array([0., 0., 1., 1.])
+    assert clip_thresholds([rate], exclude_zero=False)['mean'][0] == pytest.approx(0.5)
+    assert clip_thresholds([rate])['mean'][0] == pytest.approx(1.)
+
+
+def test_lost_fraction():
+    rate = np.array([0., 1., 2., 3., 10.])
+    assert lost_fraction(rate, 2.5) == pytest.approx(0.5)
+    assert lost_fraction(rate, 20.) == 0.
+    assert np.isnan(lost_fraction(rate, np.nan))
+    assert np.isnan(lost_fraction(np.zeros(10), 1.))
+
+
+def test_gaussian_chi2():
+    rate = lightcurve(n_flare=0)
+    res = {k: v[0] for k, v in clip_thresholds([rate]).items()}
+    assert gaussian_chi2(rate, res) < 3.
+    assert np.isnan(gaussian_chi2(np.zeros(10), res))
+
+
+def test_read_lightcurve(tmp_path):
+    path = str(tmp_path / 'lc.fits')
+    time, rate = np.arange(10.) * 20., np.linspace(0., 1., 10)
+    fits.BinTableHDU.from_columns([fits.Column('TIME', 'D', array=time), fits.Column('RATE', 'E', array=rate)]).writeto(path)
+    t, r = read_lightcurve(path)
+    assert np.array_equal(t, time) and np.allclose(r, rate) and r.dtype == float
@@ -0,0 +1,136 @@
+import time
+
+import pytest
+
+from NH2Provider import (extract_nh2_weighted_value, NH2Provider, MockNH2Provider, MockNH2Server, SwiftNH2Provider,
+                         AsyncSwiftNH2Provider, NH2Cache, CachedNH2Provider)
+
+
+def test_extract_parses_swift_reply():
+    assert extract_nh2_weighted_value(MockNH2Provider.html(1.23e20)) == pytest.approx(1.23e20)
+    assert extract_nh2_weighted_value('<td headers="h2w">3.40 ×1021</td>') == pytest.approx(3.4e21)
+
+
+def test_extract_missing_or_bad_value():
+    assert extract_nh2_weighted_value('<html><body>no table</body></html>') is None
+    assert extract_nh2_weighted_value('<td headers="h2w">n/a</td>') is None
+
+
+def test_mock_provider_goes_through_parser():
+    mock = MockNH2Provider(lambda ra, dec: None if ra > 100 else 2e20 + ra * 1e18)
+    assert mock.query_many([10., 200.], [0., 0.]) == [pytest.approx(2.1e20), None]
+    assert mock.ncalls == 2
+
+
+def test_cache_miss_then_hit(tmp_path):
+    mock = MockNH2Provider()
+    provider = CachedNH2Provider(mock, NH2Cache(str(tmp_path / 'nh2.sqlite')))
+    ra, dec = [10.001, 10.002, 20.], [-5., -5., 30.]  # the first two positions share a cache key
+
+    first = provider.query_many(ra, dec)
+    assert (provider.hits, provider.misses, mock.ncalls) == (0, 2, 2)
+    assert first[0] == first[1]
+
+    assert provider.query_many(ra, dec) == first
+    assert (provider.hits, provider.misses, mock.ncalls) == (2, 2, 2)
+    provider.close()
+
+    # persisted on disk for a new run
+    mock = MockNH2Provider()
+    provider = CachedNH2Provider(mock, NH2Cache(str(tmp_path / 'nh2.sqlite')))
+    assert provider.query_many(ra, dec) == first
+    assert mock.ncalls == 0
+    provider.close()
+
+
+def test_cache_does_not_store_failures(tmp_path):
+    values = {True: None}
+    mock = MockNH2Provider(lambda ra, dec: values.get(True, 1e20))
+    provider = CachedNH2Provider(mock, NH2Cache(str(tmp_path / 'nh2.sqlite')))
+    assert provider.query_many([1.], [2.]) == [None]
+    del values[True]
+    assert provider.query_many([1.], [2.]) == [pytest.approx(1e20)]
+    assert mock.ncalls == 2
+    provider.close()
+
+
+def test_cache_sources_kept_apart(tmp_path):
+    file_path = str(tmp_path / 'nh2.sqlite')
+    CachedNH2Provider(MockNH2Provider(lambda ra, dec: 1e20), NH2Cache(file_path, source='swift')).query_many([1.], [2.])
+    other = MockNH2Provider(lambda ra, dec: 5e20)
+    provider = CachedNH2Provider(other, NH2Cache(file_path, source='willingale'))
+    assert provider.query_many([1.], [2.]) == [pytest.approx(5e20)]
+    assert other.ncalls == 1
+    provider.close()
+
+
+def test_swift_provider_against_mock_server():
+    func = lambda ra, dec: 1e20 + ra * 1e18
+    with MockNH2Server(func) as server:
+        provider = SwiftNH2Provider(url=server.url, timeout=10, nproc=2)
+        assert provider.query(3., 4.) == pytest.approx(func(3., 4.))
+        values = provider.query_many([1., 2., 3.], [0., 0., 0.])
+        pool = provider._pool
+        values += provider.query_many([4., 5.], [0., 0.])
+        assert provider._pool is pool  # one process pool for all the calls
+        provider.close()
+        assert provider._pool is None
+    assert values == [pytest.approx(func(r, 0.)) for r in (1., 2., 3., 4., 5.)]
+    assert server.nrequests == 6
+
+
+def test_base_provider_query_many():
+    class Constant(NH2Provider):
+        def query(self, ra, dec):
+            return ra + dec
+
+    assert Constant().query_many([1., 2.], [3., 4.]) == [4., 6.]
+
+
+def test_async_provider_retries_transient_errors():
+    func = lambda ra, dec: 1e20 + ra * 1e18
+    with MockNH2Server(func, fail_rate=0.5) as server:
+        provider = AsyncSwiftNH2Provider(url=server.url, concurrency=4, retries=16, backoff=0.01, timeout=10)
+        ra = [float(r) for r in range(20)]
+        values = provider.query_many(ra, [0.] * len(ra))
+    assert values == [pytest.approx(func(r, 0.)) for r in ra]
+    assert provider.missing == []
+    assert server.nrequests > len(ra)  # some 503 replies were retried
+
+
+def test_async_provider_gives_up_after_retries():
+    with MockNH2Server(fail_rate=1.) as server:
+        provider = AsyncSwiftNH2Provider(url=server.url, retries=2, backoff=0.01, timeout=10)
+        assert provider.query_many([1., 2.], [0., 0.]) == [None, None]
+    assert provider.missing == [(1., 0.), (2., 0.)]
+    assert server.nrequests == 6
+
+
+def test_async_provider_rate_limit():
+    with MockNH2Server() as server:
+        provider = AsyncSwiftNH2Provider(url=server.url, concurrency=8, rate=20., timeout=10)
+        start = time.time()
+        provider.query_many([float(r) for r in range(11)], [0.] * 11)
+        elapsed = time.time() - start
+    assert elapsed >= 0.45  # 11 requests at 20 per second: the last one starts 0.5 s after the first
+
+
+def test_async_provider_resumes_from_checkpoint(tmp_path):
+    checkpoint = str(tmp_path / 'checkpoint.jsonl')
+    func = lambda ra, dec: None if ra >= 3 else 1e20 + ra * 1e18
+    with MockNH2Server(func) as server:
+        first = AsyncSwiftNH2Provider(url=server.url, retries=0, timeout=10, checkpoint=checkpoint)
+        assert first.query_many([0., 1., 2., 3., 4.], [0.] * 5)[3:] == [None, None]
+        assert server.nrequests == 5
+    with open(checkpoint) as f:
+        assert len(f.readlines()) == 3  # only the fetched positions
+    with open(checkpoint, 'a') as f:
+        f.write('{"ra": 9.0, "dec"')  # line cut by an interruption
+
+    with MockNH2Server(lambda ra, dec: 1e20 + ra * 1e18) as server:
+        resumed = AsyncSwiftNH2Provider(url=server.url, retries=0, timeout=10, checkpoint=checkpoint)
+        values = resumed.query_many([0., 1., 2., 3., 4.], [0.] * 5)
+        assert server.nrequests == 2  # only the positions missing from the checkpoint
+        assert resumed.query_many([4.], [0.]) == [pytest.approx(1.04e20)]
+        assert server.nrequests == 2
+    assert values == [pytest.approx(1e20 + r * 1e18) for r in range(5)]
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from ImageIO import open_image, write_image
+from NHCorrExposure import NHCorrExposure
+
+SHAPE = (50, 40)
+
+
+def make_inputs(nhx, compression='none', seed=0):
+    """
+    Synthetic TM0/8/9 counts, exposure and NH correction maps; returns them by (tm, product).
+    """
+    rng = np.random.default_rng(seed)
+    maps = {}
+    for tm in (8, 9):
+        for product in ('CLexpmap', 'CLexpmap-single'):
+            exp = rng.uniform(500., 2000., SHAPE).astype(np.float32)
+            exp[:3] = 0.  # no exposure
+            maps[tm, product] = exp
+        maps[tm, 'CLevlistBGSUB'] = rng.normal(5., 2., SHAPE).astype(np.float32)
+        corr = rng.uniform(0.8, 1.3, SHAPE).astype(np.float32)
+        corr[10, :5] = 0.
+        maps[tm, 'NHcorr'] = corr
+        write_image(nhx.nhcorr[tm], corr, compression=compression)
+    maps[0, 'CLevlistBGSUB'] = maps[8, 'CLevlistBGSUB'] + maps[9, 'CLevlistBGSUB']
+    for (tm, product), data in maps.items():
+        if product != 'NHcorr':
+            write_image(nhx.name(tm, product), data, compression=compression)
+    return maps
+
+
+def reference(maps, product):
+    def nhcorr(tm):
+        corr = maps[tm, 'NHcorr'].astype(float)
+        return np.where(corr != 0, maps[tm, product] / np.where(corr != 0, corr, 1), 0)
+    exp8, exp9 = nhcorr(8), nhcorr(9)
+    factor = (maps[9, 'CLevlistBGSUB'].sum(dtype=float) / maps[8, 'CLevlistBGSUB'].sum(dtype=float)) * (exp8.sum() / exp9.sum())
+    exp0 = exp8 + exp9 * factor
+    return factor, np.where(exp0 != 0, maps[0, 'CLevlistBGSUB'] / np.where(exp0 != 0, exp0, 1), 0)
+
+
+@pytest.mark.parametrize('lowe, lowe9, hie, compression', [(['0.2'], ['0.8'], ['2.3'], 'none'),
+                                                           (['0.2', '1.6'], ['0.8', '1.6'], ['1.35', '2.3'], 'auto')])
+def test_count_rate_maps(tmp_path, monkeypatch, lowe, lowe9, hie, compression):
+    monkeypatch.chdir(tmp_path)
+    nhx = NHCorrExposure('c020', 'em01', 'SYN', lowe, lowe9, hie, 'corr8.fits', 'corr9.fits', rows=16, compression=compression)
+    assert nhx.band(0) == '0.20.8-2.3' and nhx.band(9) == '0.8-2.3'
+    maps = make_inputs(nhx, compression)
+    result = nhx.run(exposures=True, verbose=False)
+
+    for exp, cr, key in (('CLexpmap', 'CLCRBGSUB', 'corr'), ('CLexpmap-single', 'CLCRBGSUB-single', 'corrs')):
+        factor, rate = reference(maps, exp)
+        assert result[key] == pytest.approx(factor, rel=1e-9)
+        out = open_image(nhx.name('0BG0', cr, band=nhx.band(8), tail='_NHcorr_corr'))[:]
+        assert np.allclose(out, rate, rtol=1e-6, atol=0)
+        assert np.all(out[:3] == 0) and np.all(out[10, :5] == 0)
+        exp0 = open_image(nhx.name('0BG0', exp, band=nhx.band(8), tail='_NHcorr_corr'))[:]
+        assert np.allclose(exp0 * out, np.where(out != 0, maps[0, 'CLevlistBGSUB'], 0), rtol=1e-5, atol=1e-5)
+    assert result['totals']['BGSUB8'] == pytest.approx(maps[8, 'CLevlistBGSUB'].sum(dtype=float))
+
+
+def test_shape_mismatch(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    nhx = NHCorrExposure('c020', 'em01', 'SYN', ['0.2'], ['0.8'], ['2.3'], 'corr8.fits', 'corr9.fits')
+    make_inputs(nhx)
+    write_image('corr9.fits', np.ones((SHAPE[0], SHAPE[1] + 1), dtype=np.float32))
+    with pytest.raises(ValueError):
+        nhx.run(verbose=False)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from NHCorrection import corr_map, corr_table, lookup
+
+
+def test_corr_table_sorted_unique_and_reference():
+    nh = np.array([0.3, 0.1, 0.2, 0.1, np.nan, 0.4])
+    rate = np.array([7., 9., 8., 1., 5., 6.])
+    nh_table, corr, rate_ref = corr_table(nh, rate, nh_ref=0.2)
+    assert np.array_equal(nh_table, [0.1, 0.2, 0.3, 0.4])  # first rate of duplicates, NaN dropped
+    assert rate_ref == 8.
+    assert np.allclose(corr, 8. / np.array([9., 8., 7., 6.]))
+
+
+def test_corr_table_median_reference():
+    nh = np.array([0.1, 0.2, 0.3, 0.4, 0.5])
+    rate = 10. - 10. * nh
+    _, corr, rate_ref = corr_table(nh, rate)
+    assert rate_ref == pytest.approx(7.)
+    assert corr[2] == pytest.approx(1.)
+
+
+def test_corr_table_errors():
+    with pytest.raises(ValueError):
+        corr_table([0.1, 0.2], [1.])
+    with pytest.raises(ValueError):
+        corr_table([np.nan], [1.])
+
+
+def test_lookup_matches_interp():
+    nh_table = np.array([0.01, 0.05, 0.1, 0.5])
+    corr = np.array([0.8, 1., 1.3, 2.])
+    values = np.array([[0., 0.01, 0.03], [0.1, 0.3, 1.], [np.nan, 0.05, 0.0999]])
+    out = lookup(values, nh_table, corr)
+    expected = np.interp(values, nh_table, corr)  # clamps to the end nodes
+    assert out.shape == values.shape
+    assert np.allclose(out, expected, equal_nan=True)
+    assert np.isnan(out[2, 0])
+
+
+def test_lookup_single_node():
+    out = lookup([0.1, np.nan, 5.], np.array([0.2]), np.array([1.5]))
+    assert np.array_equal(out, [1.5, np.nan, 1.5], equal_nan=True)
+
+
+def test_corr_map_blocks_non_square():
+    rng = np.random.default_rng(0)
+    nh_map = np.round(rng.uniform(0., 0.6, (37, 23)), 4)
+    nh_map[3, 4] = np.nan
+    nh_table, corr, _ = corr_table(np.linspace(0.01, 0.5, 50), np.linspace(10., 4., 50))
+    out = corr_map(nh_map, nh_table, corr, rows=8)
+    assert out.shape == nh_map.shape and out.dtype == np.float64
+    assert np.allclose(out, lookup(nh_map, nh_table, corr), equal_nan=True)
+    assert np.isnan(out[3, 4]) and np.isnan(nh_map[3, 4])  # input untouched